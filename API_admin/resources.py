@@ -7,7 +7,9 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from API_admin import serializers as serial
+from seance.API.sparse import SparseFieldsViewMixin
 from seance.models import SeatCategory, Price, Film, Hall, SeanceBase, Seance
+from seance.schedule import import_schedule, generate_schedule
 
 
 class ViewSetInsertMixin:
@@ -20,7 +22,7 @@ class ViewSetInsertMixin:
         serializer.save(admin=self.request.user)
 
 
-class SeatCategoryViewSet(ViewSetInsertMixin, viewsets.ModelViewSet):
+class SeatCategoryViewSet(SparseFieldsViewMixin, ViewSetInsertMixin, viewsets.ModelViewSet):
     queryset = SeatCategory.objects.all()
 
     def get_serializer_class(self):
@@ -30,7 +32,7 @@ class SeatCategoryViewSet(ViewSetInsertMixin, viewsets.ModelViewSet):
             return serial.SeatCategoryCUDSerializer
 
 
-class PriceViewSet(viewsets.ModelViewSet):
+class PriceViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     serializer_class = serial.PriceHyperSerializer
     queryset = Price.objects.all()
     permission_classes = (IsAdminUser,)
@@ -49,7 +51,7 @@ class PriceViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class FilmViewSetMixin(ViewSetInsertMixin, viewsets.ModelViewSet):
+class FilmViewSetMixin(SparseFieldsViewMixin, ViewSetInsertMixin, viewsets.ModelViewSet):
     queryset = Film.objects.all()
 
     def get_serializer_class(self):
@@ -59,7 +61,7 @@ class FilmViewSetMixin(ViewSetInsertMixin, viewsets.ModelViewSet):
             return serial.FilmCUDSerializer
 
 
-class HallViewSetMixin(ViewSetInsertMixin, viewsets.ModelViewSet):
+class HallViewSetMixin(SparseFieldsViewMixin, ViewSetInsertMixin, viewsets.ModelViewSet):
     serializer_class = serial.HallHyperSerializer
     queryset = Hall.objects.all()
 
@@ -93,18 +95,80 @@ class CreateSeatsAPIView(CreateAPIView):
                                     number_starts=serializer['seat_starts'].value,
                                     number_ends=serializer['seat_ends'].value)
         result = hall.activate_hall()
+        created_seats = serial.SeatModelSerializer(hall.seats.all(), many=True).data
         if result['success']:
             return Response({
-                'created_seats': serial.SeatModelSerializer(hall.seats.all(), many=True).data,
+                'created_seats': created_seats,
                 'detail': f'Hall is successfully activated'
             }, status=status.HTTP_200_OK)
         return Response({
-                'created_seats': serial.SeatModelSerializer(hall.seats.all(), many=True).data,
+                'created_seats': created_seats,
                 'detail': f'There leaved {result["uncreated_seats"]} uncreated seats'
             }, status=status.HTTP_201_CREATED)
 
 
-class SeanceBaseViewSet(viewsets.ModelViewSet):
+class HallLayoutAPIView(APIView):
+    """Applies seats spec for the whole hall at once and activates hall, if all seats are created"""
+    permission_classes = (IsAdminUser, )
+
+    def post(self, request, *args, **kwargs):
+        hall = get_object_or_404(Hall, pk=kwargs.get('pk'))
+        serializer = serial.HallLayoutSerializer(data=request.data, context={'hall': hall})
+        serializer.is_valid(raise_exception=True)
+        layout = hall.apply_seats_layout([(seat_range['row'], seat_range['seat_starts'], seat_range['seat_ends'],
+                                           seat_range['seat_category'])
+                                          for seat_range in serializer.validated_data['seats']],
+                                         replace=serializer.validated_data['replace'])
+        result = hall.activate_hall()
+        return Response({
+            'layout': {'version': layout['version'], 'rows': layout['rows'], 'palette': layout['palette']},
+            'uncreated_seats': result['uncreated_seats'],
+            'success': result['success']
+        }, status=status.HTTP_200_OK if result['success'] else status.HTTP_201_CREATED)
+
+
+class ScheduleImportAPIView(APIView):
+    """
+    Creates seances of the seance base from list of start times (or csv) with one bulk insert, if none of them
+    intersect with each other and with seances of the hall. Otherwise reports intersections for every row
+    """
+    permission_classes = (IsAdminUser, )
+
+    def post(self, request, *args, **kwargs):
+        seance_base = get_object_or_404(SeanceBase, pk=kwargs.get('pk'))
+        serializer = serial.ScheduleImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = import_schedule(seance_base, serializer.validated_data['seances'], request.user)
+        if result['success']:
+            return Response({'created': [seance.pk for seance in result['seances']], 'rows': result['rows']},
+                            status=status.HTTP_201_CREATED)
+        return Response({'detail': 'There are intersections in times with other seances',
+                         'rows': result['rows']}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ScheduleGenerateAPIView(APIView):
+    """
+    Preview of packed schedule for seance bases, nothing is saved. Seances of every seance base can be
+    posted as they are to ScheduleImportAPIView
+    """
+    permission_classes = (IsAdminUser, )
+
+    def post(self, request, *args, **kwargs):
+        serializer = serial.ScheduleGenerateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = dict(serializer.validated_data)
+        schedule = generate_schedule(params.pop('seance_bases'), **params)
+        return Response({'seance_bases': [
+            {'seance_base': seance_base.pk, 'film': seance_base.film.title, 'hall': seance_base.hall_id,
+             'seances': [{'time_starts': seance.time_starts, 'time_ends': seance.time_ends,
+                          'time_hall_free': seance.time_hall_free,
+                          'advertisements_duration': seance.advertisements_duration,
+                          'cleaning_duration': seance.cleaning_duration} for seance in seances]}
+            for seance_base, seances in schedule.items()
+        ]}, status=status.HTTP_200_OK)
+
+
+class SeanceBaseViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = SeanceBase.objects.all()
     permission_classes = (IsAdminUser, )
 
@@ -123,7 +187,7 @@ class SeanceBaseViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class SeanceViewSetMixin(ViewSetInsertMixin, viewsets.ModelViewSet):
+class SeanceViewSetMixin(SparseFieldsViewMixin, ViewSetInsertMixin, viewsets.ModelViewSet):
     queryset = Seance.objects.all()
 
     def get_serializer_class(self):
@@ -157,7 +221,7 @@ class SeanceActivateView(UpdateAPIView):
                          }, status=status.HTTP_200_OK)
 
 
-class SeanceByParamsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+class SeanceByParamsViewSet(SparseFieldsViewMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
     serializer_class = serial.SeanceHyperSerializer
     permission_classes = (IsAdminUser, )
 
@@ -173,4 +237,4 @@ class SeanceByParamsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
             queryset = queryset.filter(time_starts__gt=starts)
         if ends:
             queryset = queryset.filter(time_starts__lt=ends)
-        return queryset
+        return self.select_serialized_relations(queryset)
@@ -6,11 +6,13 @@ from rest_framework import serializers as serial
 from rest_framework.generics import get_object_or_404
 
 from seance.API.serializers import AdvUserModelSerializer
+from seance.API.sparse import SparseFieldsMixin
 from seance.models import SeatCategory, AdvUser, Price, Film, Hall, Seat, SeanceBase, Seance
+from seance.schedule import parse_schedule_csv
 from seance.utilities import HexColorField
 
 
-class SeatCategoryHyperSerializer(serial.HyperlinkedModelSerializer):
+class SeatCategoryHyperSerializer(SparseFieldsMixin, serial.HyperlinkedModelSerializer):
     admin = AdvUserModelSerializer()
     url = serial.HyperlinkedIdentityField(view_name='api_admin:seat_category-detail')
 
@@ -29,7 +31,7 @@ class SeatCategoryCUDSerializer(serial.ModelSerializer):
         # read_only_fields = ('admin', )
 
 
-class FilmHyperSerializer(serial.HyperlinkedModelSerializer):
+class FilmHyperSerializer(SparseFieldsMixin, serial.HyperlinkedModelSerializer):
     url = serial.HyperlinkedIdentityField(view_name='api_admin:film-detail')
     admin = AdvUserModelSerializer()
 
@@ -45,7 +47,7 @@ class FilmCUDSerializer(serial.ModelSerializer):
         exclude = ('created_at', 'updated_at', 'admin')
 
 
-class HallHyperSerializer(serial.HyperlinkedModelSerializer):
+class HallHyperSerializer(SparseFieldsMixin, serial.HyperlinkedModelSerializer):
     url = serial.HyperlinkedIdentityField(view_name='api_admin:hall-detail')
     admin = AdvUserModelSerializer()
 
@@ -117,7 +119,54 @@ class CreateSeatsSerializer(serial.Serializer):
         return attrs
 
 
-class SeanceBaseHyperSerializer(serial.HyperlinkedModelSerializer):
+class SeatRangeSerializer(serial.Serializer):
+    row = serial.IntegerField(min_value=1, required=True)
+    seat_starts = serial.IntegerField(min_value=1, required=True)
+    seat_ends = serial.IntegerField(min_value=1, required=True)
+    seat_category = serial.IntegerField(min_value=0, required=True)
+
+    def validate(self, attrs):
+        attrs = super(SeatRangeSerializer, self).validate(attrs)
+        if attrs.get('seat_ends') < attrs.get('seat_starts'):
+            raise serial.ValidationError('seat_ends can\'t be less, then seat_starts')
+        return attrs
+
+
+class HallLayoutSerializer(serial.Serializer):
+    """Spec of seats for the whole hall (hall is given in context), applied with Hall.apply_seats_layout"""
+    seats = SeatRangeSerializer(many=True, allow_empty=False)
+    replace = serial.BooleanField(default=False)
+
+    def validate(self, attrs):
+        attrs = super(HallLayoutSerializer, self).validate(attrs)
+        hall = self.context.get('hall')
+        seats = attrs.get('seats')
+        if hall.is_active:
+            raise serial.ValidationError('You can\'t change seats in hall with is_active=True. Deactivate it first')
+
+        rows = {}
+        for seat_range in seats:
+            if seat_range['row'] > hall.quantity_rows:
+                raise serial.ValidationError(f'Row with {seat_range["row"]} number doesn\'t exist in current hall')
+            rows.setdefault(seat_range['row'], []).append((seat_range['seat_starts'], seat_range['seat_ends']))
+        for row, ranges in rows.items():
+            ranges.sort()
+            for previous, current in zip(ranges, ranges[1:]):
+                if current[0] <= previous[1]:
+                    raise serial.ValidationError(f'Seat ranges {previous} and {current} in row {row} intersect')
+
+        if attrs.get('replace'):
+            quantity = sum(seat_range['seat_ends'] - seat_range['seat_starts'] + 1 for seat_range in seats)
+            if quantity > hall.quantity_seats:
+                raise serial.ValidationError(f'Spec has {quantity} seats, but hall has only {hall.quantity_seats}')
+
+        categories = {seat_range['seat_category'] for seat_range in seats}
+        if SeatCategory.objects.filter(id__in=categories).count() != len(categories):
+            raise serial.ValidationError(f'There is no seat category with some of given id\'s: {categories}')
+        return attrs
+
+
+class SeanceBaseHyperSerializer(SparseFieldsMixin, serial.HyperlinkedModelSerializer):
     url = serial.HyperlinkedIdentityField(view_name='api_admin:seance_base-detail')
     film = FilmHyperSerializer()
     hall = HallHyperSerializer()
@@ -200,7 +249,7 @@ class SeanceBaseCUDSerializer(serial.ModelSerializer):
         return attrs_valid
 
 
-class SeanceHyperSerializer(serial.HyperlinkedModelSerializer):
+class SeanceHyperSerializer(SparseFieldsMixin, serial.HyperlinkedModelSerializer):
     url = serial.HyperlinkedIdentityField(view_name='api_admin:seance-detail')
     seance_base = SeanceBaseHyperSerializer()
     admin = AdvUserModelSerializer()
@@ -243,7 +292,43 @@ class SeanceCUDSerializer(serial.ModelSerializer):
         return attrs_valid
 
 
-class PriceHyperSerializer(serial.HyperlinkedModelSerializer):
+class ScheduleRowSerializer(serial.Serializer):
+    time_starts = serial.TimeField()
+    advertisements_duration = serial.TimeField(required=False)
+    cleaning_duration = serial.TimeField(required=False)
+    description = serial.CharField(required=False, allow_blank=True)
+
+
+class ScheduleImportSerializer(serial.Serializer):
+    """Schedule of seance base: list of seances or the same in csv (see seance.schedule.parse_schedule_csv)"""
+    seances = ScheduleRowSerializer(many=True, required=False)
+    csv = serial.CharField(required=False)
+
+    def validate(self, attrs):
+        attrs = super(ScheduleImportSerializer, self).validate(attrs)
+        if 'csv' in attrs:
+            if 'seances' in attrs:
+                raise serial.ValidationError('Give either seances or csv, not both')
+            rows = ScheduleRowSerializer(data=parse_schedule_csv(attrs.pop('csv')), many=True)
+            if not rows.is_valid():
+                raise serial.ValidationError({'csv': rows.errors})
+            attrs['seances'] = rows.validated_data
+        if not attrs.get('seances'):
+            raise serial.ValidationError('Schedule is empty')
+        return attrs
+
+
+class ScheduleGenerateSerializer(serial.Serializer):
+    """Params of seance.schedule.generate_schedule"""
+    seance_bases = serial.PrimaryKeyRelatedField(queryset=SeanceBase.objects.all(), many=True, allow_empty=False)
+    opens = serial.TimeField(default=datetime.time(9))
+    closes = serial.TimeField(default=datetime.time(0))
+    advertisements_duration = serial.TimeField(default=datetime.time(0, 10))
+    cleaning_duration = serial.TimeField(default=datetime.time(0, 10))
+    step = serial.IntegerField(min_value=1, max_value=60, default=5)
+
+
+class PriceHyperSerializer(SparseFieldsMixin, serial.HyperlinkedModelSerializer):
     url = serial.HyperlinkedIdentityField(view_name='api_admin:price-detail')
     seat_category = SeatCategoryHyperSerializer()
     seance = SeanceHyperSerializer()
@@ -19,9 +19,12 @@ router.register('seance', resources.SeanceViewSetMixin, basename='seance')
 
 
 urlpatterns = [
+    path('seance/generate/', resources.ScheduleGenerateAPIView.as_view(), name='generate_schedule'),
     path('seance/params/', resources.SeanceByParamsViewSet.as_view({'get': 'list'})),
     path('seance/activate/<int:pk>/', resources.SeanceActivateView.as_view(), name='activate_seance'),
     path('hall/<int:pk>/create-seats/', resources.CreateSeatsAPIView.as_view(), name='create_seats'),
+    path('hall/<int:pk>/layout/', resources.HallLayoutAPIView.as_view(), name='hall_layout'),
+    path('seance_base/<int:pk>/schedule/', resources.ScheduleImportAPIView.as_view(), name='seance_base_schedule'),
     path('swagger-docs/', schema_view),
     path('', include(router.urls)),
 ]
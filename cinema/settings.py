@@ -170,6 +170,8 @@ THUMBNAIL_BASEDIR = 'thumbnails'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
+        'seance.API.authentication.CachedTokenAuthentication',
+        'seance.API.authentication.SignedTokenAuthentication',
         'rest_framework.authentication.BasicAuthentication'
     ],
     'DEFAULT_PARSER_CLASSES': (
@@ -178,6 +180,19 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema'
 }
+# Users of api tokens are kept in memory of process for API_TOKEN_CACHE_TTL seconds (see seance.API.authentication).
+# Signed tokens (api rest-auth/signed-token/) expire in API_SIGNED_TOKEN_MAX_AGE seconds
+API_TOKEN_CACHE_TTL = 300
+API_SIGNED_TOKEN_MAX_AGE = 24 * 60 * 60
+# Page sizes of paginated api endpoints by basename of the viewset (see seance.API.pagination)
+API_PAGE_SIZES = {
+    'default': 20,
+    'film': 20,
+    'seance_base': 20,
+    'hall': 20,
+    'price': 50,
+    'purchase': 10,
+}
 SITE_ID = 1
 
 EMAIL_HOST = 'smtp.gmail.com'
@@ -192,6 +207,20 @@ CELERY_BROKER_URL = 'redis://h:peb2f56c7cdb08fec930d75ecb6397247ae01d0eda50fd81a
 
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
+CELERY_BEAT_SCHEDULE = {
+    'sweep-seat-holds': {
+        'task': 'seance.task.sweep_seat_holds',
+        'schedule': 60.0,
+    },
+    'deliver-ticket-emails': {
+        'task': 'seance.task.deliver_ticket_emails',
+        'schedule': 10.0,
+    },
+    'flush-last-activity': {
+        'task': 'seance.task.flush_last_activity',
+        'schedule': 60.0,
+    },
+}
 
 
 # Google Consumer Key
@@ -214,3 +243,61 @@ AUTHENTICATION_BACKENDS = (
 SOCIAL_AUTH_URL_NAMESPACE = 'social'
 
 INACTIVITY_NOT_SUPERUSER_LOGOUT_FOR = datetime.timedelta(minutes=5)
+# Last activity in session is rewritten not more often than once in LAST_ACTIVITY_REFRESH seconds.
+# With LAST_ACTIVITY_PERSIST it's also collected in LAST_ACTIVITY_CACHE and saved to AdvUser.last_activity
+# by batches with celery task seance.task.flush_last_activity. The cache is written by web processes and read by celery
+# worker, so it has to be shared by them (redis or memcached), system check refuses local memory cache
+LAST_ACTIVITY_REFRESH = 30
+LAST_ACTIVITY_PERSIST = False
+LAST_ACTIVITY_CACHE = 'default'
+
+# How long (in seconds) layout of hall's seats is kept in cache. Changes of seats invalidate it at once
+# in processes, which share the cache, other processes see them after the timeout
+HALL_LAYOUT_CACHE_TIMEOUT = 5 * 60
+
+# How long (in seconds) seat occupancy of a seance is kept in cache before it is rebuilt from tickets
+SEAT_MAP_CACHE_TIMEOUT = 60
+
+# Seats put into basket are held for a user for that time.
+# Backends: 'seance.holds.DatabaseHoldBackend' and 'seance.holds.CacheHoldBackend' (uses SEAT_HOLD_CACHE alias)
+SEAT_HOLD_TIMEOUT = datetime.timedelta(minutes=10)
+SEAT_HOLD_BACKEND = 'seance.holds.DatabaseHoldBackend'
+SEAT_HOLD_CACHE = 'default'
+
+# Board of seances (seance:index and api seance list) is cached in BOARD_CACHE for BOARD_CACHE_TIMEOUT seconds.
+# Any cache backend can be used here, e.g. redis or memcached, shared between processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'board': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'board',
+    },
+}
+BOARD_CACHE = 'board'
+BOARD_CACHE_TIMEOUT = 60
+
+# Session keeps only authentication and last activity: date of board and last seance are signed cookies,
+# which live SIGNED_COOKIE_MAX_AGE seconds, baskets are kept by BASKET_STORE.
+# Stores: 'seance.sessions.DatabaseBasketStore' and 'seance.sessions.CacheBasketStore', which reads baskets
+# from BASKET_CACHE for BASKET_CACHE_TIMEOUT seconds and falls back to the table, when basket isn't there.
+# Caches of sessions ('django.contrib.sessions.backends.cached_db' engine) and baskets have to be shared by
+# all processes (redis or memcached): with local memory cache, logout or basket change in one process
+# isn't seen by others
+SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+SIGNED_COOKIE_MAX_AGE = 24 * 60 * 60
+BASKET_STORE = 'seance.sessions.DatabaseBasketStore'
+BASKET_CACHE = 'default'
+BASKET_CACHE_TIMEOUT = 60 * 60
+
+# Letters with tickets are queued by purchases and sent by celery beat task seance.task.deliver_ticket_emails
+# by batches of TICKET_EMAIL_BATCH_SIZE over one connection to mail server.
+# Letter is tried to be sent TICKET_EMAIL_MAX_ATTEMPTS times, then it's marked failed.
+# Letter, left sending longer than TICKET_EMAIL_CLAIM_TIMEOUT seconds (e.g. worker crashed), is sent again
+TICKET_EMAIL_BATCH_SIZE = 100
+TICKET_EMAIL_MAX_ATTEMPTS = 3
+TICKET_EMAIL_CLAIM_TIMEOUT = 15 * 60
+
+# Max quantity of days, which client can get with one request to api seance schedule
+SCHEDULE_MAX_DAYS = 14
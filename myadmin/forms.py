@@ -10,6 +10,7 @@ from django.utils.translation import gettext_lazy as _
 
 
 from seance.models import Film, SeatCategory, Price, SeanceBase, Hall, Seance, Ticket
+from seance.schedule import parse_schedule_csv
 
 
 class FilmModelForm(forms.ModelForm):
@@ -219,6 +220,34 @@ class SeanceUpdateForm(SeanceModelForm):
                                       f'it: {tickets}')
 
 
+class ScheduleImportForm(forms.Form):
+    """Schedule of seance base in csv, see seance.schedule.parse_schedule_csv"""
+    seance_base = forms.ModelChoiceField(queryset=SeanceBase.objects.all(), label=_('base seance'),
+                                         widget=forms.Select(attrs={'class': 'form-control', 'style': 'color: black'}))
+    schedule = forms.CharField(label=_('Schedule'),
+                               help_text=_('One seance per line: time starts, advertisements duration, '
+                                           'cleaning duration, description. Only time starts is required'),
+                               widget=forms.Textarea(attrs={'class': 'form-control', 'style': 'color: black'}))
+
+    def clean_schedule(self):
+        """Parses csv into list of rows with times"""
+        rows = parse_schedule_csv(self.cleaned_data.get('schedule'))
+        if not rows:
+            raise ValidationError(_('Schedule is empty'))
+        time_field = forms.TimeField()
+        errors = []
+        for number, row in enumerate(rows, 1):
+            for column in ('time_starts', 'advertisements_duration', 'cleaning_duration'):
+                if column in row:
+                    try:
+                        row[column] = time_field.clean(row[column])
+                    except ValidationError:
+                        errors.append(ValidationError(f'Row {number}: {row[column]} is not valid time'))
+        if errors:
+            raise ValidationError(errors)
+        return rows
+
+
 class HallModelForm(forms.ModelForm):
     class Meta:
         model = Hall
@@ -15,6 +15,7 @@ urlpatterns = [
     path('seance/delete/<int:pk>/', views.SeanceDeleteView.as_view(), name='seance_delete'),
     path('seance/activate/<int:pk>/', views.SeanceActivateView.as_view(), name='seance_activate'),
     path('seance/create/', views.SeanceCreateView.as_view(), name='seance_create'),
+    path('seance/import/', views.ScheduleImportView.as_view(), name='seance_schedule_import'),
     path('seance/update/<int:pk>/', views.SeanceUpdateView.as_view(), name='seance_update'),
     path('seance/', views.SeanceListView.as_view(), name='seance_list'),
     path('seance_base/delete/<int:pk>/', views.SeanceBaseDeleteView.as_view(), name='seance_base_delete'),
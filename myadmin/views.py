@@ -12,6 +12,7 @@ from django.views.generic import TemplateView, DetailView, ListView, UpdateView,
 from myadmin import forms
 from myadmin.forms import FilmModelForm
 from seance.models import Film, AdvUser, SeatCategory, Price, Seance, SeanceBase, Hall
+from seance.schedule import import_schedule
 
 
 class IsStaffRequiredMixin(AccessMixin):
@@ -260,7 +261,7 @@ class SeanceListView(IsStaffRequiredMixin, ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        return Seance.objects.all().order_by('-updated_at')
+        return Seance.select_board_relations(Seance.objects.all()).order_by('-updated_at')
 
 
 class SeanceUpdateView(IsStaffRequiredMixin, UpdateView):
@@ -289,6 +290,21 @@ class SeanceCreateView(IsStaffRequiredMixin, CreateView):
         return initial.copy()
 
 
+class ScheduleImportView(IsStaffRequiredMixin, FormView):
+    """Creates seances of seance base from csv at once, if they don't intersect with each other and the hall"""
+    template_name = 'myadmin/seances/seance_schedule_import.html'
+    form_class = forms.ScheduleImportForm
+    success_url = reverse_lazy('myadmin:seance_list')
+
+    def form_valid(self, form):
+        result = import_schedule(form.cleaned_data['seance_base'], form.cleaned_data['schedule'], self.request.user)
+        if not result['success']:
+            form.add_error(None, _('There are intersections in times with other seances'))
+            return self.render_to_response(self.get_context_data(form=form, rows=result['rows']))
+        messages.add_message(self.request, messages.SUCCESS, f'{len(result["seances"])} seances were created')
+        return redirect(self.success_url)
+
+
 class SeanceDeleteView(IsStaffRequiredMixin, DeleteView):
     model = Seance
     template_name = 'myadmin/seances/seance_confirm_delete.html'
@@ -431,6 +447,7 @@ class HallActivateView(IsStaffRequiredMixin, FormView):
         context = super().get_context_data(**kwargs)
         result = self.hall.activate_hall()
         context['hall'] = self.hall
+        context['hall_layout'] = Hall.get_layout(self.hall.pk)
 
         seat_categories = [sc for sc in SeatCategory.objects.all()]
         context['seat_categories'] = seat_categories
@@ -0,0 +1,150 @@
+import copy
+import hashlib
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db.models.signals import post_delete, post_save
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from cinema.settings import API_TOKEN_CACHE_TTL, API_SIGNED_TOKEN_MAX_AGE
+
+SIGNED_TOKEN_SALT = 'seance.API.signed-token'
+
+
+class TokenCache:
+    """
+    Users, authenticated by tokens, kept in memory of the process for ttl seconds.
+    Entries are dropped at once, when token is deleted or user is saved (see signal dispatchers below),
+    in other processes they live not longer, than ttl.
+    Every get returns own copy of token and its user, so concurrent requests don't share and change one instance.
+    Fields of user, which are changed by update() without saving (wallet, money_spent, last_activity), may be stale
+    up to ttl: code, which relies on them, has to read them from database
+    """
+    def __init__(self, ttl=API_TOKEN_CACHE_TTL):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.next_prune = time.monotonic() + ttl
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return self.copy_token(entry[0])
+
+    @staticmethod
+    def copy_instance(instance):
+        """Shallow copy of model instance with own state, so caches of related objects aren't shared"""
+        instance_copy = copy.copy(instance)
+        instance_copy._state = copy.copy(instance._state)
+        instance_copy._state.fields_cache = {}
+        return instance_copy
+
+    def copy_token(self, token):
+        token_copy = self.copy_instance(token)
+        token_copy.user = self.copy_instance(token.user)
+        return token_copy
+
+    def set(self, key, token):
+        """Puts token to cache, once in ttl expired entries are dropped, so tokens of gone users don't pile up"""
+        now = time.monotonic()
+        with self.lock:
+            if now >= self.next_prune:
+                self.entries = {cached_key: entry for cached_key, entry in self.entries.items() if entry[1] >= now}
+                self.next_prune = now + self.ttl
+            self.entries[key] = (token, now + self.ttl)
+
+    def discard(self, key=None, user_pk=None):
+        """Drops entry of token key or all entries of user"""
+        with self.lock:
+            self.entries.pop(key, None)
+            if user_pk is not None:
+                for cached_key, (token, _) in list(self.entries.items()):
+                    if token.user_id == user_pk:
+                        del self.entries[cached_key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def key_digest(key):
+    """Short digest of token key, which is put into signed tokens instead of the key itself"""
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def make_signed_token(token):
+    """Signs pk of token's user and digest of its key, so signed token dies with the token"""
+    return signing.dumps({'user': token.user_id, 'key': key_digest(token.key)}, salt=SIGNED_TOKEN_SALT, compress=True)
+
+
+def get_user_token(user_pk):
+    """Returns token of user with the user from memory cache or database"""
+    cache_key = f'user:{user_pk}'
+    token = token_cache.get(cache_key)
+    if token is None:
+        token = Token.objects.select_related('user').filter(user_id=user_pk).first()
+        if token is None:
+            return None
+        token_cache.set(cache_key, token)
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication ('Authorization: Token <key>'), tokens are issued by rest-auth login and deleted
+    by its logout. Token with its user is looked up in database only once in API_TOKEN_CACHE_TTL seconds
+    """
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            token = Token.objects.select_related('user').filter(key=key).first()
+            if token is None:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            token_cache.set(key, token)
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return token.user, token
+
+
+class SignedTokenAuthentication(TokenAuthentication):
+    """
+    Authentication with signed token ('Authorization: Signed <token>', see make_signed_token), which expires
+    in API_SIGNED_TOKEN_MAX_AGE seconds. Checking of signature costs one HMAC, user is taken from memory cache
+    """
+    keyword = 'Signed'
+
+    def authenticate_credentials(self, key):
+        try:
+            payload = signing.loads(key, salt=SIGNED_TOKEN_SALT, max_age=API_SIGNED_TOKEN_MAX_AGE)
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed('Token expired.')
+        except signing.BadSignature:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        token = get_user_token(payload['user'])
+        if token is None or key_digest(token.key) != payload['key']:
+            raise exceptions.AuthenticationFailed('Token revoked.')
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return token.user, token
+
+
+def token_deleted_dispatcher(sender, **kwargs):
+    token = kwargs.get('instance')
+    token_cache.discard(token.key, user_pk=token.user_id)
+
+
+def user_saved_dispatcher(sender, **kwargs):
+    """User could be deactivated or changed, cached copies of him mustn't be used"""
+    token_cache.discard(user_pk=kwargs.get('instance').pk)
+
+
+post_delete.connect(token_deleted_dispatcher, sender=Token)
+post_save.connect(user_saved_dispatcher, sender=get_user_model())
@@ -19,6 +19,12 @@ class DateEssential(APIException):
     default_code = 'date_essential'
 
 
+class DateRangeError(APIException):
+    status_code = 400
+    default_detail = 'GET-parameter "date_to" must be not less, than "date_from" and within allowed window.'
+    default_code = 'wrong_date_range_in_request'
+
+
 class OrderingFormatError(APIException):
     status_code = 400
     default_detail = 'GET-parameter "ordering" has wrong value not in [expensive, cheap].'
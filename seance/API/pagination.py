@@ -0,0 +1,18 @@
+from rest_framework.pagination import CursorPagination
+
+from cinema.settings import API_PAGE_SIZES
+
+
+class CreatedCursorPagination(CursorPagination):
+    """
+    Keyset pagination by time of creation, which never changes, so pages stay stable while objects are added.
+    Page size is taken from API_PAGE_SIZES by basename of the viewset, client may ask for a smaller one
+    """
+    ordering = ('-created_at', '-pk')
+    page_size = API_PAGE_SIZES['default']
+    page_size_query_param = 'page_size'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = API_PAGE_SIZES.get(getattr(view, 'basename', None), API_PAGE_SIZES['default'])
+        self.page_size = self.max_page_size = page_size
+        return super().paginate_queryset(queryset, request, view)
@@ -1,24 +1,41 @@
 import datetime
 
+from django.shortcuts import get_object_or_404
 from rest_framework import mixins, status
 from rest_framework import viewsets
+from rest_framework.authtoken.models import Token
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.utils import json
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import APIView
 
+from cinema.settings import SEAT_HOLD_TIMEOUT, SCHEDULE_MAX_DAYS, API_SIGNED_TOKEN_MAX_AGE
 from seance.API import serializers
-from seance.API.exceptions import DateFormatError, OrderingFormatError, DatePassedError, DateEssential
-from seance.models import Seance, SeanceBase, Hall, Film, AdvUser, Price, SeatCategory, Purchase, Ticket
-
-
-class SeanceViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+from seance.API.authentication import make_signed_token
+from seance.API.exceptions import DateFormatError, OrderingFormatError, DatePassedError, DateEssential, \
+    DateRangeError
+from seance.API.pagination import CreatedCursorPagination
+from seance.API.sparse import SparseFieldsViewMixin
+from seance.API.values import ValuesPathMixin, SEANCE_VALUES, PRICE_VALUES, seances_data, prices_data
+from seance.board import get_cached_board, cache_board
+from seance.holds import get_hold_backend
+from seance.layout import layout_seats_data
+from seance.mailing import queue_ticket_emails
+from seance.models import Seance, SeanceBase, Hall, Film, AdvUser, Price, SeatCategory, Purchase, Ticket, \
+    SeanceOccurrence
+from seance.purchases import create_purchase, return_purchase, PurchaseError, InsufficientFunds, \
+    TicketsAlreadySold
+from seance.sessions import get_basket_store
+
+
+class SeanceViewSet(ValuesPathMixin, SparseFieldsViewMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                    viewsets.GenericViewSet):
     serializer_class = serializers.SeanceModelSerializer
 
-    def get_queryset(self):
-        """
-        Creates queryset depending upon the asked date and ordering params
-        """
+    def get_board_params(self):
+        """Validates date and ordering params, asked by client"""
         date = self.request.GET.get('date', None)
         ordering = self.request.GET.get('ordering', '')
         if date:
@@ -26,19 +43,73 @@ class SeanceViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.G
             if date < datetime.date.today():        # if date has passed - raise error
                 raise DatePassedError()
 
-        seances = Seance.get_active_seances_for_day(date)
+        if ordering.endswith('/'):
+            ordering = ordering[0: -1]
+        if ordering not in ['', 'cheap', 'expensive', 'latest', 'closest']:
+            raise OrderingFormatError()
+        return date, ordering
+
+    def get_queryset(self):
+        """
+        Creates queryset depending upon the asked date and ordering params
+        """
+        date, ordering = self.get_board_params()
+        seances = self.select_serialized_relations(Seance.get_active_seances_for_day(date))
 
         # if client selected type of ordering
         if ordering:
-            if ordering.endswith('/'):
-                ordering = ordering[0: -1]
-
-            if ordering not in ['', 'cheap', 'expensive', 'latest', 'closest']:
-                raise OrderingFormatError()
             seances = Seance.order_queryset(ordering, seances)
 
         return seances
 
+    def list(self, request, *args, **kwargs):
+        """
+        Board is the same for all clients, so serialized seances are cached by date, ordering, language,
+        asked fields and host (urls of objects are absolute)
+        """
+        date, ordering = self.get_board_params()
+        board_params = ('api', date or datetime.date.today(), ordering, request.build_absolute_uri('/'),
+                        request.query_params.get('fields', ''), request.query_params.get('expand'))
+        data = get_cached_board(*board_params)
+        if data is None:
+            if self.use_values_path():
+                data = seances_data(self.filter_queryset(self.get_queryset()).prefetch_related(None).values(
+                    *SEANCE_VALUES), request)
+            else:
+                # data is cached as plain json types, hyperlinks would fetch their objects on pickling
+                data = json.loads(json.dumps(super().list(request, *args, **kwargs).data, cls=JSONEncoder))
+            cache_board(data, *board_params)
+        return Response(data)
+
+    @action(detail=False)
+    def schedule(self, request, *args, **kwargs):
+        """
+        Returns active seances grouped by dates from date_from (today by default) to date_to (a week by default),
+        with quantity of free seats on each seance. Range can't be longer, than SCHEDULE_MAX_DAYS
+        """
+        date_from = self.request.GET.get('date_from', None)
+        date_from = self.get_date(date_from) if date_from else datetime.date.today()
+        if date_from < datetime.date.today():
+            raise DatePassedError()
+        date_to = self.request.GET.get('date_to', None)
+        date_to = self.get_date(date_to) if date_to else date_from + datetime.timedelta(days=6)
+        if not date_from <= date_to < date_from + datetime.timedelta(days=SCHEDULE_MAX_DAYS):
+            raise DateRangeError()
+
+        occurrences = SeanceOccurrence.get_schedule(date_from, date_to)
+        seances = {seance['pk']: seance for seance in seances_data(
+            Seance.objects.filter(pk__in={occurrence['seance_id'] for occurrence in occurrences})
+            .values(*SEANCE_VALUES), request)}
+
+        days = {date_from + datetime.timedelta(days=day): [] for day in range((date_to - date_from).days + 1)}
+        for occurrence in occurrences:
+            seance = seances[occurrence['seance_id']]
+            days[occurrence['date']].append(
+                dict(seance, seats_free=seance['seance_base']['hall']['quantity_seats'] - occurrence['seats_taken']))
+        return Response({'date_from': date_from,
+                         'date_to': date_to,
+                         'days': [{'date': date, 'seances': day_seances} for date, day_seances in days.items()]})
+
     @staticmethod
     def get_date(date):
         """Validates, that date givven by client has correct format"""
@@ -62,56 +133,98 @@ class SeanceViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.G
         else:
             raise DateEssential()
 
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-
-        # get all seats
-        seats = instance.seance_base.hall.seats
-        seats = serializers.SeatModelSerializer(seats, many=True)
-
-        # get taken seats
-        tickets = instance.tickets.filter(date_seance=date)
-        seats_taken = serializers.SeatModelSerializer([ticket.seat for ticket in tickets], many=True)
-        return Response({'seance': serializer.data,
-                         'seats': seats.data,
-                         'seats_taken': seats_taken.data
+        if self.use_values_path():
+            row = get_object_or_404(self.get_queryset().prefetch_related(None).values(*SEANCE_VALUES),
+                                    pk=self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+            seance_data = seances_data([row], request)[0]
+            # seance with only fields, needed to find its taken seats
+            instance = Seance(pk=row['pk'], seance_base=SeanceBase(pk=row['seance_base__pk'],
+                                                                   hall_id=row['seance_base__hall__pk']))
+        else:
+            instance = self.get_object()
+            seance_data = self.get_serializer(instance).data
+
+        # get all seats from cached layout of the hall
+        seats = layout_seats_data(Hall.get_layout(instance.seance_base.hall_id))
+
+        # get taken seats from occupancy of the seance on that date and seats held in baskets
+        seats_taken = instance.get_seats_taken(date)
+        seats_held = get_hold_backend().held_seats(instance.pk, date)
+        return Response({'seance': seance_data,
+                         'seats': seats,
+                         'seats_taken': [seat for seat in seats if seat['id'] in seats_taken],
+                         'seats_held': [seat for seat in seats if seat['id'] in seats_held]
                          })
 
 
-class PriceViewSet(mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+class PriceViewSet(ValuesPathMixin, SparseFieldsViewMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin,
+                   viewsets.GenericViewSet):
     serializer_class = serializers.PriceModelSerializer
     queryset = Price.objects.all()
+    pagination_class = CreatedCursorPagination
 
+    def list(self, request, *args, **kwargs):
+        if not self.use_values_path():
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).values(*PRICE_VALUES)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(prices_data(page, request))
 
-class SeanceBaseViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+
+class SeanceBaseViewSet(SparseFieldsViewMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                        viewsets.GenericViewSet):
     queryset = SeanceBase.objects.all()
     serializer_class = serializers.SeanceBaseModelSerializer
+    pagination_class = CreatedCursorPagination
 
 
-class HallViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+class HallViewSet(SparseFieldsViewMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     queryset = Hall.objects.all()
     serializer_class = serializers.HallModelSerializer
+    pagination_class = CreatedCursorPagination
+
+    @action(detail=True)
+    def layout(self, request, *args, **kwargs):
+        """Returns cached layout of hall: rows with seats and category palette"""
+        layout = Hall.get_layout(self.get_object().pk)
+        return Response({'version': layout['version'],
+                         'rows': layout['rows'],
+                         'palette': layout['palette']})
 
 
-class FilmViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+class FilmViewSet(SparseFieldsViewMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     queryset = Film.objects.all()
     serializer_class = serializers.FilmModelSerializer
+    pagination_class = CreatedCursorPagination
 
 
-class AdvUserViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+class AdvUserViewSet(SparseFieldsViewMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     queryset = AdvUser.objects.all()
     serializer_class = serializers.AdvUserModelSerializer
 
 
-class SeatCategoryViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+class SeatCategoryViewSet(SparseFieldsViewMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     serializer_class = serializers.SeatCategoryModelSerializer
     queryset = SeatCategory.objects.all()
 
 
+class SignedTokenAPIView(APIView):
+    """
+    Issues signed token for authenticated user (see seance.API.authentication), which is checked without
+    database. It's valid till expiring or till the user's token is deleted by logout
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def post(self, request, *args, **kwargs):
+        token, _ = Token.objects.get_or_create(user=request.user)
+        return Response({'token': make_signed_token(token), 'expires_in': API_SIGNED_TOKEN_MAX_AGE},
+                        status=status.HTTP_200_OK)
+
+
 class BasketAPIView(APIView):
 
     def get(self, request, *args, **kwargs):
-        basket = request.session.get('basket')
+        basket = get_basket_store().get(request.user.pk) if request.user.is_authenticated else None
         return Response(basket)
 
 
@@ -121,12 +234,13 @@ class BasketCancelAPIView(APIView):
     def get(self, request, *args, **kwargs):
         serializer = serializers.BasketSerializer(data=request.data)
         if serializer.is_valid():
-            basket = request.session.get('basket', {})
+            basket = get_basket_store().get(request.user.pk) or {}
             key = f'{serializer.data["seat_pk"]}_{serializer.data["seance_pk"]}_{serializer.data["seance_date"]}'
             if key in basket:
                 del basket[key]
-                request.session['basket'] = basket
-                request.session.modified = True
+                get_hold_backend().release(serializer.data['seance_pk'], serializer.data['seance_date'],
+                                           [serializer.data['seat_pk']], request.user.pk)
+                get_basket_store().set(request.user.pk, basket)
                 return Response({'basket': basket,
                                  'detail': 'Object was removed from basket',
                                  'object': serializer.data
@@ -140,25 +254,29 @@ class BasketCancelAPIView(APIView):
 
 
 def check_basket(basket):
-    """Checks, that basket was created no more than 10 minutes ago"""
-    if basket:
+    """
+    Checks, that basket was created no more than SEAT_HOLD_TIMEOUT (10 minutes) ago.
+    Basket is shared with the site, baskets, filled on the site, have no 'added' key
+    """
+    if basket and basket.get('added'):
         added = datetime.datetime.strptime(basket.get('added'), '%Y-%m-%d %H:%M:%S.%f')
-        if added < (datetime.datetime.now() - datetime.timedelta(minutes=10)):
+        if added < (datetime.datetime.now() - SEAT_HOLD_TIMEOUT):
             return None
     return basket
 
 
 class BasketAddAPIView(APIView):
+    permission_classes = (IsAuthenticated, )
 
     def get(self, request, *args, **kwargs):
         """
-        Validates given data, adds it to existing or creates new basket object in session
-        Basket object has 10 minutes for leaving, starting with time of its creation
+        Validates given data, adds it to existing or creates new basket of the user
+        Basket object has 10 minutes for leaving, starting with time of its creation.
+        Seat is held for the user for the same time, so other users can't put it into their baskets
         """
         serializer = serializers.BasketSerializer(data=request.data)
         if serializer.is_valid():
-            basket = request.session.get('basket', None)
-            basket = check_basket(basket)
+            basket = check_basket(get_basket_store().get(request.user.pk))
             if not basket:
                 basket = {'added': str(datetime.datetime.now())}
             key = f'{serializer.data["seat_pk"]}_{serializer.data["seance_pk"]}_{serializer.data["seance_date"]}'
@@ -166,72 +284,74 @@ class BasketAddAPIView(APIView):
                 return Response({'data': serializer.data,
                                  'detail': 'Object with such data is already in basket'
                                  }, status=status.HTTP_201_CREATED)
+            if not get_hold_backend().acquire(serializer.data['seance_pk'], serializer.data['seance_date'],
+                                              serializer.data['seat_pk'], request.user.pk):
+                return Response({'data': serializer.data,
+                                 'detail': 'This seat is temporarily held by another user'
+                                 }, status=status.HTTP_409_CONFLICT)
             basket_item = serializer.data
             basket_item.update({'price': serializer.validated_data.get('price')})
             basket.update({key: basket_item})
-            request.session['basket'] = basket
-            request.session.modified = True
+            get_basket_store().set(request.user.pk, basket)
             return Response(basket, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class PurchaseViewSet(mixins.ListModelMixin, mixins.CreateModelMixin, viewsets.GenericViewSet):
+class PurchaseViewSet(SparseFieldsViewMixin, mixins.ListModelMixin, mixins.CreateModelMixin, viewsets.GenericViewSet):
     serializer_class = serializers.PurchaseModelSerializer
     permission_classes = (IsAuthenticated, )
+    pagination_class = CreatedCursorPagination
 
     def get_queryset(self):
-        return Purchase.objects.filter(user_id=self.request.user.pk)
+        return self.select_serialized_relations(Purchase.objects.filter(user_id=self.request.user.pk))
 
     def list(self, request, *args, **kwargs):
+        """Returns page of user's purchases with links to neighbour pages and money spent for all purchases"""
         queryset = self.filter_queryset(self.get_queryset())
-
         page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = self.get_serializer(page, many=True)
+        # user of token authentication comes from memory cache, so counter is read from database
         money_spent = request.user.sum_money_spent
         return Response({
             'money_spent': money_spent,
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
             'purchases': serializer.data})
 
     def create(self, request, *args, **kwargs):
         """Creates purchase with tickets for it
         If some of the tickets was sold, we cancel purchase and make basket empty"""
-        basket = request.session.get('basket')
-        basket = check_basket(basket)
+        basket = check_basket(get_basket_store().get(request.user.pk))
         if not basket:
             return Response({'detail': 'Empty basket. Or was created more than 10 minutes ago'},
                             status=status.HTTP_200_OK)
 
-        # del added key from basket to get only info about future tickets in it
-        if 'added' in basket:
-            del basket['added']
-        total_price = sum([float(basket[item]['price']) for item in basket])
-        if total_price > request.user.wallet:
-            Response({'detail': f'Insufficient funds. You need {total_price} hrn,'
-                                f' but have only {request.user.wallet} hrn'}, status=status.HTTP_200_OK)
-
-        purchase = Purchase.objects.create(user_id=request.user.pk)
-        tickets = []
-        for i, item in enumerate(basket):
-            existing_tickets = Ticket.objects.filter(seance_id=basket[item]['seance_pk'],
-                                                     date_seance=basket[item]['seance_date'],
-                                                     seat_id=basket[item]['seat_pk'])
-            if existing_tickets:
-                purchase.delete()
-                del request.session['basket']
-                request.session.modified = True
-                return Response({'detail': f'Some of the tickets you choose was already sold'},
-                                status=status.HTTP_200_OK)
-            tickets.append(Ticket(seance_id=basket[item]['seance_pk'], date_seance=basket[item]['seance_date'],
-                                  seat_id=basket[item]['seat_pk'], purchase=purchase, price=basket[item]['price']))
-
-        [ticket.save() for ticket in tickets]
+        # skip added key of basket to get only info about future tickets in it
+        items = [basket[key] for key in basket if key != 'added']
+        try:
+            purchase = create_purchase(request.user.pk, items)
+        except InsufficientFunds as error:
+            return Response({'detail': error.detail}, status=status.HTTP_200_OK)
+        except TicketsAlreadySold as error:
+            get_basket_store().delete(request.user.pk)
+            return Response({'detail': error.detail}, status=status.HTTP_200_OK)
+        except PurchaseError as error:
+            return Response({'detail': error.detail}, status=status.HTTP_400_BAD_REQUEST)
+
+        queue_ticket_emails([purchase.pk])
         tickets = Ticket.objects.filter(purchase_id=purchase.id)
         tickets = serializers.TicketModelSerializer(tickets, many=True)
-        del request.session['basket']
-        request.session.modified = True
-        return Response({'tickets': tickets.data, 'total_price': total_price},
+        get_basket_store().delete(request.user.pk)
+        return Response({'tickets': tickets.data, 'total_price': purchase.total_price},
                         status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], url_path='return')
+    def return_tickets(self, request, *args, **kwargs):
+        """Returns purchase of the user: money goes back to wallet and seats of its tickets can be bought again"""
+        purchase = self.get_object()
+        try:
+            return_purchase(purchase.pk)
+        except PurchaseError as error:
+            return Response({'detail': error.detail}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'detail': 'Purchase was returned', 'total_price': purchase.total_price},
+                        status=status.HTTP_200_OK)
@@ -4,10 +4,11 @@ from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from rest_framework import serializers
 
+from seance.API.sparse import SparseFieldsMixin
 from seance.models import Seance, AdvUser, Hall, Film, SeanceBase, Price, SeatCategory, Seat, Purchase, Ticket
 
 
-class AdvUserModelSerializer(serializers.ModelSerializer):
+class AdvUserModelSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # url = serializers.HyperlinkedIdentityField(view_name='api:user-detail')
 
     class Meta:
@@ -15,7 +16,7 @@ class AdvUserModelSerializer(serializers.ModelSerializer):
         fields = ('username', 'id')
 
 
-class SeatCategoryModelSerializer(serializers.ModelSerializer):
+class SeatCategoryModelSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # url = serializers.HyperlinkedIdentityField(view_name='api:seat_category-detail')
 
     class Meta:
@@ -23,7 +24,7 @@ class SeatCategoryModelSerializer(serializers.ModelSerializer):
         exclude = ('created_at', 'updated_at', 'admin', 'id')
 
 
-class HallModelSerializer(serializers.HyperlinkedModelSerializer):
+class HallModelSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     # admin = AdvUserModelSerializer()
     url = serializers.HyperlinkedIdentityField(view_name='api:hall-detail')
 
@@ -32,7 +33,7 @@ class HallModelSerializer(serializers.HyperlinkedModelSerializer):
         fields = ('url', 'name', 'quantity_seats', 'quantity_rows', 'description')
 
 
-class FilmModelSerializer(serializers.HyperlinkedModelSerializer):
+class FilmModelSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     # admin = AdvUserModelSerializer()
     url = serializers.HyperlinkedIdentityField(view_name='api:film-detail')
 
@@ -41,7 +42,7 @@ class FilmModelSerializer(serializers.HyperlinkedModelSerializer):
         fields = ('url', 'title', 'starring', 'director', 'duration', 'description', 'is_active')
 
 
-class SeanceBaseModelSerializer(serializers.HyperlinkedModelSerializer):
+class SeanceBaseModelSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     hall = HallModelSerializer()
     film = FilmModelSerializer()
     url = serializers.HyperlinkedIdentityField(view_name='api:seance_base-detail')
@@ -51,7 +52,7 @@ class SeanceBaseModelSerializer(serializers.HyperlinkedModelSerializer):
         fields = ('url', 'film', 'hall', 'date_starts', 'date_ends')
 
 
-class PriceModelSerializer(serializers.HyperlinkedModelSerializer):
+class PriceModelSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     url = serializers.HyperlinkedIdentityField(view_name='api:price-detail')
     seat_category = SeatCategoryModelSerializer()
 
@@ -60,7 +61,7 @@ class PriceModelSerializer(serializers.HyperlinkedModelSerializer):
         exclude = ('created_at', 'updated_at', 'seance')
 
 
-class SeanceModelSerializer(serializers.HyperlinkedModelSerializer):
+class SeanceModelSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     seance_base = SeanceBaseModelSerializer()
     # admin = AdvUserModelSerializer()
     url = serializers.HyperlinkedIdentityField(view_name='api:seance-detail')
@@ -69,7 +70,7 @@ class SeanceModelSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Seance
         fields = ('url', 'pk', 'time_starts', 'time_ends', 'time_hall_free', 'advertisements_duration',
-                  'cleaning_duration', 'description', 'is_active', 'seance_base', 'prices')
+                  'cleaning_duration', 'description', 'is_active', 'min_price', 'seance_base', 'prices')
         depth = 1
         # fields = '__all__'
 
@@ -136,17 +137,17 @@ class BasketSerializer(serializers.Serializer):
         return data
 
 
-class TicketModelSerializer(serializers.ModelSerializer):
+class TicketModelSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Ticket
         exclude = ('was_returned', 'created_at', 'purchase')
 
 
-class PurchaseModelSerializer(serializers.ModelSerializer):
+class PurchaseModelSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     tickets = TicketModelSerializer(many=True)
 
     class Meta:
         model = Purchase
         # exclude = ('created_at', 'was_returned', 'returned_at')
-        fields = ('id', 'created_at', 'tickets', )
+        fields = ('id', 'created_at', 'total_price', 'tickets', )
@@ -0,0 +1,102 @@
+from rest_framework import serializers
+
+
+def parse_paths(value):
+    """
+    Parses comma separated dotted paths into tree of dicts: 'time_starts,seance_base.film.title' ->
+    {'time_starts': {}, 'seance_base': {'film': {'title': {}}}}
+    """
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+class SparseFieldsMixin:
+    """
+    Serializer, which can return only a part of its fields. Takes trees of paths (see parse_paths):
+    fields - names of fields to return, nested serializers return only fields from their subtree, if it isn't empty;
+    expand - nested serializers to embed, not expanded relations are returned as primary keys (one-to-many ones are
+    dropped). If expand is None, all nested serializers are embedded
+    """
+    def __init__(self, *args, **kwargs):
+        self.only_fields = kwargs.pop('only_fields', None)
+        self.expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.only_fields:
+            fields = {name: field for name, field in fields.items() if name in self.only_fields}
+
+        for name, field in list(fields.items()):
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if not isinstance(nested, serializers.BaseSerializer):
+                continue
+            if self.expand is not None and name not in self.expand:
+                if nested is field:
+                    fields[name] = serializers.PrimaryKeyRelatedField(source=field.source, read_only=True)
+                else:
+                    del fields[name]
+            elif isinstance(nested, SparseFieldsMixin):
+                nested.only_fields = self.only_fields.get(name) if self.only_fields else None
+                nested.expand = self.expand.get(name, {}) if self.expand is not None else None
+        return fields
+
+
+def get_fetch_plan(serializer, prefix='', prefetch=False):
+    """
+    Walks through fields of serializer instance and collects relations, which it will serialize.
+    :return: (paths for select_related, paths for prefetch_related)
+    """
+    select_paths, prefetch_paths = [], []
+    for field in serializer.fields.values():
+        many = isinstance(field, serializers.ListSerializer)
+        nested = field.child if many else field
+        if not isinstance(nested, serializers.BaseSerializer) or field.source == '*':
+            continue
+        path = prefix + field.source.replace('.', '__')
+        if many or prefetch:
+            prefetch_paths.append(path)
+        else:
+            select_paths.append(path)
+        nested_select, nested_prefetch = get_fetch_plan(nested, path + '__', prefetch=many or prefetch)
+        select_paths.extend(nested_select)
+        prefetch_paths.extend(nested_prefetch)
+    return select_paths, prefetch_paths
+
+
+class SparseFieldsViewMixin:
+    """
+    Passes GET-parameters 'fields' and 'expand' to serializer (if it's SparseFieldsMixin) and fetches
+    with queryset only relations, which serializer will return
+    """
+    def get_sparse_kwargs(self):
+        serializer_class = self.get_serializer_class()
+        if not issubclass(serializer_class, SparseFieldsMixin):
+            return {}
+        fields = self.request.query_params.get('fields')
+        expand = self.request.query_params.get('expand')
+        return {'only_fields': parse_paths(fields) if fields else None,
+                'expand': parse_paths(expand) if expand is not None else None}
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(self.get_sparse_kwargs())
+        return super().get_serializer(*args, **kwargs)
+
+    def select_serialized_relations(self, queryset):
+        serializer_class = self.get_serializer_class()
+        if not issubclass(serializer_class, SparseFieldsMixin):
+            return queryset
+        select_paths, prefetch_paths = get_fetch_plan(serializer_class(**self.get_sparse_kwargs()))
+        if select_paths:
+            queryset = queryset.select_related(*select_paths)
+        if prefetch_paths:
+            queryset = queryset.prefetch_related(*prefetch_paths)
+        return queryset
+
+    def get_queryset(self):
+        return self.select_serialized_relations(super().get_queryset())
@@ -17,6 +17,7 @@ router.register('purchase', resources.PurchaseViewSet, basename='purchase')
 
 urlpatterns = [
     path('rest-auth/registration/', include('rest_auth.registration.urls')),
+    path('rest-auth/signed-token/', resources.SignedTokenAPIView.as_view(), name='signed-token'),
     path('rest-auth/', include('rest_auth.urls')),
     path('basket/cancel/', resources.BasketCancelAPIView.as_view(), name='basket-cancel'),
     path('basket/add/', resources.BasketAddAPIView.as_view(), name='basket-add'),
@@ -0,0 +1,93 @@
+from django.urls import reverse
+
+from seance.models import Price
+
+# rows of values() with fields of seance.API.serializers.SeanceModelSerializer and its nested serializers
+SEANCE_VALUES = ('pk', 'time_starts', 'time_ends', 'time_hall_free', 'advertisements_duration', 'cleaning_duration',
+                 'description', 'is_active', 'min_price', 'seance_base__pk', 'seance_base__date_starts',
+                 'seance_base__date_ends', 'seance_base__film__pk', 'seance_base__film__title',
+                 'seance_base__film__starring', 'seance_base__film__director', 'seance_base__film__duration',
+                 'seance_base__film__description', 'seance_base__film__is_active', 'seance_base__hall__pk',
+                 'seance_base__hall__name', 'seance_base__hall__quantity_seats', 'seance_base__hall__quantity_rows',
+                 'seance_base__hall__description')
+PRICE_VALUES = ('pk', 'created_at', 'seance_id', 'price', 'seat_category__name', 'seat_category__color')
+
+
+def iso(value):
+    """Formats date or time, as DRF DateField and TimeField do with ISO_8601 format"""
+    return value.isoformat() if value is not None else None
+
+
+def detail_url_builder(request, view_name):
+    """
+    Returns function, which builds absolute url of detail view for pk. reverse() is called only once,
+    urls for all objects are made from its prefix and suffix
+    """
+    placeholder = '987654321'
+    url = request.build_absolute_uri(reverse(view_name, kwargs={'pk': placeholder}))
+    prefix, suffix = url.rsplit(placeholder, 1)
+    return lambda pk: f'{prefix}{pk}{suffix}'
+
+
+def prices_data(rows, request):
+    """Builds from rows of PRICE_VALUES the same data, as PriceModelSerializer does"""
+    price_url = detail_url_builder(request, 'api:price-detail')
+    return [{'url': price_url(row['pk']),
+             'seat_category': {'name': row['seat_category__name'], 'color': row['seat_category__color']},
+             'price': row['price']}
+            for row in rows]
+
+
+def seances_data(rows, request):
+    """
+    Builds from rows of SEANCE_VALUES the same data, as SeanceModelSerializer does.
+    Prices of all seances are taken with one more query
+    """
+    rows = list(rows)
+    prices = {}
+    price_rows = list(Price.objects.filter(seance_id__in=[row['pk'] for row in rows]).values(*PRICE_VALUES))
+    for price_row, price in zip(price_rows, prices_data(price_rows, request)):
+        prices.setdefault(price_row['seance_id'], []).append(price)
+
+    seance_url = detail_url_builder(request, 'api:seance-detail')
+    seance_base_url = detail_url_builder(request, 'api:seance_base-detail')
+    film_url = detail_url_builder(request, 'api:film-detail')
+    hall_url = detail_url_builder(request, 'api:hall-detail')
+    return [{'url': seance_url(row['pk']),
+             'pk': row['pk'],
+             'time_starts': iso(row['time_starts']),
+             'time_ends': iso(row['time_ends']),
+             'time_hall_free': iso(row['time_hall_free']),
+             'advertisements_duration': iso(row['advertisements_duration']),
+             'cleaning_duration': iso(row['cleaning_duration']),
+             'description': row['description'],
+             'is_active': row['is_active'],
+             'min_price': row['min_price'],
+             'seance_base': {
+                 'url': seance_base_url(row['seance_base__pk']),
+                 'film': {'url': film_url(row['seance_base__film__pk']),
+                          'title': row['seance_base__film__title'],
+                          'starring': row['seance_base__film__starring'],
+                          'director': row['seance_base__film__director'],
+                          'duration': iso(row['seance_base__film__duration']),
+                          'description': row['seance_base__film__description'],
+                          'is_active': row['seance_base__film__is_active']},
+                 'hall': {'url': hall_url(row['seance_base__hall__pk']),
+                          'name': row['seance_base__hall__name'],
+                          'quantity_seats': row['seance_base__hall__quantity_seats'],
+                          'quantity_rows': row['seance_base__hall__quantity_rows'],
+                          'description': row['seance_base__hall__description']},
+                 'date_starts': iso(row['seance_base__date_starts']),
+                 'date_ends': iso(row['seance_base__date_ends'])},
+             'prices': prices.get(row['pk'], [])}
+            for row in rows]
+
+
+class ValuesPathMixin:
+    """
+    Viewset, which builds its data straight from values() rows, when client doesn't ask for
+    sparse fields (see seance.API.sparse) or format suffix, which model serializers would handle
+    """
+    def use_values_path(self):
+        params = self.request.query_params
+        return 'fields' not in params and 'expand' not in params and not self.format_kwarg
@@ -0,0 +1,67 @@
+import datetime
+
+from django.core.cache import caches
+from django.db.models import Case, When, Value
+
+from cinema.settings import LAST_ACTIVITY_CACHE
+from seance.models import AdvUser
+
+GENERATION_KEY = 'last-activity:generation'
+
+
+def get_activity_cache():
+    """
+    Returns LAST_ACTIVITY_CACHE, it's written by web processes and read by celery worker, so it must be shared.
+    It's checked once at startup by system check seance.E001 (see seance.checks)
+    """
+    return caches[LAST_ACTIVITY_CACHE]
+
+
+def generation_keys(generation):
+    """Returns (key of counter of users, function, which returns key of user's timestamp, of n-th user slot)"""
+    prefix = f'last-activity:{generation}'
+    return f'{prefix}:count', lambda user_pk: f'{prefix}:user:{user_pk}', lambda n: f'{prefix}:slot:{n}'
+
+
+def record_activity(user_pk, timestamp):
+    """
+    Puts epoch seconds of user's last activity to pending ones of current generation, which is saved to database
+    by flush_activity. Every user has own key, the first record of user in generation also takes a numbered slot
+    with atomic incr, so flush finds users without read-modify-write of shared value
+    """
+    cache = get_activity_cache()
+    generation = cache.get(GENERATION_KEY, 0)
+    count_key, user_key, slot_key = generation_keys(generation)
+    if cache.add(user_key(user_pk), timestamp, None):
+        cache.add(count_key, 0, None)
+        cache.set(slot_key(cache.incr(count_key)), user_pk, None)
+    else:
+        cache.set(user_key(user_pk), timestamp, None)
+
+
+def pop_generation(cache, generation):
+    """Returns {user pk: timestamp} of pending activities of generation and removes them from cache"""
+    count_key, user_key, slot_key = generation_keys(generation)
+    slot_keys = [slot_key(n) for n in range(1, cache.get(count_key, 0) + 1)]
+    user_keys = {user_key(user_pk): user_pk for user_pk in cache.get_many(slot_keys).values()}
+    timestamps = cache.get_many(user_keys)
+    cache.delete_many([count_key, *slot_keys, *user_keys])
+    return {user_keys[key]: timestamp for key, timestamp in timestamps.items()}
+
+
+def flush_activity():
+    """
+    Saves pending last activities of all users with one UPDATE, returns how many users were updated.
+    Generation is switched with atomic incr before it's read, so activities recorded meanwhile go to the new one.
+    Records, which were late for the previous flush, are saved with the previous generation
+    """
+    cache = get_activity_cache()
+    cache.add(GENERATION_KEY, 0, None)
+    generation = cache.incr(GENERATION_KEY) - 1
+    pending = pop_generation(cache, generation - 1)
+    pending.update(pop_generation(cache, generation))
+    if not pending:
+        return 0
+    when = [When(pk=user_pk, then=Value(datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)))
+            for user_pk, timestamp in pending.items()]
+    return AdvUser.objects.filter(pk__in=pending).update(last_activity=Case(*when))
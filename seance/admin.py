@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.http import HttpResponseRedirect
 from django.urls import reverse
 
-from seance.models import AdvUser, Hall, Seance, Film, Seat, SeatCategory, Price, SeanceBase, Ticket, Purchase
+from seance.models import AdvUser, Hall, Seance, Film, Seat, SeatCategory, Price, SeanceBase, Ticket, Purchase, \
+    SeatHold, SeanceOccurrence, Basket
 
 
 class AdvUserAdmin(admin.ModelAdmin):
@@ -35,3 +36,6 @@ admin.site.register(Price)
 admin.site.register(SeanceBase)
 admin.site.register(Ticket)
 admin.site.register(Purchase)
+admin.site.register(SeatHold)
+admin.site.register(Basket)
+admin.site.register(SeanceOccurrence)
@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.core.checks import Tags, register
 
 
 class SeanceConfig(AppConfig):
     name = 'seance'
+
+    def ready(self):
+        from seance.checks import check_last_activity_cache
+        register(check_last_activity_cache, Tags.caches)
@@ -0,0 +1,43 @@
+import uuid
+
+from django.core.cache import caches
+from django.utils.translation import get_language
+
+from cinema.settings import BOARD_CACHE, BOARD_CACHE_TIMEOUT
+
+BOARD_GENERATION_KEY = 'board:generation'
+
+
+def get_board_cache():
+    return caches[BOARD_CACHE]
+
+
+def get_board_generation():
+    """
+    Returns current generation of the board. All cached boards have it in their keys,
+    so changing generation invalidates them at once
+    """
+    board_cache = get_board_cache()
+    generation = board_cache.get(BOARD_GENERATION_KEY)
+    if generation is None:
+        board_cache.add(BOARD_GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = board_cache.get(BOARD_GENERATION_KEY)
+    return generation
+
+
+def board_key(kind, date, ordering, *extra):
+    """Key of board of some kind ('html', 'api') for date, ordering and current language"""
+    parts = [kind, str(date), ordering or '', get_language() or ''] + [str(part) for part in extra]
+    return f'board:{get_board_generation()}:' + ':'.join(parts)
+
+
+def get_cached_board(kind, date, ordering, *extra):
+    return get_board_cache().get(board_key(kind, date, ordering, *extra))
+
+
+def cache_board(board, kind, date, ordering, *extra):
+    get_board_cache().set(board_key(kind, date, ordering, *extra), board, BOARD_CACHE_TIMEOUT)
+
+
+def invalidate_board():
+    get_board_cache().set(BOARD_GENERATION_KEY, uuid.uuid4().hex, None)
@@ -0,0 +1,17 @@
+from django.core.checks import Error
+from django.core.exceptions import ImproperlyConfigured
+
+from cinema.settings import LAST_ACTIVITY_PERSIST, LAST_ACTIVITY_CACHE
+from seance.utilities import check_shared_cache
+
+
+def check_last_activity_cache(app_configs, **kwargs):
+    """Last activities are written to LAST_ACTIVITY_CACHE by web processes and read from it by celery worker"""
+    if not LAST_ACTIVITY_PERSIST:
+        return []
+    try:
+        check_shared_cache(LAST_ACTIVITY_CACHE, 'LAST_ACTIVITY_CACHE')
+    except ImproperlyConfigured as error:
+        return [Error(str(error), hint='Set LAST_ACTIVITY_PERSIST to False or configure shared cache',
+                      id='seance.E001')]
+    return []
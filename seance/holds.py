@@ -0,0 +1,130 @@
+from django.core.cache import caches
+from django.db import transaction, IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from cinema.settings import SEAT_HOLD_BACKEND, SEAT_HOLD_TIMEOUT, SEAT_HOLD_CACHE
+from seance.models import SeatHold
+
+
+class BaseHoldBackend:
+    """
+    Holds of seats, keyed by (seance, date_seance, seat). Hold belongs to a user and expires after timeout.
+    Date of seance may be given as date or as string in format 'YYYY-MM-DD'
+    """
+    def __init__(self, timeout=SEAT_HOLD_TIMEOUT):
+        self.timeout = timeout
+
+    def acquire(self, seance_pk, date_seance, seat_pk, user_pk):
+        """
+        Atomically holds seat for the user or prolongs his own hold.
+        :return: True if seat is held for the user, False if it is held by somebody else
+        """
+        raise NotImplementedError
+
+    def release(self, seance_pk, date_seance, seat_pks, user_pk):
+        """Releases holds of the user on given seats"""
+        raise NotImplementedError
+
+    def held_seats(self, seance_pk, date_seance):
+        """Returns dict {seat_pk: user_pk} of seats held on the seance on date_seance"""
+        raise NotImplementedError
+
+    def sweep(self):
+        """Removes expired holds, returns how many were removed"""
+        raise NotImplementedError
+
+
+class DatabaseHoldBackend(BaseHoldBackend):
+    """Keeps holds in SeatHold table, unique constraint of the table makes acquiring atomic"""
+
+    def acquire(self, seance_pk, date_seance, seat_pk, user_pk):
+        now = timezone.now()
+        hold = SeatHold.objects.filter(seance_id=seance_pk, date_seance=date_seance, seat_id=seat_pk)
+        # take expired hold or prolong our own
+        if hold.filter(Q(expires_at__lte=now) | Q(user_id=user_pk)).update(user_id=user_pk,
+                                                                            expires_at=now + self.timeout):
+            return True
+        try:
+            with transaction.atomic():
+                SeatHold.objects.create(seance_id=seance_pk, date_seance=date_seance, seat_id=seat_pk,
+                                        user_id=user_pk, expires_at=now + self.timeout)
+        except IntegrityError:
+            return False
+        return True
+
+    def release(self, seance_pk, date_seance, seat_pks, user_pk):
+        SeatHold.objects.filter(seance_id=seance_pk, date_seance=date_seance, seat_id__in=seat_pks,
+                                user_id=user_pk).delete()
+
+    def held_seats(self, seance_pk, date_seance):
+        return dict(SeatHold.objects.filter(seance_id=seance_pk, date_seance=date_seance,
+                                            expires_at__gt=timezone.now()).values_list('seat_id', 'user_id'))
+
+    def sweep(self):
+        deleted, _ = SeatHold.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+class CacheHoldBackend(BaseHoldBackend):
+    """
+    Keeps holds in cache (SEAT_HOLD_CACHE alias), so expiring is done by cache itself.
+    Hold of each seat is a separate key, acquired with atomic cache.add. Seats held on seance are listed in
+    one more key, which is pruned on reading. That list is only used to show holds: if it misses a seat because
+    of concurrent writes, seat is still held
+    """
+    def __init__(self, timeout=SEAT_HOLD_TIMEOUT, cache_alias=SEAT_HOLD_CACHE):
+        super().__init__(timeout)
+        self.cache = caches[cache_alias]
+
+    @staticmethod
+    def hold_key(seance_pk, date_seance, seat_pk):
+        return f'hold:{seance_pk}:{date_seance}:{seat_pk}'
+
+    @staticmethod
+    def seance_key(seance_pk, date_seance):
+        return f'hold:{seance_pk}:{date_seance}'
+
+    def acquire(self, seance_pk, date_seance, seat_pk, user_pk):
+        key = self.hold_key(seance_pk, date_seance, seat_pk)
+        timeout = self.timeout.total_seconds()
+        if not self.cache.add(key, user_pk, timeout):
+            if self.cache.get(key) != user_pk:
+                return False
+            self.cache.set(key, user_pk, timeout)
+
+        seance_key = self.seance_key(seance_pk, date_seance)
+        seats = self.cache.get(seance_key, set())
+        seats.add(int(seat_pk))
+        self.cache.set(seance_key, seats, timeout)
+        return True
+
+    def release(self, seance_pk, date_seance, seat_pks, user_pk):
+        keys = [self.hold_key(seance_pk, date_seance, seat_pk) for seat_pk in seat_pks]
+        self.cache.delete_many([key for key, holder in self.cache.get_many(keys).items() if holder == user_pk])
+
+    def held_seats(self, seance_pk, date_seance):
+        seats = self.cache.get(self.seance_key(seance_pk, date_seance), set())
+        if not seats:
+            return {}
+        keys = {self.hold_key(seance_pk, date_seance, seat_pk): seat_pk for seat_pk in seats}
+        held = {keys[key]: user_pk for key, user_pk in self.cache.get_many(list(keys)).items()}
+        if len(held) < len(seats):
+            self.cache.set(self.seance_key(seance_pk, date_seance), set(held), self.timeout.total_seconds())
+        return held
+
+    def sweep(self):
+        return 0
+
+
+_backend = None
+
+
+def get_hold_backend():
+    """Returns instance of backend, set in SEAT_HOLD_BACKEND setting"""
+    global _backend
+    if _backend is None:
+        _backend = import_string(SEAT_HOLD_BACKEND)()
+    return _backend
+
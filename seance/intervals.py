@@ -0,0 +1,135 @@
+import datetime
+from bisect import bisect_left, bisect_right
+
+MINUTES_IN_DAY = 24 * 60
+
+
+def minute_of_day(time):
+    return time.hour * 60 + time.minute
+
+
+def time_of_minute(minutes):
+    """Returns time of day for minutes from the beginning of the day, minutes after midnight are wrapped"""
+    minutes %= MINUTES_IN_DAY
+    return datetime.time(minutes // 60, minutes % 60)
+
+
+def split_at_midnight(time_starts, time_ends, date_starts, date_ends):
+    """
+    Converts occupancy of hall from time_starts to time_ends on dates from date_starts to date_ends into
+    intervals (starts, ends, date_starts, date_ends) in minutes of day. If occupancy goes through midnight,
+    it's split into two intervals and the part after midnight happens on the next dates
+    """
+    return split_minutes(minute_of_day(time_starts), minute_of_day(time_ends), date_starts, date_ends)
+
+
+def split_minutes(starts, ends, date_starts, date_ends):
+    """The same as split_at_midnight for minutes of day, ends may also be given as minutes after midnight"""
+    ends %= MINUTES_IN_DAY
+    if starts < ends:
+        return [(starts, ends, date_starts, date_ends)]
+    intervals = [(starts, MINUTES_IN_DAY, date_starts, date_ends)]
+    if ends:
+        next_day = datetime.timedelta(days=1)
+        intervals.append((0, ends, date_starts + next_day, date_ends + next_day))
+    return intervals
+
+
+class SeanceIntervals:
+    """
+    Occupancy of one hall by seances: intervals [time_starts, time_hall_free) in minutes of day, scoped by
+    dates of seance bases. Intervals are sorted by start, so intervals, which intersect given one, are found
+    with binary search: they start before its end and not earlier, than its start minus the longest interval
+    """
+    def __init__(self, seances):
+        """:param seances: iterable of (key, time_starts, time_hall_free, date_starts, date_ends)"""
+        intervals = []
+        for key, time_starts, time_hall_free, date_starts, date_ends in seances:
+            for interval in split_at_midnight(time_starts, time_hall_free, date_starts, date_ends):
+                intervals.append(interval + (key, ))
+        intervals.sort(key=lambda interval: interval[0])
+        self.intervals = intervals
+        self.starts = [interval[0] for interval in intervals]
+        self.max_length = max([ends - starts for starts, ends, *_ in intervals], default=0)
+
+    def conflicts(self, time_starts, time_hall_free, date_starts, date_ends, exclude=None):
+        """Returns set of keys of seances, which occupy the hall at the same time on at least one common date"""
+        keys = set()
+        for starts, ends, dates_from, dates_to in split_at_midnight(time_starts, time_hall_free,
+                                                                    date_starts, date_ends):
+            first = bisect_right(self.starts, starts - self.max_length)
+            last = bisect_left(self.starts, ends)
+            for other_starts, other_ends, other_from, other_to, key in self.intervals[first:last]:
+                if other_ends > starts and other_from <= dates_to and other_to >= dates_from and key != exclude:
+                    keys.add(key)
+        return keys
+
+    def batch_conflicts(self, seances):
+        """
+        Checks list of proposed seances (time_starts, time_hall_free, date_starts, date_ends) against the hall
+        and against each other.
+        :return: list of dicts {'seances': keys of conflicting seances, 'proposals': indexes of conflicting
+        proposals} in order of proposals
+        """
+        proposals = SeanceIntervals((index, ) + tuple(seance) for index, seance in enumerate(seances))
+        return [{'seances': self.conflicts(*seance),
+                 'proposals': proposals.conflicts(*seance, exclude=index)}
+                for index, seance in enumerate(seances)]
+
+
+def pack_seances(films, busy, opens, closes, step=5):
+    """
+    Packs seances of films into the hall from opens till closes (minutes of day, closes is greater than
+    MINUTES_IN_DAY, if the hall works after midnight), avoiding busy intervals (as split_minutes returns them).
+    Films take turns: the film with the least seances goes next and starts at the earliest free minute, which is
+    multiple of step. For films of the same length it gives maximal quantity of seances. A film, which doesn't
+    fit anymore, drops out. Every seance starts before midnight.
+    :param films: list of (key, length in minutes including advertisements and cleaning, date_starts, date_ends)
+    :return: list of (key, starts) sorted by starts
+    """
+    busy = list(busy)
+    counts = [0] * len(films)
+    active = set(range(len(films)))
+    packed = []
+    while active:
+        index = min(active, key=lambda film_index: (counts[film_index], film_index))
+        key, length, date_starts, date_ends = films[index]
+        starts = _first_gap(_busy_on_dates(busy, date_starts, date_ends), length, opens,
+                            min(closes, opens + MINUTES_IN_DAY), step)
+        if starts is None:
+            active.discard(index)
+            continue
+        counts[index] += 1
+        packed.append((key, starts))
+        busy.extend(split_minutes(starts, starts + length, date_starts, date_ends))
+    packed.sort(key=lambda seance: seance[1])
+    return packed
+
+
+def _busy_on_dates(busy, date_starts, date_ends):
+    """
+    Projects busy intervals, which happen on dates from date_starts to date_ends or on the next dates,
+    onto one axis of minutes from the beginning of the day: next day's ones are shifted by MINUTES_IN_DAY
+    """
+    intervals = []
+    for shift in (0, 1):
+        dates_from = date_starts + datetime.timedelta(days=shift)
+        dates_to = date_ends + datetime.timedelta(days=shift)
+        intervals.extend((starts + shift * MINUTES_IN_DAY, ends + shift * MINUTES_IN_DAY)
+                         for starts, ends, other_from, other_to in busy
+                         if other_from <= dates_to and other_to >= dates_from)
+    intervals.sort()
+    return intervals
+
+
+def _first_gap(intervals, length, opens, closes, step):
+    """Returns the earliest start (multiple of step, before midnight) of free gap of length or None"""
+    cursor = opens
+    for starts, ends in intervals + [(closes, closes)]:
+        cursor = -(-cursor // step) * step
+        if cursor >= MINUTES_IN_DAY or cursor + length > closes:
+            return None
+        if cursor + length <= starts:
+            return cursor
+        cursor = max(cursor, ends)
+    return None
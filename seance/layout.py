@@ -0,0 +1,59 @@
+import uuid
+
+from django.core.cache import cache
+
+
+def hall_layout_generation_key(hall_pk):
+    return f'hall:{hall_pk}:layout-generation'
+
+
+def hall_layout_key(hall_pk, generation):
+    return f'hall:{hall_pk}:layout:{generation}'
+
+
+def get_layout_generation(hall_pk):
+    """
+    Returns generation of layout of the hall, it's a part of layout's key. Changing generation invalidates
+    cached layout, and layout, built from seats before their change, is cached with the old generation
+    """
+    key = hall_layout_generation_key(hall_pk)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        generation = cache.get(key)
+    return generation
+
+
+def build_layout(seats):
+    """
+    Builds precomputed layout of hall from rows (pk, row, number, category_pk, category_name, category_color)
+    of its seats, ordered by row and number. Ordinal of seat is its position in that order.
+    :return: {'version', 'rows': [{'row', 'seats': [{'pk', 'number', 'category', 'ordinal'}]}],
+    'palette': {category_pk: {'name', 'color'}}, 'seats': [seat_pk, ...], 'index': {seat_pk: ordinal}}
+    """
+    rows, palette, seat_pks = [], {}, []
+    for pk, row, number, category_pk, category_name, category_color in seats:
+        if not rows or rows[-1]['row'] != row:
+            rows.append({'row': row, 'seats': []})
+        rows[-1]['seats'].append({'pk': pk, 'number': number, 'category': category_pk, 'ordinal': len(seat_pks)})
+        palette[category_pk] = {'name': category_name, 'color': category_color}
+        seat_pks.append(pk)
+    return {'version': uuid.uuid4().hex,
+            'rows': rows,
+            'palette': palette,
+            'seats': seat_pks,
+            'index': {seat_pk: ordinal for ordinal, seat_pk in enumerate(seat_pks)}}
+
+
+def layout_seats_data(layout):
+    """Returns seats of layout in the same shape, as seance.API.serializers.SeatModelSerializer does"""
+    palette = layout['palette']
+    return [{'id': seat['pk'],
+             'seat_category': palette[seat['category']],
+             'number': seat['number'],
+             'row': row['row']}
+            for row in layout['rows'] for seat in row['seats']]
+
+
+def invalidate_layouts(hall_pks):
+    cache.set_many({hall_layout_generation_key(hall_pk): uuid.uuid4().hex for hall_pk in hall_pks}, None)
@@ -0,0 +1,95 @@
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction, connection as db_connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from cinema.settings import TICKET_EMAIL_BATCH_SIZE, TICKET_EMAIL_MAX_ATTEMPTS, TICKET_EMAIL_CLAIM_TIMEOUT
+from seance.models import Purchase
+from seance.utilities import render_tickets_letter
+
+
+def queue_ticket_emails(purchase_pks):
+    """Queues letters with tickets of purchases, they are sent by deliver_ticket_emails"""
+    return Purchase.objects.filter(pk__in=purchase_pks).update(email_status=Purchase.EMAIL_PENDING)
+
+
+def claim_ticket_emails(batch_size, max_attempts=TICKET_EMAIL_MAX_ATTEMPTS, claim_timeout=TICKET_EMAIL_CLAIM_TIMEOUT):
+    """
+    Marks the oldest pending letters as being sent and counts the attempt, so other workers don't take them.
+    Letters, which are sending longer than claim_timeout seconds, were left by crashed worker and are taken again,
+    unless their attempts are over: then they are marked failed.
+    :return: pks of purchases of the claimed letters
+    """
+    now = timezone.now()
+    stale = Q(email_status=Purchase.EMAIL_SENDING, email_claimed_at__lt=now - timezone.timedelta(seconds=claim_timeout))
+    with transaction.atomic():
+        Purchase.objects.filter(stale, email_attempts__gte=max_attempts).update(email_status=Purchase.EMAIL_FAILED)
+        skip_locked = db_connection.features.has_select_for_update_skip_locked
+        claimable = Purchase.objects.select_for_update(skip_locked=skip_locked).filter(
+            Q(email_status=Purchase.EMAIL_PENDING) | stale)
+        pks = list(claimable.order_by('created_at').values_list('pk', flat=True)[:batch_size])
+        Purchase.objects.filter(pk__in=pks).update(email_status=Purchase.EMAIL_SENDING, email_claimed_at=now,
+                                                   email_attempts=F('email_attempts') + 1)
+    return pks
+
+
+def reopen(connection):
+    """Reopens connection, which could be broken by failed letter. If server isn't available, letters open it"""
+    connection.close()
+    try:
+        connection.open()
+    except OSError:
+        pass
+
+
+def send_ticket_emails(connection, purchase_pks):
+    """
+    Sends letters of purchases over open connection one by one, so failure of one letter doesn't fail others.
+    :return: (pks of sent, pks of failed, pks of purchases, whose users have no email)
+    """
+    sent, failed, undeliverable = [], [], []
+    purchases = Purchase.objects.filter(pk__in=purchase_pks).select_related('user').with_tickets()
+    for purchase in purchases.order_by('created_at'):
+        if not purchase.user.email:
+            undeliverable.append(purchase.pk)
+            continue
+        subject, body_text = render_tickets_letter(purchase.user, purchase)
+        try:
+            connection.send_messages([EmailMessage(subject, body_text, to=[purchase.user.email],
+                                                   connection=connection)])
+        except (OSError, ValueError):
+            failed.append(purchase.pk)
+            reopen(connection)
+        else:
+            sent.append(purchase.pk)
+    return sent, failed, undeliverable
+
+
+def deliver_ticket_emails(batch_size=TICKET_EMAIL_BATCH_SIZE, max_attempts=TICKET_EMAIL_MAX_ATTEMPTS,
+                          connection=None):
+    """
+    Drains pending letters with tickets by batches over one connection to mail server.
+    Delivery state is saved for every purchase after its batch. Failed letters are queued again only after
+    all pending ones are drained, so they are retried by the next run, till they fail max_attempts times.
+    :return: quantity of sent letters
+    """
+    connection = connection or get_connection(fail_silently=False)
+    total_sent = 0
+    retry = []
+    with connection:
+        while True:
+            purchase_pks = claim_ticket_emails(batch_size, max_attempts)
+            if not purchase_pks:
+                break
+            sent, failed, undeliverable = send_ticket_emails(connection, purchase_pks)
+            Purchase.objects.filter(pk__in=sent).update(email_status=Purchase.EMAIL_SENT, emailed_at=timezone.now())
+            Purchase.objects.filter(pk__in=undeliverable).update(email_status=Purchase.EMAIL_FAILED)
+            Purchase.objects.filter(pk__in=failed, email_attempts__gte=max_attempts).update(
+                email_status=Purchase.EMAIL_FAILED)
+            retry.append(failed)
+            total_sent += len(sent)
+
+    for failed in retry:
+        Purchase.objects.filter(pk__in=failed, email_status=Purchase.EMAIL_SENDING).update(
+            email_status=Purchase.EMAIL_PENDING)
+    return total_sent
@@ -0,0 +1,83 @@
+import statistics
+import time
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.test import Client
+from django.urls import reverse
+
+from cinema.settings import ALLOWED_HOSTS
+from seance.middlewares import seance_context_processor
+from seance.models import AdvUser
+
+# pages of myadmin, which don't use values of seance_context_processor
+MYADMIN_PAGES = ('main', 'hall_list', 'seance_list', 'seance_base_list', 'price_list', 'seat_category_crud',
+                 'film_list', 'film_create', 'seance_create')
+
+
+def eager_processor(request):
+    """seance_context_processor, which computes all its values at once, as it did before they became lazy"""
+    context = seance_context_processor(request)
+    for value in context.values():
+        bool(value)
+    return context
+
+
+class Command(BaseCommand):
+    help = 'Compares render time of myadmin pages with lazy and eager values of seance_context_processor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pages', nargs='*', default=MYADMIN_PAGES, help='names of myadmin urls without arguments')
+        parser.add_argument('--admin', help='username of staff user, the first superuser by default')
+        parser.add_argument('--repeat', type=int, default=50, help='renders of every page in each mode')
+        parser.add_argument('--host', default=ALLOWED_HOSTS[0] if ALLOWED_HOSTS else 'localhost',
+                            help='host of requests, must be allowed')
+
+    def get_admin(self, username):
+        admins = AdvUser.objects.filter(is_staff=True)
+        admin = admins.filter(username=username).first() if username else admins.filter(is_superuser=True).first()
+        if admin is None:
+            raise CommandError('There is no such staff user')
+        return admin
+
+    @staticmethod
+    def render_time(client, url):
+        """Returns time of response of the page in milliseconds"""
+        started = time.perf_counter()
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f'{url} responded with {response.status_code}')
+        return (time.perf_counter() - started) * 1000
+
+    def handle(self, *args, **options):
+        client = Client(HTTP_HOST=options['host'])
+        client.force_login(self.get_admin(options['admin']))
+        engine = engines['django'].engine
+        lazy_processors = engine.template_context_processors
+        eager_processors = tuple(eager_processor if processor is seance_context_processor else processor
+                                 for processor in lazy_processors)
+
+        # processor alone, on request of myadmin main page
+        request = client.get(reverse('myadmin:main')).wsgi_request
+        for name, processor in (('lazy', seance_context_processor), ('eager', eager_processor)):
+            seconds = timeit.timeit(lambda: processor(request), number=options['repeat'] * 100)
+            self.stdout.write(f'processor ({name}): {seconds * 10 ** 6 / (options["repeat"] * 100):.1f} us')
+
+        for page in options['pages']:
+            url = reverse(f'myadmin:{page}')
+            # warm up caches and compiled templates
+            self.render_time(client, url)
+            lazy, eager = [], []
+            # modes take turns, so both of them are equally affected by noise
+            try:
+                for _ in range(options['repeat']):
+                    engine.template_context_processors = eager_processors
+                    eager.append(self.render_time(client, url))
+                    engine.template_context_processors = lazy_processors
+                    lazy.append(self.render_time(client, url))
+            finally:
+                engine.template_context_processors = lazy_processors
+            lazy, eager = statistics.median(lazy), statistics.median(eager)
+            self.stdout.write(f'{page}: lazy {lazy:.2f} ms, eager {eager:.2f} ms (medians), '
+                              f'saved {eager - lazy:.2f} ms ({(eager - lazy) / eager:.1%})')
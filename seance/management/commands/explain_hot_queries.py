@@ -0,0 +1,68 @@
+import datetime
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from seance.models import Seance, SeanceBase, Ticket, Price, Purchase
+
+# patterns of full table scan in plans of databases, group 'table' is the scanned table.
+# sqlite reads the whole index in SCAN ... USING INDEX too, only SEARCH is an indexed lookup
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(?P<table>\w+)'),
+    'postgresql': re.compile(r'\bSeq Scan on (?P<table>\w+)'),
+    'mysql': re.compile(r'^\w+\t\w+\t(?P<table>\w+)\t\S*\tALL\t'),
+}
+
+
+def get_hot_queries():
+    """Returns list of (name, queryset) with the shapes of the hottest queries of the site"""
+    today = datetime.date.today()
+    return [
+        ('tickets of seance on date', Ticket.objects.filter(seance_id=1, date_seance=today, was_returned=False)
+            .values_list('seat_id', flat=True)),
+        ('sold tickets of seance in dates', Ticket.objects.filter(seance_id=1, date_seance__gte=today,
+                                                                  date_seance__lte=today).values_list('pk')),
+        ('active seances in dates', Seance.objects.filter(is_active=True, seance_base__date_starts__lte=today,
+                                                          seance_base__date_ends__gte=today).values_list('pk')),
+        ('board of the day', Seance.get_active_seances_for_day(today).values_list('pk')),
+        ('seance bases of hall in dates', SeanceBase.objects.filter(hall_id=1, date_starts__lte=today,
+                                                                     date_ends__gte=today).values_list('pk')),
+        ('seance bases of film in dates', SeanceBase.objects.filter(film_id=1, date_starts__lte=today,
+                                                                     date_ends__gte=today).values_list('pk')),
+        ('price of seat category on seance', Price.objects.filter(seance_id=1, seat_category_id=1)
+            .values_list('price')),
+        ('purchases of user', Purchase.objects.filter(user_id=1).order_by('-created_at').values_list('pk')[:10]),
+    ]
+
+
+def find_full_scans(plan, vendor=None):
+    """Returns names of tables, which are scanned fully according to plan of query"""
+    pattern = FULL_SCAN_PATTERNS.get(vendor or connection.vendor)
+    if pattern is None:
+        return []
+    return [match.group('table') for match in map(pattern.search, plan.splitlines()) if match]
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN for the hottest queries against the configured database and reports full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fail', action='store_true', help='exit with error, if there are full scans')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in FULL_SCAN_PATTERNS:
+            raise CommandError(f'Plans of {connection.vendor} database are not supported')
+        flagged = 0
+        for name, queryset in get_hot_queries():
+            plan = queryset.explain()
+            tables = find_full_scans(plan)
+            if tables:
+                flagged += 1
+                self.stdout.write(self.style.ERROR(f'{name}: full scan of {", ".join(tables)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+            if options['verbosity'] > 1:
+                self.stdout.write(plan)
+        if flagged and options['fail']:
+            raise CommandError(f'{flagged} queries scan full tables')
@@ -0,0 +1,57 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from seance.models import SeanceBase
+from seance.schedule import generate_schedule, import_schedule
+
+
+def parse_time(value):
+    try:
+        return datetime.datetime.strptime(value, '%H:%M').time()
+    except ValueError:
+        raise CommandError(f'{value} is not a time in format HH:MM')
+
+
+class Command(BaseCommand):
+    help = 'Proposes packed schedule of seances for seance bases and creates it with --commit'
+
+    def add_arguments(self, parser):
+        parser.add_argument('seance_bases', nargs='+', type=int, help='pk\'s of seance bases')
+        parser.add_argument('--opens', default='09:00', help='time, when halls open, HH:MM')
+        parser.add_argument('--closes', default='00:00', help='time, when halls close, HH:MM')
+        parser.add_argument('--advertisements', default='00:10', help='advertisements duration, HH:MM')
+        parser.add_argument('--cleaning', default='00:10', help='cleaning duration, HH:MM')
+        parser.add_argument('--step', type=int, default=5, help='seances start at minutes, multiple of step')
+        parser.add_argument('--commit', metavar='ADMIN', help='create seances on behalf of admin with the username')
+
+    def handle(self, *args, **options):
+        seance_bases = SeanceBase.objects.filter(pk__in=options['seance_bases'])
+        if len(seance_bases) != len(set(options['seance_bases'])):
+            raise CommandError(f'There is no seance base with some of given pk\'s: {options["seance_bases"]}')
+        if options['step'] < 1:
+            raise CommandError('Step has to be positive')
+        admin = None
+        if options['commit']:
+            admin = get_user_model().objects.filter(username=options['commit'], is_staff=True).first()
+            if not admin:
+                raise CommandError(f'There is no admin {options["commit"]}')
+
+        schedule = generate_schedule(seance_bases, parse_time(options['opens']), parse_time(options['closes']),
+                                     parse_time(options['advertisements']), parse_time(options['cleaning']),
+                                     options['step'])
+        for seance_base, seances in schedule.items():
+            self.stdout.write(f'{seance_base.film.title} in {seance_base.hall.name} '
+                              f'({seance_base.date_starts} - {seance_base.date_ends}): {len(seances)} seances')
+            for seance in seances:
+                self.stdout.write(f'    {seance.time_starts:%H:%M} - {seance.time_ends:%H:%M}, '
+                                  f'hall is free at {seance.time_hall_free:%H:%M}')
+            if admin and seances:
+                rows = [{'time_starts': seance.time_starts, 'advertisements_duration': seance.advertisements_duration,
+                         'cleaning_duration': seance.cleaning_duration} for seance in seances]
+                result = import_schedule(seance_base, rows, admin)
+                if result['success']:
+                    self.stdout.write(self.style.SUCCESS(f'    created {len(result["seances"])} seances'))
+                else:
+                    self.stdout.write(self.style.ERROR('    not created, schedule of the hall has changed'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from seance.models import Purchase
+
+
+class Command(BaseCommand):
+    help = 'Recounts stored total prices of purchases and money spent by users from tickets'
+
+    def handle(self, *args, **options):
+        purchases, users = Purchase.reconcile_totals()
+        self.stdout.write(f'Fixed total price of {purchases} purchases and money spent by {users} users')
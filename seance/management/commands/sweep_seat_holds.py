@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from seance.holds import get_hold_backend
+
+
+class Command(BaseCommand):
+    help = 'Removes expired holds of seats, put into baskets'
+
+    def handle(self, *args, **options):
+        swept = get_hold_backend().sweep()
+        self.stdout.write(f'Removed {swept} expired seat holds')
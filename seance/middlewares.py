@@ -1,55 +1,80 @@
 import datetime
+import time
+
 from django.contrib import messages
 from django.contrib.auth import logout
+from django.utils.functional import SimpleLazyObject
 from django.utils.translation import gettext_lazy as _
 
-from cinema.settings import INACTIVITY_NOT_SUPERUSER_LOGOUT_FOR as TIME_LOGOUT
+from cinema.settings import INACTIVITY_NOT_SUPERUSER_LOGOUT_FOR as TIME_LOGOUT, LAST_ACTIVITY_REFRESH, \
+    LAST_ACTIVITY_PERSIST
+from seance.activity import record_activity
+from seance.sessions import get_basket_store, get_signed_value, basket_total
 
 
 class LogoutIfInActiveMiddleware:
+    """
+    Logs out not superusers, which were inactive for INACTIVITY_NOT_SUPERUSER_LOGOUT_FOR.
+    Last activity is kept in session as epoch seconds and is rewritten only once in LAST_ACTIVITY_REFRESH seconds,
+    so most requests don't save session. If LAST_ACTIVITY_PERSIST is on, it's also put to AdvUser.last_activity
+    by batches (see seance.activity)
+    """
     def __init__(self, get_response):
         self.get_response = get_response
-        # One-time configuration and initialization.
+        self.timeout = TIME_LOGOUT.total_seconds()
+
+    @staticmethod
+    def get_last_activity(request):
+        """Returns epoch seconds of last activity from session, sessions with old string format are read too"""
+        last_activity = request.session.get('last_activity')
+        if isinstance(last_activity, str):
+            try:
+                return int(datetime.datetime.strptime(last_activity, '%Y-%m-%d %H:%M:%S.%f').timestamp())
+            except ValueError:
+                return None
+        return last_activity
 
     def __call__(self, request):
-        # Code to be executed for each request before
-        # the view (and later middleware) are called.
+        now = int(time.time())
         if request.user.is_authenticated and not request.user.is_superuser:
-            last_activity = request.session.get('last_activity')        # we got it in type "str"
-            if last_activity:
-                last_activity = datetime.datetime.strptime(last_activity, '%Y-%m-%d %H:%M:%S.%f')
-                if last_activity > datetime.datetime.now() - TIME_LOGOUT:
-                    request.session['last_activity'] = str(datetime.datetime.now())
-                else:
-                    logout(request)
-                    messages.add_message(request, messages.INFO, _(f'More than {str(TIME_LOGOUT)} minutes inactive. '
-                                                                   'Please login again'))
-            else:
+            last_activity = self.get_last_activity(request)
+            if not last_activity:
                 logout(request)
                 messages.add_message(request, messages.INFO, _(f'Request does not contain last_activity, but must'))
+            elif now - last_activity > self.timeout:
+                logout(request)
+                messages.add_message(request, messages.INFO, _(f'More than {str(TIME_LOGOUT)} minutes inactive. '
+                                                               'Please login again'))
 
         response = self.get_response(request)
 
-        # Code to be executed for each request/response after
-        # the view is called.
+        # user could log in or log out in the view
         if request.user.is_authenticated and not request.user.is_superuser:
-            request.session['last_activity'] = str(datetime.datetime.now())
+            last_activity = self.get_last_activity(request)
+            if not last_activity or now - last_activity >= LAST_ACTIVITY_REFRESH:
+                request.session['last_activity'] = now
+                if LAST_ACTIVITY_PERSIST:
+                    record_activity(request.user.pk, now)
         return response
 
 
-def seance_context_processor(request):
-    context = {}
-    basket = request.session.get('basket', None)
-    last_seance = request.session.get('last_seance', None)
-    seance_date = request.session.get('seance_date', None)
-    total_price = request.session.get('total_price', None)
-    if basket:
-        context['basket'] = basket
-    if total_price:
-        context['total_price'] = total_price
-    if last_seance:
-        context['last_seance'] = last_seance
-    if seance_date:
-        context['seance_date'] = seance_date
-    return context
+def lazy_value(func):
+    """
+    Value of context, which is computed, when template uses it for the first time.
+    Missing value is an empty string, as variables, which aren't in context, are rendered by templates
+    """
+    return SimpleLazyObject(lambda: func() or '')
+
 
+def seance_context_processor(request):
+    """
+    Adds basket of the user and signed cookies with date of the board and last seance to context.
+    Values are lazy, so pages, which don't use them (e.g. myadmin), don't load user or basket for them
+    """
+    basket = lazy_value(lambda: get_basket_store().get(request.user.pk) if request.user.is_authenticated else None)
+    return {
+        'basket': basket,
+        'total_price': lazy_value(lambda: basket_total(basket)),
+        'last_seance': lazy_value(lambda: get_signed_value(request, 'last_seance')),
+        'seance_date': lazy_value(lambda: get_signed_value(request, 'seance_date')),
+    }
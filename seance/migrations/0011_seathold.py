@@ -0,0 +1,31 @@
+# Generated by Django 3.0.7 on 2026-10-18 02:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seance', '0010_auto_20200702_2207'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatHold',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_seance', models.DateField(verbose_name='date of seance')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='held till')),
+                ('seance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='seance.Seance', verbose_name='seance')),
+                ('seat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='seance.Seat', verbose_name='seat')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'seat hold',
+                'verbose_name_plural': 'seat holds',
+                'unique_together': {('seance', 'date_seance', 'seat')},
+            },
+        ),
+    ]
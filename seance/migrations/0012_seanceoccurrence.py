@@ -0,0 +1,57 @@
+# Generated by Django 3.0.7 on 2026-10-18 02:37
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_occurrences(apps, schema_editor):
+    # We use the historical versions of models, so occurrences are built here, not with SeanceOccurrence.sync
+    Seance = apps.get_model('seance', 'Seance')
+    SeanceOccurrence = apps.get_model('seance', 'SeanceOccurrence')
+
+    occurrences = []
+    for seance in Seance.objects.select_related('seance_base'):
+        seance_base = seance.seance_base
+        date_ends = seance_base.date_ends or seance_base.date_starts
+        for day in range((date_ends - seance_base.date_starts).days + 1):
+            occurrences.append(SeanceOccurrence(seance=seance, hall_id=seance_base.hall_id,
+                                                date=seance_base.date_starts + datetime.timedelta(days=day),
+                                                time_starts=seance.time_starts, is_active=seance.is_active))
+    SeanceOccurrence.objects.bulk_create(occurrences)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seance', '0011_seathold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeanceOccurrence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='date of seance')),
+                ('time_starts', models.TimeField(verbose_name='starts at ')),
+                ('is_active', models.BooleanField(default=False, verbose_name='in run?')),
+                ('hall', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='seance.Hall', verbose_name='hall')),
+                ('seance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='seance.Seance', verbose_name='seance')),
+            ],
+            options={
+                'verbose_name': 'seance occurrence',
+                'verbose_name_plural': 'seance occurrences',
+                'ordering': ('date', 'time_starts'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='seanceoccurrence',
+            index=models.Index(fields=['date', 'time_starts'], name='occurrence_date_time_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='seanceoccurrence',
+            unique_together={('seance', 'date')},
+        ),
+        migrations.RunPython(fill_occurrences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.0.7 on 2026-10-18 02:42
+
+from django.db import migrations, models
+from django.db.models import Min, Max, Count
+
+
+def fill_price_stats(apps, schema_editor):
+    Seance = apps.get_model('seance', 'Seance')
+    for seance in Seance.objects.annotate(min_prices=Min('prices__price'), max_prices=Max('prices__price'),
+                                          count_prices=Count('prices')).order_by():
+        Seance.objects.filter(pk=seance.pk).update(min_price=seance.min_prices, max_price=seance.max_prices,
+                                                   prices_count=seance.count_prices)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seance', '0012_seanceoccurrence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seance',
+            name='max_price',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True, verbose_name='max price'),
+        ),
+        migrations.AddField(
+            model_name='seance',
+            name='min_price',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True, verbose_name='min price'),
+        ),
+        migrations.AddField(
+            model_name='seance',
+            name='prices_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='quantity of priced seat categories'),
+        ),
+        migrations.RunPython(fill_price_stats, migrations.RunPython.noop),
+    ]
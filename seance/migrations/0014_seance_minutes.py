@@ -0,0 +1,51 @@
+# Generated by Django 3.0.7 on 2026-10-18 03:00
+
+from django.db import migrations, models
+
+
+def minutes(time):
+    return time.hour * 60 + time.minute if time else 0
+
+
+def fill_minutes(apps, schema_editor):
+    Film = apps.get_model('seance', 'Film')
+    Seance = apps.get_model('seance', 'Seance')
+    for film in Film.objects.all():
+        Film.objects.filter(pk=film.pk).update(duration_minutes=minutes(film.duration))
+    for seance in Seance.objects.all():
+        starts_minute = minutes(seance.time_starts)
+        ends_minute = starts_minute + (minutes(seance.time_ends) - starts_minute) % 1440
+        hall_free_minute = ends_minute + (minutes(seance.time_hall_free) - minutes(seance.time_ends)) % 1440
+        Seance.objects.filter(pk=seance.pk).update(starts_minute=starts_minute, ends_minute=ends_minute,
+                                                   hall_free_minute=hall_free_minute)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seance', '0013_seance_price_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='film',
+            name='duration_minutes',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='duration in minutes'),
+        ),
+        migrations.AddField(
+            model_name='seance',
+            name='ends_minute',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='ends at minute'),
+        ),
+        migrations.AddField(
+            model_name='seance',
+            name='hall_free_minute',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='hall free at minute'),
+        ),
+        migrations.AddField(
+            model_name='seance',
+            name='starts_minute',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False, verbose_name='starts at minute'),
+        ),
+        migrations.RunPython(fill_minutes, migrations.RunPython.noop),
+    ]
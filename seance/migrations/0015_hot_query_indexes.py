@@ -0,0 +1,29 @@
+# Generated by Django 3.0.7 on 2026-10-18 03:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seance', '0014_seance_minutes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['user', '-created_at'], name='purchase_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seance',
+            index=models.Index(fields=['is_active', 'seance_base'], name='seance_active_base_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seancebase',
+            index=models.Index(fields=['hall', 'date_starts', 'date_ends'], name='seance_base_hall_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seancebase',
+            index=models.Index(fields=['film', 'date_starts', 'date_ends'], name='seance_base_film_dates_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.0.7 on 2026-10-18 03:06
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    AdvUser = apps.get_model('seance', 'AdvUser')
+    Purchase = apps.get_model('seance', 'Purchase')
+    Ticket = apps.get_model('seance', 'Ticket')
+    Purchase.objects.update(total_price=Coalesce(Subquery(
+        Ticket.objects.filter(purchase=OuterRef('pk')).order_by().values('purchase').annotate(
+            total=Sum('price')).values('total')), Value(0.0)))
+    AdvUser.objects.update(money_spent=Coalesce(Subquery(
+        Ticket.objects.filter(purchase__user=OuterRef('pk'), purchase__was_returned=False).order_by().values(
+            'purchase__user').annotate(total=Sum('price')).values('total')), Value(0.0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seance', '0015_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advuser',
+            name='money_spent',
+            field=models.FloatField(default=0, editable=False, verbose_name='money spent'),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='total_price',
+            field=models.FloatField(default=0, editable=False, verbose_name='total price'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.0.7 on 2026-10-18 03:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seance', '0016_purchase_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Basket',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='basket', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='user')),
+                ('items', models.TextField(default='{}', verbose_name='items in json')),
+                ('updated_at', models.DateTimeField(verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name': 'basket',
+                'verbose_name_plural': 'baskets',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.0.7 on 2026-10-18 03:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seance', '0017_basket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase',
+            name='email_attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='attempts to send letter'),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='email_status',
+            field=models.CharField(blank=True, choices=[('pending', 'pending'), ('sending', 'sending'), ('sent', 'sent'), ('failed', 'failed')], db_index=True, max_length=8, verbose_name='letter with tickets'),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='emailed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='letter sent at'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.0.7 on 2026-10-18 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seance', '0018_purchase_email_status'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='ticket',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='ticket',
+            constraint=models.UniqueConstraint(condition=models.Q(was_returned=False), fields=('seance', 'date_seance', 'seat'), name='ticket_sold_seat_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-18 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seance', '0019_ticket_sold_seat_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase',
+            name='email_claimed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='letter taken for sending at'),
+        ),
+    ]
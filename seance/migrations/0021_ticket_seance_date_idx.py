@@ -0,0 +1,17 @@
+# Generated by Django 3.0.7 on 2026-10-18 04:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seance', '0020_purchase_email_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['seance', 'date_seance'], name='ticket_seance_date_idx'),
+        ),
+    ]
@@ -1,18 +1,22 @@
 import datetime
+
 from colorfield.fields import ColorField
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from django.db.models import Q, F, Min, Sum, Max
-from django.dispatch import Signal
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Q, F, Min, Sum, Max, Count, Prefetch, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save, post_delete
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
-from cinema.settings import DEFAULT_SUM_TO_WALLET
-from seance.utilities import get_timestamp_path, send_tickets
-
-
-purchase_created = Signal(providing_args=['instance'])
+from cinema.settings import DEFAULT_SUM_TO_WALLET, HALL_LAYOUT_CACHE_TIMEOUT
+from seance import occupancy
+from seance.board import invalidate_board
+from seance.intervals import MINUTES_IN_DAY, SeanceIntervals, minute_of_day, time_of_minute
+from seance.layout import hall_layout_key, get_layout_generation, build_layout, invalidate_layouts
+from seance.utilities import get_timestamp_path
 
 
 class AdvUser(AbstractUser):
@@ -21,6 +25,8 @@ class AdvUser(AbstractUser):
     was_deleted = models.BooleanField(default=False, verbose_name=_('was deleted?'))
     last_activity = models.DateTimeField(auto_now_add=True, blank=True, null=True,
                                          verbose_name=_('user\'s last activity was: '))
+    # sum of not returned purchases, maintained by purchases (see Purchase.add_to_totals)
+    money_spent = models.FloatField(default=0, editable=False, verbose_name=_('money spent'))
     # email_verified = models.BooleanField(default=False, verbose_name=_('Verified email?'))
 
     def delete(self, *args, **kwargs):
@@ -36,8 +42,11 @@ class AdvUser(AbstractUser):
 
     @property
     def sum_money_spent(self):
-        """Returns how much money user has spent"""
-        return sum([p.total_price for p in self.purchases.all()])
+        """
+        Returns how much money user has spent. Counter is updated in database with expressions,
+        so it's read from there, the instance may be stale
+        """
+        return AdvUser.objects.filter(pk=self.pk).values_list('money_spent', flat=True).first()
 
     def __str__(self):
         return self.username
@@ -48,6 +57,9 @@ class Film(models.Model):
     starring = models.CharField(max_length=200, verbose_name=_('starring'))
     director = models.CharField(max_length=100, verbose_name=_('director'))
     duration = models.TimeField(verbose_name=_('duration'))
+    # duration in minutes, maintained on saving, times of seances and generated schedules are counted with it
+    duration_minutes = models.PositiveSmallIntegerField(default=0, editable=False,
+                                                        verbose_name=_('duration in minutes'))
     description = models.TextField(verbose_name=_('description'))
     image = models.ImageField(blank=True, upload_to=get_timestamp_path, verbose_name=_('film picture'))
     created_at = models.DateTimeField(auto_now_add=True, editable=False, verbose_name=_('instance created at'))
@@ -58,6 +70,10 @@ class Film(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.duration_minutes = minute_of_day(self.duration)
+        super().save(*args, **kwargs)
+
     def delete(self, *args, **kwargs):
         """Delete additional images when delete film"""
         for ai in self.images.all():
@@ -102,13 +118,45 @@ class Hall(models.Model):
     def create_or_update_seats(self, seat_category, row, number_starts, number_ends):
         """Looks if there are already created seats for that conditions. If there are - updates them.
         If there isn't - creates"""
-        for num in range(number_starts, number_ends + 1):
-            seat_created = Seat.objects.filter(Q(hall_id=self.pk) & Q(row=row) & Q(number=num))
-            if seat_created:
-                seat_created[0].seat_category = seat_category
-                seat_created[0].save()
-            else:
-                Seat.objects.create(hall_id=self.pk, seat_category=seat_category, number=num, row=row)
+        self.apply_seats_layout([(row, number_starts, number_ends, seat_category.pk)])
+
+    def apply_seats_layout(self, seat_ranges, replace=False):
+        """
+        Applies spec of seats to the hall in one transaction, as a diff with seats already created.
+        :param seat_ranges: iterable of (row, number_starts, number_ends, seat_category_pk)
+        :param replace: if True, seats which are not in seat_ranges are deleted
+        Existing seats get new category with one update per range, absent seats are created with bulk insert,
+        so number of queries doesn't depend on quantity of seats
+        :return: new layout of the hall
+        """
+        seat_ranges = list(seat_ranges)
+        wanted = {}
+        for row, number_starts, number_ends, seat_category_pk in seat_ranges:
+            for number in range(number_starts, number_ends + 1):
+                wanted[(row, number)] = seat_category_pk
+
+        with transaction.atomic():
+            existing = {(row, number): (pk, seat_category_pk) for pk, row, number, seat_category_pk in
+                        Seat.objects.select_for_update().filter(hall_id=self.pk).values_list(
+                            'pk', 'row', 'number', 'seat_category_id')}
+
+            for row, number_starts, number_ends, seat_category_pk in seat_ranges:
+                if any(existing[(row, number)][1] != seat_category_pk
+                       for number in range(number_starts, number_ends + 1) if (row, number) in existing):
+                    Seat.objects.filter(Q(hall_id=self.pk) & Q(row=row) & Q(number__gte=number_starts) &
+                                        Q(number__lte=number_ends)).update(seat_category_id=seat_category_pk)
+
+            Seat.objects.bulk_create([Seat(hall_id=self.pk, row=row, number=number, seat_category_id=seat_category_pk)
+                                      for (row, number), seat_category_pk in wanted.items()
+                                      if (row, number) not in existing])
+
+            if replace:
+                obsolete_seats = [seat[0] for place, seat in existing.items() if place not in wanted]
+                Seat.objects.filter(pk__in=obsolete_seats).delete()
+
+        # bulk operations don't send signals, so layout is invalidated here
+        invalidate_layouts([self.pk])
+        return Hall.get_layout(self.pk)
 
     def get_seat_categories(self):
         """Returns queryset of all seat categories, available for seats of hall"""
@@ -120,15 +168,33 @@ class Hall(models.Model):
 
     def activate_hall(self):
         """Checks that all seats for hall are created and if True, sets is_active=True"""
-        uncreated_seats_quantity = self.quantity_seats - self.seats.count()
+        layout = Hall.get_layout(self.pk)
+        uncreated_seats_quantity = self.quantity_seats - len(layout['seats'])
         if not uncreated_seats_quantity:
             self.is_active = True
             self.save()
-        created_seats = [(seat.row, seat.number, seat.seat_category.name) for seat in self.seats.all()]
+        created_seats = [(row['row'], seat['number'], layout['palette'][seat['category']]['name'])
+                         for row in layout['rows'] for seat in row['seats']]
         return {'uncreated_seats': uncreated_seats_quantity,
                 'success': self.is_active,
                 'created_seats': created_seats}
 
+    @staticmethod
+    def get_layout(hall_pk):
+        """
+        Returns precomputed layout of hall's seats (see seance.layout.build_layout), built with one query.
+        It is cached for HALL_LAYOUT_CACHE_TIMEOUT or until seats of the hall or their categories are changed.
+        Processes, which don't share cache, see the change after the timeout
+        """
+        key = hall_layout_key(hall_pk, get_layout_generation(hall_pk))
+        layout = cache.get(key)
+        if layout is None:
+            seats = Seat.objects.filter(hall_id=hall_pk).values_list('pk', 'row', 'number', 'seat_category_id',
+                                                                     'seat_category__name', 'seat_category__color')
+            layout = build_layout(seats)
+            cache.set(key, layout, HALL_LAYOUT_CACHE_TIMEOUT)
+        return layout
+
     @property
     def can_deactivate(self):
         """If hall is not used in seance_base objects, we can set its parameter is_active to False"""
@@ -177,6 +243,9 @@ class SeanceBase(models.Model):
 
     class Meta:
         ordering = ('-updated_at', )
+        # schedule of hall and runs of film are looked up by dates
+        indexes = [models.Index(fields=['hall', 'date_starts', 'date_ends'], name='seance_base_hall_dates_idx'),
+                   models.Index(fields=['film', 'date_starts', 'date_ends'], name='seance_base_film_dates_idx')]
 
     def save(self, *args, **kwargs):
         """
@@ -242,9 +311,27 @@ class Seance(models.Model):
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_('instance updated at'))
     admin = models.ForeignKey(AdvUser, on_delete=models.PROTECT, verbose_name=_('instance created by'),
                               related_name='seances')
+    # stats of prices of the seance, maintained on saving and deleting of prices
+    min_price = models.FloatField(null=True, blank=True, editable=False, db_index=True,
+                                  verbose_name=_('min price'))
+    max_price = models.FloatField(null=True, blank=True, editable=False, db_index=True,
+                                  verbose_name=_('max price'))
+    prices_count = models.PositiveIntegerField(default=0, editable=False,
+                                               verbose_name=_('quantity of priced seat categories'))
+
+    # times as minutes from the beginning of the day of time_starts, maintained on saving.
+    # For seances through midnight ends_minute and hall_free_minute are greater than MINUTES_IN_DAY
+    starts_minute = models.PositiveSmallIntegerField(default=0, editable=False, db_index=True,
+                                                     verbose_name=_('starts at minute'))
+    ends_minute = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name=_('ends at minute'))
+    hall_free_minute = models.PositiveSmallIntegerField(default=0, editable=False,
+                                                        verbose_name=_('hall free at minute'))
+
+    PRICE_STATS_FIELDS = ('min_price', 'max_price', 'prices_count')
 
     class Meta:
         ordering = ('time_starts', )
+        indexes = [models.Index(fields=['is_active', 'seance_base'], name='seance_active_base_idx')]
         verbose_name = _('seance')
         verbose_name_plural = _('seances')
 
@@ -252,7 +339,7 @@ class Seance(models.Model):
         """
         Adds time_ends if it wasn't added by admin
         """
-        if not self.id:
+        if self._state.adding:
             if not self.advertisements_duration:
                 self.advertisements_duration = datetime.time(0, 10)
             if not self.cleaning_duration:
@@ -261,65 +348,89 @@ class Seance(models.Model):
                 self.time_ends = self.get_time_ends
             if not self.time_hall_free:
                 self.time_hall_free = self.get_time_hall_free
+        self.set_minutes()
         if commit:
+            if not self._state.adding and not kwargs.get('force_insert') and not kwargs.get('update_fields'):
+                # price stats are maintained by prices, stale values of the instance mustn't overwrite them
+                kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                           if not field.primary_key and field.name not in self.PRICE_STATS_FIELDS]
             super().save(*args, **kwargs)
 
+    @staticmethod
+    def update_price_stats(seance_pk):
+        """Recounts min_price, max_price and prices_count of the seance with one aggregation"""
+        stats = Price.objects.filter(seance_id=seance_pk).aggregate(min_price=Min('price'), max_price=Max('price'),
+                                                                   prices_count=Count('pk'))
+        Seance.objects.filter(pk=seance_pk).update(**stats)
+
+    def set_minutes(self):
+        """Counts starts_minute, ends_minute and hall_free_minute from times of seance"""
+        self.starts_minute = minute_of_day(self.time_starts)
+        self.ends_minute = self.starts_minute + (minute_of_day(self.time_ends) - self.starts_minute) % MINUTES_IN_DAY
+        self.hall_free_minute = self.ends_minute + (minute_of_day(self.time_hall_free) -
+                                                    minute_of_day(self.time_ends)) % MINUTES_IN_DAY
+
     @property
     def get_time_ends(self):
-        """Count time_ends of seance"""
-        minutes = (self.time_starts.minute + self.seance_base.film.duration.minute +
-                   self.advertisements_duration.minute)
-
-        # if value of minutes is more then 60, add integer part of it to hours
-        hours = (self.time_starts.hour + self.seance_base.film.duration.hour +
-                 self.advertisements_duration.hour + minutes // 60) % 24
-
-        # fractional part will be less then 60, so we leave it as minutes value
-        minutes %= 60
-        time_ends = datetime.time(hour=hours, minute=minutes)
-        return time_ends
+        """Count time_ends of seance, after midnight time goes on from 00:00"""
+        return time_of_minute(minute_of_day(self.time_starts) + self.seance_base.film.duration_minutes +
+                              minute_of_day(self.advertisements_duration))
 
     @property
     def get_time_hall_free(self):
         """Count time_hall_free of seance"""
-        minutes = (self.time_ends.minute + self.cleaning_duration.minute)
-
-        # if value of minutes is more then 60, add integer part of it to hours
-        hours = (self.time_ends.hour + self.cleaning_duration.hour + minutes // 60) % 24
+        return time_of_minute(minute_of_day(self.time_ends) + minute_of_day(self.cleaning_duration))
 
-        # fractional part will be less then 60, so we leave it as minutes value
-        minutes %= 60
-        time_hall_free = datetime.time(hour=hours, minute=minutes)
-        return time_hall_free
+    @staticmethod
+    def get_hall_intervals(hall_pk, date_starts, date_ends, starts_minute=None, hall_free_minute=None):
+        """
+        Returns SeanceIntervals of seances in the hall, which can occupy it from date_starts to date_ends.
+        Bases, which end on the day before date_starts, are taken too: their seances may go through midnight.
+        So are bases, which start on the day after date_ends: seances of the last day may go through midnight into them.
+        If starts_minute and hall_free_minute are given, only seances, which overlap them on the same day,
+        the day before or the day after, are taken
+        """
+        seances = Seance.objects.filter(seance_base__hall_id=hall_pk,
+                                        seance_base__date_starts__lte=date_ends + datetime.timedelta(days=1),
+                                        seance_base__date_ends__gte=date_starts - datetime.timedelta(days=1))
+        if starts_minute is not None:
+            seances = seances.filter(Q(starts_minute__lt=hall_free_minute, hall_free_minute__gt=starts_minute) |
+                                     Q(hall_free_minute__gt=starts_minute + MINUTES_IN_DAY) |
+                                     Q(starts_minute__lt=hall_free_minute - MINUTES_IN_DAY))
+        return SeanceIntervals(seances.order_by().values_list('pk', 'time_starts', 'time_hall_free',
+                                                              'seance_base__date_starts', 'seance_base__date_ends'))
 
     def validate_seances_intersect(self, seance_exclude_pk=None):
         """
         Validates, that given seance doesn't intersect with others in current hall in time
         To the time_ends of seance cleaning_duration is added, not to set next seance without
-        giving time to clean hall
-        hall_id, date_starts, time_starts, date_ends, time_hall_free
+        giving time to clean hall. Seances of the hall are fetched with one query and checked with
+        interval index (see seance.intervals)
         :returns seances which intersect or empty queryset
         """
-        seances = Seance.objects.filter(Q(seance_base__hall=self.seance_base.hall) &
-                                        Q(seance_base__date_starts__lte=self.seance_base.date_ends) &
-                                        Q(seance_base__date_ends__gte=self.seance_base.date_starts))
-
-        seances_day = seances.filter(time_starts__lt=F('time_hall_free'))
-        seances_midnight = seances.filter(time_starts__gt=F('time_hall_free'))
+        self.set_minutes()
+        base = self.seance_base
+        intervals = Seance.get_hall_intervals(base.hall_id, base.date_starts, base.date_ends,
+                                              self.starts_minute, self.hall_free_minute)
+        seance_pks = intervals.conflicts(self.time_starts, self.time_hall_free, base.date_starts, base.date_ends,
+                                         exclude=seance_exclude_pk)
+        return Seance.objects.filter(pk__in=seance_pks)
 
-        if self.time_starts < self.time_hall_free:
-            seances1 = seances_day.filter(Q(time_starts__lt=self.time_hall_free) &
-                                          Q(time_hall_free__gt=self.time_starts))
-            seances2 = seances_midnight.filter(time_starts__lt=self.time_hall_free)
-            seances3 = seances_midnight.filter(time_hall_free__gt=self.time_starts)
-        else:
-            seances1 = seances_day.filter(time_hall_free__gt=self.time_starts)
-            seances2 = seances_day.filter(time_starts__lt=self.time_hall_free)
-            seances3 = seances_midnight
-        result = seances1 | seances2 | seances3
-        if seance_exclude_pk:
-            result = result.exclude(pk=seance_exclude_pk)
-        return result
+    @staticmethod
+    def validate_batch_intersect(hall_pk, seances):
+        """
+        Checks many new seances in the hall at once with one query to database.
+        :param seances: list of unsaved seances with computed time_hall_free
+        :returns list of dicts {'seances': pk's of existing seances, 'proposals': indexes of seances from the list},
+        which intersect with each seance from the list
+        """
+        if not seances:
+            return []
+        date_starts = min(seance.seance_base.date_starts for seance in seances)
+        date_ends = max(seance.seance_base.date_ends for seance in seances)
+        intervals = Seance.get_hall_intervals(hall_pk, date_starts, date_ends)
+        return intervals.batch_conflicts([(seance.time_starts, seance.time_hall_free, seance.seance_base.date_starts,
+                                           seance.seance_base.date_ends) for seance in seances])
 
     def get_sold_but_not_used_tickets(self, date_starts=None, date_ends=None):
         """returns tickets sold on the seance"""
@@ -334,6 +445,28 @@ class Seance(models.Model):
             tickets = tickets.filter(date_seance__gt=date_starts)
         return tickets
 
+    def get_occupancy(self, date_seance):
+        """
+        Returns SeatOccupancy (bitset by seat ordinals in hall) of the seance on date_seance.
+        It's taken from cache or is built with one query to tickets
+        """
+        hall_pk = self.seance_base.hall_id
+        layout = Hall.get_layout(hall_pk)
+        generation = occupancy.get_occupancy_generation(self.pk, date_seance)
+        seats_occupancy = occupancy.get_cached_occupancy(self.pk, date_seance, layout['version'], generation)
+        if seats_occupancy is None:
+            seat_pks = self.tickets.filter(date_seance=date_seance, was_returned=False).values_list('seat_id',
+                                                                                                   flat=True)
+            seats_occupancy = occupancy.SeatOccupancy.from_ordinals(layout['index'][seat_pk] for seat_pk in seat_pks
+                                                                    if seat_pk in layout['index'])
+            occupancy.cache_occupancy(self.pk, date_seance, hall_pk, layout['version'], seats_occupancy, generation)
+        return seats_occupancy
+
+    def get_seats_taken(self, date_seance):
+        """Returns frozenset with pk's of seats, taken on the seance on date_seance"""
+        seats = Hall.get_layout(self.seance_base.hall_id)['seats']
+        return frozenset(seats[ordinal] for ordinal in self.get_occupancy(date_seance).ordinals())
+
     def activate(self):
         """Validates, that Seance is ready to take part in cinema board.
         For this purpose we check: is hall active; is film active; aren't dates of seance_base passed;
@@ -346,12 +479,15 @@ class Seance(models.Model):
         if not self.seance_base.film.is_active:
             errors_list.append(f'Film has status is_active: False')
 
-        seat_categories = self.seance_base.hall.get_seat_categories()
+        # prices are counted by prices_count, which prices maintain, so they are queried only to name missing ones
+        seat_categories = list(self.seance_base.hall.get_seat_categories())
         sc_with_no_prices = []
-        for sc in seat_categories:
-            if not Price.objects.filter(seat_category=sc, seance_id=self.pk):
-                sc_with_no_prices.append(sc)
-                errors_list.append(f'There is no price for seat category: {sc.name}')
+        if self.prices_count < len(seat_categories):
+            priced_categories = set(self.prices.values_list('seat_category_id', flat=True))
+            for sc in seat_categories:
+                if sc.pk not in priced_categories:
+                    sc_with_no_prices.append(sc)
+                    errors_list.append(f'There is no price for seat category: {sc.name}')
         if not errors_list and not sc_with_no_prices:
             self.is_active = True
             self.save()
@@ -365,28 +501,36 @@ class Seance(models.Model):
         Returns queryset of active seances for some day, which comes in 'date'.
         If date is none, returns active seances for today, considering current time
         """
-        query = Q(is_active=True)
+        # seances are looked up by their occurrences on the date, with index on (date, time_starts)
         if date:
-            query &= Q(seance_base__date_starts__lte=date) & Q(seance_base__date_ends__gte=date)
+            query = Q(occurrences__date=date) & Q(occurrences__is_active=True)
         else:
-            query &= (Q(seance_base__date_starts__lte=datetime.date.today()) &
-                      Q(seance_base__date_ends__gte=datetime.date.today()) &
-                      Q(time_starts__gt=timezone.now()))
+            query = (Q(occurrences__date=datetime.date.today()) & Q(occurrences__is_active=True) &
+                     Q(starts_minute__gt=minute_of_day(timezone.localtime())))
         return Seance.objects.filter(query)
 
+    @staticmethod
+    def select_board_relations(seances):
+        """
+        Adds fetch plan of the board to seances queryset: film and hall are joined, prices with their seat categories
+        are fetched with one more query, so number of queries doesn't depend on number of seances
+        """
+        return seances.select_related('seance_base__film', 'seance_base__hall').prefetch_related(
+            Prefetch('prices', queryset=Price.objects.select_related('seat_category')))
+
     @staticmethod
     def order_queryset(ordering_param, seances):
         """
         orders seances queryset by users ordering
         """
         if ordering_param == 'cheap':
-            return seances.annotate(min_price=Min('prices__price')).order_by('min_price')
+            return seances.order_by('min_price')
         if ordering_param == 'expensive':
-            return seances.annotate(max_price=Max('prices__price')).order_by('-max_price')
+            return seances.order_by('-max_price')
         elif ordering_param == 'latest':
-            return seances.order_by('-time_starts')
+            return seances.order_by('-starts_minute')
         elif ordering_param == 'closest':
-            return seances.order_by('time_starts')
+            return seances.order_by('starts_minute')
 
     @property
     def in_run(self):
@@ -400,9 +544,91 @@ class Seance(models.Model):
         return f'Seance with {self.seance_base.film.title} in {self.time_starts}-{self.time_ends} o\'clock'
 
 
-class PurchaseManager(models.Manager):
-    def get_queryset(self):
-        return super().get_queryset().annotate(total_price=Sum('tickets__price'))
+class SeanceOccurrence(models.Model):
+    """
+    Seance on one date of its seance base. Table is materialized from SeanceBase dates x Seance
+    and is kept in sync on saving of seances and seance bases
+    """
+    seance = models.ForeignKey(Seance, on_delete=models.CASCADE, related_name='occurrences',
+                               verbose_name=_('seance'))
+    hall = models.ForeignKey(Hall, on_delete=models.CASCADE, related_name='occurrences', verbose_name=_('hall'))
+    date = models.DateField(verbose_name=_('date of seance'))
+    time_starts = models.TimeField(verbose_name=_('starts at '))
+    is_active = models.BooleanField(default=False, verbose_name=_('in run?'))
+
+    class Meta:
+        ordering = ('date', 'time_starts')
+        unique_together = ('seance', 'date')
+        indexes = [models.Index(fields=['date', 'time_starts'], name='occurrence_date_time_idx')]
+        verbose_name = _('seance occurrence')
+        verbose_name_plural = _('seance occurrences')
+
+    def __str__(self):
+        return f'Seance {self.seance_id} on {self.date} at {self.time_starts}'
+
+    @staticmethod
+    def sync(seances):
+        """
+        Brings occurrences of given seances in line with dates of their seance bases: occurrences out of dates
+        are deleted, missing ones are created with one bulk insert, hall, time and status are updated
+        """
+        seances = list(seances)
+        if not seances:
+            return
+        existing = {}
+        for seance_pk, date in SeanceOccurrence.objects.filter(seance__in=seances).values_list('seance_id', 'date'):
+            existing.setdefault(seance_pk, set()).add(date)
+
+        to_create = []
+        for seance in seances:
+            seance_base = seance.seance_base
+            date_ends = seance_base.date_ends or seance_base.date_starts
+            dates = {seance_base.date_starts + datetime.timedelta(days=day)
+                     for day in range((date_ends - seance_base.date_starts).days + 1)}
+            seance_dates = existing.get(seance.pk, set())
+            if seance_dates - dates:
+                SeanceOccurrence.objects.filter(seance=seance, date__in=seance_dates - dates).delete()
+            if seance_dates & dates:
+                SeanceOccurrence.objects.filter(seance=seance).update(hall_id=seance_base.hall_id,
+                                                                      time_starts=seance.time_starts,
+                                                                      is_active=seance.is_active)
+            to_create.extend(SeanceOccurrence(seance=seance, hall_id=seance_base.hall_id, date=date,
+                                              time_starts=seance.time_starts, is_active=seance.is_active)
+                             for date in sorted(dates - seance_dates))
+        SeanceOccurrence.objects.bulk_create(to_create)
+
+    @staticmethod
+    def get_schedule(date_from, date_to):
+        """
+        Returns active occurrences from date_from to date_to, ordered by date and time, as dicts
+        {'seance_id', 'date', 'seats_taken'}. Seances, which have already started today, are skipped.
+        Sold tickets of all occurrences are counted with one grouped query
+        """
+        occurrences = list(SeanceOccurrence.objects.filter(date__gte=date_from, date__lte=date_to, is_active=True)
+                           .exclude(date=datetime.date.today(), time_starts__lte=timezone.localtime().time())
+                           .values('seance_id', 'date'))
+        tickets = (Ticket.objects.filter(date_seance__gte=date_from, date_seance__lte=date_to, was_returned=False,
+                                         seance_id__in={occurrence['seance_id'] for occurrence in occurrences})
+                   .values('seance_id', 'date_seance').annotate(taken=Count('pk')).order_by())
+        taken = {(row['seance_id'], row['date_seance']): row['taken'] for row in tickets}
+        for occurrence in occurrences:
+            occurrence['seats_taken'] = taken.get((occurrence['seance_id'], occurrence['date']), 0)
+        return occurrences
+
+
+class PurchaseQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Adds tickets_total - sum of prices of purchase's tickets, counted with join to tickets"""
+        return self.annotate(tickets_total=Sum('tickets__price'))
+
+    def with_tickets(self):
+        """Prefetches tickets with their seances, films, halls and seats, which are shown with purchases"""
+        return self.prefetch_related(Prefetch('tickets', queryset=Ticket.objects.select_related(
+            'seance__seance_base__film', 'seance__seance_base__hall', 'seat__hall')))
+
+
+class PurchaseManager(models.Manager.from_queryset(PurchaseQuerySet)):
+    """Purchases are queried from their own table, totals of tickets are joined only by with_totals()"""
 
 
 class Purchase(models.Model):
@@ -410,14 +636,64 @@ class Purchase(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, editable=False, verbose_name=_('instance created at'))
     was_returned = models.BooleanField(default=False, verbose_name=_('was returned?'))
     returned_at = models.DateTimeField(blank=True, null=True, verbose_name=_('returned at'))
+    # sum of prices of tickets, maintained by purchase and return flows (see seance.purchases)
+    total_price = models.FloatField(default=0, editable=False, verbose_name=_('total price'))
+
+    # state of letter with tickets, which is sent by seance.mailing.deliver_ticket_emails
+    EMAIL_PENDING = 'pending'
+    EMAIL_SENDING = 'sending'
+    EMAIL_SENT = 'sent'
+    EMAIL_FAILED = 'failed'
+    EMAIL_STATUSES = (
+        (EMAIL_PENDING, _('pending')),
+        (EMAIL_SENDING, _('sending')),
+        (EMAIL_SENT, _('sent')),
+        (EMAIL_FAILED, _('failed')),
+    )
+    email_status = models.CharField(max_length=8, choices=EMAIL_STATUSES, blank=True, db_index=True,
+                                    verbose_name=_('letter with tickets'))
+    email_attempts = models.PositiveSmallIntegerField(default=0, editable=False,
+                                                      verbose_name=_('attempts to send letter'))
+    emailed_at = models.DateTimeField(blank=True, null=True, verbose_name=_('letter sent at'))
+    # when letter was taken for sending, it's taken again, if worker died and left it sending for too long
+    email_claimed_at = models.DateTimeField(blank=True, null=True, editable=False,
+                                            verbose_name=_('letter taken for sending at'))
 
     objects = PurchaseManager()
 
     def __str__(self):
         return f'{self.user.username} at {self.created_at}'
 
+    @staticmethod
+    def add_to_totals(purchase_pk, amount):
+        """
+        Adds amount to total price of the purchase and, if it isn't returned, to money spent by its user.
+        Both are changed with UPDATE expressions, so concurrent changes aren't lost
+        """
+        with transaction.atomic():
+            Purchase.objects.filter(pk=purchase_pk).update(total_price=F('total_price') + amount)
+            AdvUser.objects.filter(purchases__pk=purchase_pk, purchases__was_returned=False).update(
+                money_spent=F('money_spent') + amount)
+
+    @staticmethod
+    def reconcile_totals():
+        """
+        Recounts total prices of all purchases and money spent by all users from tickets,
+        with one UPDATE for each table.
+        :return: (quantity of fixed purchases, quantity of fixed users)
+        """
+        tickets_total = Coalesce(Subquery(Ticket.objects.filter(purchase=OuterRef('pk')).order_by().values(
+            'purchase').annotate(total=Sum('price')).values('total')), Value(0.0))
+        purchases = Purchase.objects.exclude(total_price=tickets_total).update(total_price=tickets_total)
+        money_spent = Coalesce(Subquery(Ticket.objects.filter(purchase__user=OuterRef('pk'),
+                                                              purchase__was_returned=False).order_by().values(
+            'purchase__user').annotate(total=Sum('price')).values('total')), Value(0.0))
+        users = AdvUser.objects.exclude(money_spent=money_spent).update(money_spent=money_spent)
+        return purchases, users
+
     class Meta:
         ordering = ('-created_at', )
+        indexes = [models.Index(fields=['user', '-created_at'], name='purchase_user_created_idx')]
 
 
 class Ticket(models.Model):
@@ -447,17 +723,106 @@ class Ticket(models.Model):
         return False
 
     class Meta:
-        unique_together = ('seance', 'date_seance', 'seat')
+        # returned tickets stay for history, their seats can be sold again
+        constraints = [models.UniqueConstraint(fields=['seance', 'date_seance', 'seat'],
+                                               condition=Q(was_returned=False), name='ticket_sold_seat_unique')]
+        # partial unique index doesn't serve lookups of all tickets of seance on date
+        indexes = [models.Index(fields=['seance', 'date_seance'], name='ticket_seance_date_idx')]
         ordering = ('-date_seance', )
 
 
+class SeatHold(models.Model):
+    """Seat, temporarily held for a user while it's in his basket (see seance.holds.DatabaseHoldBackend)"""
+    seance = models.ForeignKey(Seance, on_delete=models.CASCADE, related_name='holds', verbose_name=_('seance'))
+    date_seance = models.DateField(verbose_name=_('date of seance'))
+    seat = models.ForeignKey(Seat, on_delete=models.CASCADE, related_name='holds', verbose_name=_('seat'))
+    user = models.ForeignKey(AdvUser, on_delete=models.CASCADE, related_name='holds', verbose_name=_('user'))
+    expires_at = models.DateTimeField(db_index=True, verbose_name=_('held till'))
+
+    class Meta:
+        unique_together = ('seance', 'date_seance', 'seat')
+        verbose_name = _('seat hold')
+        verbose_name_plural = _('seat holds')
+
+    def __str__(self):
+        return f'{self.seat} held on {self.date_seance} till {self.expires_at}'
+
+
+class Basket(models.Model):
+    """Basket of a user, kept out of session (see seance.sessions.DatabaseBasketStore)"""
+    user = models.OneToOneField(AdvUser, on_delete=models.CASCADE, primary_key=True, related_name='basket',
+                                verbose_name=_('user'))
+    items = models.TextField(default='{}', verbose_name=_('items in json'))
+    updated_at = models.DateTimeField(verbose_name=_('updated at'))
+
+    class Meta:
+        verbose_name = _('basket')
+        verbose_name_plural = _('baskets')
+
+    def __str__(self):
+        return f'Basket of {self.user_id}'
+
+
 class Return:
     """For future goals))"""
     pass
 
 
-def purchase_created_dispatcher(sender, **kwargs):
-    send_tickets(kwargs.get('instance'), kwargs.get('purchase'))
+def seat_changed_dispatcher(sender, **kwargs):
+    """Layout of the hall has to be rebuilt, occupancies built on it will be rebuilt too"""
+    invalidate_layouts([kwargs.get('instance').hall_id])
+
+
+def seat_category_changed_dispatcher(sender, **kwargs):
+    """Palette of layouts of all halls with seats of that category has changed"""
+    seat_category = kwargs.get('instance')
+    invalidate_layouts(set(Seat.objects.filter(seat_category=seat_category).values_list('hall_id', flat=True)))
+
+
+def board_changed_dispatcher(sender, **kwargs):
+    """Cached boards of seances are built from seances, their bases, prices, films and halls"""
+    invalidate_board()
+
+
+def price_changed_dispatcher(sender, **kwargs):
+    Seance.update_price_stats(kwargs.get('instance').seance_id)
+
+
+def seance_saved_dispatcher(sender, **kwargs):
+    SeanceOccurrence.sync([kwargs.get('instance')])
+
+
+def seance_base_saved_dispatcher(sender, **kwargs):
+    """Dates or hall of seance base could change, so occurrences of all its seances are synced"""
+    seance_base = kwargs.get('instance')
+    seances = list(seance_base.seances.all())
+    for seance in seances:
+        seance.seance_base = seance_base
+    SeanceOccurrence.sync(seances)
+
+
+def ticket_saved_dispatcher(sender, **kwargs):
+    ticket = kwargs.get('instance')
+    occupancy.invalidate_occupancy(ticket.seance_id, ticket.date_seance)
+    if kwargs.get('created'):
+        Purchase.add_to_totals(ticket.purchase_id, ticket.price)
+
+
+def ticket_deleted_dispatcher(sender, **kwargs):
+    ticket = kwargs.get('instance')
+    occupancy.invalidate_occupancy(ticket.seance_id, ticket.date_seance)
+    Purchase.add_to_totals(ticket.purchase_id, -ticket.price)
 
 
-purchase_created.connect(purchase_created_dispatcher)
+post_save.connect(seat_changed_dispatcher, sender=Seat)
+post_delete.connect(seat_changed_dispatcher, sender=Seat)
+post_save.connect(seat_category_changed_dispatcher, sender=SeatCategory)
+post_save.connect(seance_saved_dispatcher, sender=Seance)
+post_save.connect(seance_base_saved_dispatcher, sender=SeanceBase)
+post_save.connect(ticket_saved_dispatcher, sender=Ticket)
+post_delete.connect(ticket_deleted_dispatcher, sender=Ticket)
+post_save.connect(price_changed_dispatcher, sender=Price)
+post_delete.connect(price_changed_dispatcher, sender=Price)
+for board_model in (Seance, SeanceBase, Price, Film, Hall, SeatCategory):
+    post_save.connect(board_changed_dispatcher, sender=board_model)
+    post_delete.connect(board_changed_dispatcher, sender=board_model)
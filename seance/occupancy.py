@@ -0,0 +1,95 @@
+import uuid
+
+from django.core.cache import cache
+
+from cinema.settings import SEAT_MAP_CACHE_TIMEOUT
+
+
+def seance_occupancy_generation_key(seance_pk, date_seance):
+    return f'seance:{seance_pk}:occupancy-generation:{date_seance}'
+
+
+def seance_occupancy_key(seance_pk, date_seance, generation):
+    return f'seance:{seance_pk}:occupancy:{date_seance}:{generation}'
+
+
+class SeatOccupancy:
+    """
+    Bitset of seats taken on one seance at one date.
+    Bit number is an ordinal of the seat in its hall (seats ordered by row and number)
+    """
+    __slots__ = ('bits', )
+
+    def __init__(self, bits=0):
+        self.bits = bits
+
+    @classmethod
+    def from_ordinals(cls, ordinals):
+        bits = 0
+        for ordinal in ordinals:
+            bits |= 1 << ordinal
+        return cls(bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(int.from_bytes(data, 'little'))
+
+    def to_bytes(self):
+        return self.bits.to_bytes((self.bits.bit_length() + 7) // 8, 'little')
+
+    def take(self, ordinal):
+        self.bits |= 1 << ordinal
+
+    def free(self, ordinal):
+        self.bits &= ~(1 << ordinal)
+
+    def ordinals(self):
+        """Yields ordinals of taken seats in ascending order"""
+        bits, ordinal = self.bits, 0
+        while bits:
+            if bits & 1:
+                yield ordinal
+            bits >>= 1
+            ordinal += 1
+
+    def __contains__(self, ordinal):
+        return bool(self.bits >> ordinal & 1)
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+
+def get_occupancy_generation(seance_pk, date_seance):
+    """
+    Returns generation of occupancy of the seance on date, it's a part of occupancy's key.
+    Changing generation invalidates cached occupancy, so it's rebuilt from tickets by the next read
+    """
+    key = seance_occupancy_generation_key(seance_pk, date_seance)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        generation = cache.get(key)
+    return generation
+
+
+def get_cached_occupancy(seance_pk, date_seance, version, generation):
+    """Returns SeatOccupancy from cache if it was built for given version of hall's layout and generation, else None"""
+    cached = cache.get(seance_occupancy_key(seance_pk, date_seance, generation))
+    if cached and cached[1] == version:
+        return SeatOccupancy.from_bytes(cached[2])
+    return None
+
+
+def cache_occupancy(seance_pk, date_seance, hall_pk, version, occupancy, generation):
+    """Caches occupancy under generation, which was read before tickets, so the later change isn't covered by it"""
+    cache.set(seance_occupancy_key(seance_pk, date_seance, generation),
+              (hall_pk, version, occupancy.to_bytes()), SEAT_MAP_CACHE_TIMEOUT)
+
+
+def invalidate_occupancy(seance_pk, date_seance):
+    """
+    Switches generation of occupancy of the seance on date, when its tickets are changed.
+    Occupancy isn't rewritten in place, so concurrent changes can't lose each other's seats, and occupancy,
+    which was built from tickets before the change, is cached with the old generation and isn't read
+    """
+    cache.set(seance_occupancy_generation_key(seance_pk, date_seance), uuid.uuid4().hex, None)
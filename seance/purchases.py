@@ -0,0 +1,130 @@
+import datetime
+
+from django.db import transaction, IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from seance import occupancy
+from seance.holds import get_hold_backend
+from seance.models import AdvUser, Seat, Price, Purchase, Ticket
+
+
+class PurchaseError(Exception):
+    default_detail = 'Error occurred, please try once again'
+
+    def __init__(self, detail=None):
+        self.detail = detail or self.default_detail
+        super().__init__(self.detail)
+
+
+class InsufficientFunds(PurchaseError):
+    default_detail = 'Insufficient funds'
+
+
+class TicketsAlreadySold(PurchaseError):
+    default_detail = 'Some of the tickets you choose was already sold'
+
+
+class SeatsHeld(PurchaseError):
+    default_detail = 'Some of the seats you choose are temporarily held by another user'
+
+
+def get_basket_tickets(items):
+    """
+    Validates items of basket (dicts with seat_pk, seance_pk, seance_date) with two queries for any quantity of
+    items: seat has to be in the hall of the seance and seance has to have price for seat's category.
+    :return: list of unsaved Ticket objects with prices taken from database
+    """
+    try:
+        items = [(int(item['seat_pk']), int(item['seance_pk']),
+                  datetime.datetime.strptime(str(item['seance_date']), '%Y-%m-%d').date()) for item in items]
+    except (KeyError, TypeError, ValueError):
+        raise PurchaseError()
+    if not items:
+        raise PurchaseError('Basket is empty')
+
+    seats = {pk: (hall_pk, seat_category_pk) for pk, hall_pk, seat_category_pk in
+             Seat.objects.filter(pk__in={item[0] for item in items}).values_list('pk', 'hall_id', 'seat_category_id')}
+    prices = {(seance_pk, seat_category_pk): (hall_pk, price) for seance_pk, seat_category_pk, hall_pk, price in
+              Price.objects.filter(seance_id__in={item[1] for item in items}).values_list(
+                  'seance_id', 'seat_category_id', 'seance__seance_base__hall_id', 'price')}
+
+    tickets = []
+    for seat_pk, seance_pk, seance_date in items:
+        if seat_pk not in seats:
+            raise PurchaseError()
+        hall_pk, seat_category_pk = seats[seat_pk]
+        hall_and_price = prices.get((seance_pk, seat_category_pk))
+        if not hall_and_price or hall_and_price[0] != hall_pk:
+            raise PurchaseError()
+        tickets.append(Ticket(seance_id=seance_pk, date_seance=seance_date, seat_id=seat_pk,
+                              price=hall_and_price[1]))
+    return tickets
+
+
+def create_purchase(user_pk, items):
+    """
+    Creates purchase with tickets for basket items in one transaction, with fixed number of queries:
+    money is debited from user's wallet and added to money spent with one conditional UPDATE, total price is
+    stored in purchase, tickets are created with bulk insert (without signals, so totals aren't counted twice) and
+    unique constraint of tickets ('seance', 'date_seance', 'seat') detects seats, which were already sold.
+    Seats, held by other users, can't be bought; seats without holds or with expired ones can.
+    :return: created Purchase, with total_price set
+    :raises PurchaseError: if nothing was bought
+    """
+    tickets = get_basket_tickets(items)
+    total_price = sum(ticket.price for ticket in tickets)
+    seats_by_seance = {}
+    for ticket in tickets:
+        seats_by_seance.setdefault((ticket.seance_id, ticket.date_seance), []).append(ticket.seat_id)
+    hold_backend = get_hold_backend()
+    try:
+        with transaction.atomic():
+            for (seance_pk, seance_date), seat_pks in seats_by_seance.items():
+                held = hold_backend.held_seats(seance_pk, seance_date)
+                if any(held.get(seat_pk, user_pk) != user_pk for seat_pk in seat_pks):
+                    raise SeatsHeld()
+            debited = AdvUser.objects.filter(pk=user_pk, wallet__gte=total_price).update(
+                wallet=F('wallet') - total_price, money_spent=F('money_spent') + total_price)
+            if not debited:
+                wallet = AdvUser.objects.filter(pk=user_pk).values_list('wallet', flat=True).first()
+                raise InsufficientFunds(f'Insufficient funds. You need {total_price} hrn, '
+                                        f'but have only {wallet} hrn')
+            purchase = Purchase.objects.create(user_id=user_pk, total_price=total_price)
+            for ticket in tickets:
+                ticket.purchase = purchase
+            Ticket.objects.bulk_create(tickets)
+    except IntegrityError:
+        raise TicketsAlreadySold()
+
+    # bulk insert doesn't send signals, so cached seat maps are invalidated here, holds of bought seats are released
+    for (seance_pk, seance_date), seat_pks in seats_by_seance.items():
+        occupancy.invalidate_occupancy(seance_pk, seance_date)
+        hold_backend.release(seance_pk, seance_date, seat_pks, user_pk)
+
+    return purchase
+
+
+def return_purchase(purchase_pk):
+    """
+    Returns purchase in one transaction: purchase and its tickets are marked as returned, total price goes back
+    to user's wallet and is taken off money spent by the user. Seats of returned tickets can be sold again,
+    unique constraint of tickets covers only not returned ones.
+    :raises PurchaseError: if there is no such purchase, it was already returned or has tickets of passed days
+    """
+    with transaction.atomic():
+        purchase = Purchase.objects.select_for_update().filter(pk=purchase_pk, was_returned=False).first()
+        if not purchase:
+            raise PurchaseError('Purchase was already returned')
+        if Ticket.objects.filter(purchase_id=purchase_pk, date_seance__lt=datetime.date.today()).exists():
+            raise PurchaseError('Tickets of passed seances can\'t be returned')
+        Purchase.objects.filter(pk=purchase_pk).update(was_returned=True, returned_at=timezone.now())
+        seances = list(Ticket.objects.filter(purchase_id=purchase_pk).values_list('seance_id',
+                                                                                  'date_seance').distinct())
+        Ticket.objects.filter(purchase_id=purchase_pk).update(was_returned=True)
+        AdvUser.objects.filter(pk=purchase.user_id).update(wallet=F('wallet') + purchase.total_price,
+                                                            money_spent=F('money_spent') - purchase.total_price)
+
+    # update() doesn't send signals, so cached seat maps are invalidated here
+    for seance_pk, seance_date in seances:
+        occupancy.invalidate_occupancy(seance_pk, seance_date)
@@ -0,0 +1,123 @@
+import csv
+import datetime
+
+from django.db import transaction
+
+from seance.board import invalidate_board
+from seance.intervals import MINUTES_IN_DAY, minute_of_day, split_at_midnight, pack_seances
+from seance.models import Hall, Seance, SeanceBase, SeanceOccurrence
+
+# columns of schedule in csv, only time_starts is required
+SCHEDULE_COLUMNS = ('time_starts', 'advertisements_duration', 'cleaning_duration', 'description')
+
+
+def parse_schedule_csv(text):
+    """
+    Parses schedule in csv (one seance per line, columns are SCHEDULE_COLUMNS, header line is optional)
+    into list of dicts with not empty values as strings
+    """
+    rows = []
+    for line in csv.reader(text.strip().splitlines()):
+        cells = [cell.strip() for cell in line]
+        if not any(cells) or (not rows and cells[0] == SCHEDULE_COLUMNS[0]):
+            continue
+        rows.append({column: cell for column, cell in zip(SCHEDULE_COLUMNS, cells) if cell})
+    return rows
+
+
+def build_seances(seance_base, rows, admin=None):
+    """
+    Makes unsaved seances of seance_base from rows (dicts with time_starts and optional durations and description)
+    with computed time_ends and time_hall_free. Film of seance_base is loaded once for all of them
+    """
+    seances = []
+    for row in rows:
+        seance = Seance(time_starts=row['time_starts'],
+                        advertisements_duration=row.get('advertisements_duration'),
+                        cleaning_duration=row.get('cleaning_duration'),
+                        description=row.get('description', ''),
+                        seance_base=seance_base, admin=admin)
+        seance.save(commit=False)
+        seances.append(seance)
+    return seances
+
+
+def import_schedule(seance_base, rows, admin):
+    """
+    Validates seances from rows against each other and seances of the hall in one pass and, if there are no
+    intersections, creates all of them with one bulk insert.
+    :return: dict with 'success', list of created 'seances' and 'rows' - report for every row with
+    intersecting seances of the hall and intersecting rows
+    """
+    seance_base = SeanceBase.objects.select_related('film', 'hall').get(pk=seance_base.pk)
+    seances = build_seances(seance_base, rows, admin)
+    with transaction.atomic():
+        # the hall is locked till the end of transaction, so concurrent imports can't add intersecting seances
+        list(Hall.objects.select_for_update().filter(pk=seance_base.hall_id).values_list('pk'))
+        conflicts = Seance.validate_batch_intersect(seance_base.hall_id, seances)
+
+        hall_seances = {seance['pk']: seance for seance in Seance.objects.filter(
+            pk__in={pk for row_conflicts in conflicts for pk in row_conflicts['seances']}
+        ).values('pk', 'time_starts', 'time_hall_free', 'seance_base_id')}
+        report = [{'row': index,
+                   'time_starts': seance.time_starts,
+                   'time_ends': seance.time_ends,
+                   'time_hall_free': seance.time_hall_free,
+                   'seances': [hall_seances[pk] for pk in sorted(row_conflicts['seances'])],
+                   'rows': sorted(row_conflicts['proposals'])}
+                  for index, (seance, row_conflicts) in enumerate(zip(seances, conflicts))]
+        if not seances or any(row['seances'] or row['rows'] for row in report):
+            return {'success': False, 'seances': [], 'rows': report}
+
+        Seance.objects.bulk_create(seances)
+        # bulk insert doesn't return pk's on every database and doesn't send signals
+        created = list(Seance.objects.select_related('seance_base').filter(
+            seance_base=seance_base, time_starts__in=[seance.time_starts for seance in seances]))
+        SeanceOccurrence.sync(created)
+    invalidate_board()
+    return {'success': True, 'seances': created, 'rows': report}
+
+
+def generate_schedule(seance_bases, opens, closes, advertisements_duration=datetime.time(0, 10),
+                      cleaning_duration=datetime.time(0, 10), step=5):
+    """
+    Proposes packed schedule for seance bases (several of them may share a hall) in working hours of halls
+    from opens till closes (closes not later than opens means, that halls work after midnight), keeping
+    clear of existing seances. Seances of all halls are fetched with one query, packing is done by
+    seance.intervals.pack_seances.
+    :return: dict {seance_base: list of unsaved seances sorted by time_starts}
+    """
+    seance_bases = list(SeanceBase.objects.select_related('film', 'hall').filter(
+        pk__in=[seance_base.pk for seance_base in seance_bases]).order_by('pk'))
+    if not seance_bases:
+        return {}
+    opens, closes = minute_of_day(opens), minute_of_day(closes)
+    if closes <= opens:
+        closes += MINUTES_IN_DAY
+    extra = minute_of_day(advertisements_duration) + minute_of_day(cleaning_duration)
+
+    busy = {}
+    seances = Seance.objects.filter(
+        seance_base__hall_id__in={seance_base.hall_id for seance_base in seance_bases},
+        seance_base__date_starts__lte=max(seance_base.date_ends for seance_base in seance_bases) +
+        datetime.timedelta(days=1),
+        seance_base__date_ends__gte=min(seance_base.date_starts for seance_base in seance_bases) -
+        datetime.timedelta(days=1))
+    for hall_pk, time_starts, time_hall_free, date_starts, date_ends in seances.order_by().values_list(
+            'seance_base__hall_id', 'time_starts', 'time_hall_free', 'seance_base__date_starts',
+            'seance_base__date_ends'):
+        busy.setdefault(hall_pk, []).extend(split_at_midnight(time_starts, time_hall_free, date_starts, date_ends))
+
+    films = {}
+    for seance_base in seance_bases:
+        films.setdefault(seance_base.hall_id, []).append(
+            (seance_base, seance_base.film.duration_minutes + extra, seance_base.date_starts,
+             seance_base.date_ends))
+
+    schedule = {seance_base: [] for seance_base in seance_bases}
+    for hall_pk, hall_films in films.items():
+        for seance_base, starts in pack_seances(hall_films, busy.get(hall_pk, []), opens, closes, step):
+            schedule[seance_base].append({'time_starts': datetime.time(starts // 60, starts % 60),
+                                          'advertisements_duration': advertisements_duration,
+                                          'cleaning_duration': cleaning_duration})
+    return {seance_base: build_seances(seance_base, rows) for seance_base, rows in schedule.items()}
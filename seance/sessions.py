@@ -0,0 +1,124 @@
+import json
+
+from django.core import signing
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from cinema.settings import SIGNED_COOKIE_MAX_AGE, BASKET_STORE, BASKET_CACHE, BASKET_CACHE_TIMEOUT
+from seance.models import Basket
+from seance.utilities import check_shared_cache
+
+SIGNED_COOKIE_SALT = 'seance.sessions'
+
+
+def sign_value(name, value):
+    """Returns value of signed cookie with given name, as it's set by set_signed_value"""
+    return signing.get_cookie_signer(salt=name + SIGNED_COOKIE_SALT).sign(str(value))
+
+
+def get_signed_value(request, name, default=None):
+    """Returns value of signed cookie, default if there is no cookie, or it's forged or expired"""
+    return request.get_signed_cookie(name, default, salt=SIGNED_COOKIE_SALT, max_age=SIGNED_COOKIE_MAX_AGE)
+
+
+def set_signed_value(request, response, name, value):
+    """
+    Sets signed cookie, if its value differs from the one in request.
+    Read-mostly values are kept in such cookies instead of session, so they cost no writes to server
+    """
+    if get_signed_value(request, name) != str(value):
+        response.set_cookie(name, sign_value(name, value), max_age=SIGNED_COOKIE_MAX_AGE, httponly=True,
+                            samesite='Lax')
+
+
+def basket_total(basket):
+    """Returns total price of tickets in basket, 'added' key of api basket isn't a ticket"""
+    if not basket:
+        return 0
+    return sum(float(item['price']) for key, item in basket.items() if key != 'added')
+
+
+class BaseBasketStore:
+    """
+    Baskets of users: dicts of tickets, which users are going to buy. Baskets aren't kept in session,
+    so it isn't rewritten, when user puts tickets to basket
+    """
+    def get(self, user_pk):
+        """Returns basket of the user or None, if it's empty"""
+        raise NotImplementedError
+
+    def set(self, user_pk, basket):
+        raise NotImplementedError
+
+    def delete(self, user_pk):
+        raise NotImplementedError
+
+
+class DatabaseBasketStore(BaseBasketStore):
+    """Keeps baskets in Basket table, one row for a user"""
+
+    def get(self, user_pk):
+        items = Basket.objects.filter(user_id=user_pk).values_list('items', flat=True).first()
+        if not items:
+            return None
+        return json.loads(items) or None
+
+    def set(self, user_pk, basket):
+        items = json.dumps(basket, cls=DjangoJSONEncoder)
+        basket_row = Basket.objects.filter(user_id=user_pk)
+        if basket_row.update(items=items, updated_at=timezone.now()):
+            return
+        try:
+            with transaction.atomic():
+                Basket.objects.create(user_id=user_pk, items=items, updated_at=timezone.now())
+        except IntegrityError:
+            basket_row.update(items=items, updated_at=timezone.now())
+
+    def delete(self, user_pk):
+        Basket.objects.filter(user_id=user_pk).delete()
+
+
+class CacheBasketStore(DatabaseBasketStore):
+    """
+    Reads baskets from cache (BASKET_CACHE alias), table is read only when basket isn't in cache,
+    e.g. after restart or eviction. Changes are written to both, so basket isn't lost with cache.
+    Empty basket is cached too, so pages of users without basket don't query the table.
+    Cache has to be shared by all processes, or they would show and overwrite stale baskets
+    """
+    def __init__(self, cache_alias=BASKET_CACHE, timeout=BASKET_CACHE_TIMEOUT):
+        check_shared_cache(cache_alias, 'BASKET_CACHE')
+        self.cache = caches[cache_alias]
+        self.timeout = timeout
+
+    @staticmethod
+    def basket_key(user_pk):
+        return f'basket:{user_pk}'
+
+    def get(self, user_pk):
+        basket = self.cache.get(self.basket_key(user_pk))
+        if basket is None:
+            basket = super().get(user_pk) or {}
+            self.cache.set(self.basket_key(user_pk), basket, self.timeout)
+        return basket or None
+
+    def set(self, user_pk, basket):
+        super().set(user_pk, basket)
+        self.cache.set(self.basket_key(user_pk), basket, self.timeout)
+
+    def delete(self, user_pk):
+        super().delete(user_pk)
+        self.cache.set(self.basket_key(user_pk), {}, self.timeout)
+
+
+_store = None
+
+
+def get_basket_store():
+    """Returns instance of store, set in BASKET_STORE setting"""
+    global _store
+    if _store is None:
+        _store = import_string(BASKET_STORE)()
+    return _store
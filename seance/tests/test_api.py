@@ -0,0 +1,356 @@
+import datetime
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework.utils import json
+from rest_framework.utils.encoders import JSONEncoder
+
+from cinema.settings import API_PAGE_SIZES
+from seance.API import serializers
+from seance.API.authentication import TokenCache, token_cache, make_signed_token
+from seance.models import Price, Purchase, Ticket, Seance, AdvUser
+from seance.purchases import create_purchase
+from seance.sessions import get_basket_store
+from seance.tests.test_models import BaseInitial
+
+
+class PaginationTestCase(TestCase, BaseInitial):
+
+    def setUp(self):
+        BaseInitial.__init__(self)
+
+    def get_all_pages(self, url, results_key='results'):
+        """Follows next links from url, returns list of pages"""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json())
+            url = pages[-1]['next']
+        return [page[results_key] for page in pages]
+
+    def test_price_pagination(self):
+        """Tests that prices are paginated by creation time, newest first, without gaps and duplicates"""
+        pages = self.get_all_pages('/api/price/?page_size=4')
+        self.assertEqual([len(page) for page in pages], [4, 2])
+        urls = [price['url'] for page in pages for price in page]
+        self.assertEqual(len(set(urls)), Price.objects.count())
+        newest = Price.objects.order_by('-created_at', '-pk').first()
+        self.assertTrue(urls[0].endswith(f'/api/price/{newest.pk}/'))
+
+    @patch.dict(API_PAGE_SIZES, {'film': 2})
+    def test_page_size_limit(self):
+        """Tests that client can't ask for page bigger than page size of endpoint"""
+        response = self.client.get('/api/film/?page_size=1000')
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertIsNotNone(response.json()['next'])
+
+    def test_purchase_pagination(self):
+        """Tests that paginated purchases keep sum of money spent for all purchases"""
+        self.client.post('/accounts/login/', data={'username': self.user.username, 'password': 'password1234'})
+        seats = self.hall_yellow.seats.all()
+        for number in range(3, 15):
+            purchase = Purchase.objects.create(user=self.user)
+            Ticket.objects.create(seance=self.seance_bond_night, purchase=purchase, seat=seats[number], price=100,
+                                  date_seance=datetime.date.today() + datetime.timedelta(days=3))
+
+        pages = self.get_all_pages('/api/purchase/', results_key='purchases')
+        self.assertEqual([len(page) for page in pages], [10, 3])
+        response = self.client.get('/api/purchase/')
+        self.assertEqual(response.json()['money_spent'], 240 + 12 * 100)
+        self.assertIsNone(response.json()['previous'])
+
+
+class PurchaseReturnTestCase(TestCase, BaseInitial):
+
+    def setUp(self):
+        BaseInitial.__init__(self)
+        self.client.post('/accounts/login/', data={'username': self.user.username, 'password': 'password1234'})
+
+    def test_return_and_buy_again(self):
+        """Tests that user returns his purchase, gets money back and returned seats can be bought again"""
+        date_seance = str(datetime.date.today() + datetime.timedelta(days=3))
+        items = [{'seat_pk': seat.pk, 'seance_pk': self.seance_bond_night.pk, 'seance_date': date_seance}
+                 for seat in self.hall_yellow.seats.all()[20:22]]
+        purchase = create_purchase(self.user.pk, items)
+
+        response = self.client.post(f'/api/purchase/{purchase.pk}/return/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AdvUser.objects.get(pk=self.user.pk).wallet, 10000)
+        self.assertEqual(self.client.post(f'/api/purchase/{purchase.pk}/return/').status_code, 400)
+        self.assertEqual(create_purchase(self.user.pk, items).total_price, 240)
+
+        # purchases of other users can't be returned
+        other_purchase = create_purchase(self.admin.pk, [{'seat_pk': self.hall_yellow.seats.all()[30].pk,
+                                                          'seance_pk': self.seance_bond_night.pk,
+                                                          'seance_date': date_seance}])
+        self.assertEqual(self.client.post(f'/api/purchase/{other_purchase.pk}/return/').status_code, 404)
+
+    def test_purchase_queues_letter(self):
+        """Tests that purchase from api basket queues letter with tickets, as purchase on the site does"""
+        date_seance = str(datetime.date.today() + datetime.timedelta(days=3))
+        get_basket_store().set(self.user.pk, {
+            str(seat.pk): {'seat_pk': str(seat.pk), 'seance_pk': str(self.seance_bond_night.pk),
+                           'seance_date': date_seance, 'price': '120'} for seat in self.hall_yellow.seats.all()[40:42]})
+        response = self.client.post('/api/purchase/')
+        self.assertEqual(response.status_code, 201)
+        purchase = Purchase.objects.filter(user=self.user).latest('created_at')
+        self.assertEqual(purchase.email_status, Purchase.EMAIL_PENDING)
+
+
+class SparseFieldsTestCase(TestCase, BaseInitial):
+
+    def setUp(self):
+        BaseInitial.__init__(self)
+        self.tomorrow = str(datetime.date.today() + datetime.timedelta(days=1))
+
+    def get_with_queries(self, url, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data=data)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [query['sql'] for query in queries]
+
+    def test_seance_fields(self):
+        """Tests that only asked fields are returned and not asked relations are not fetched"""
+        seances, queries = self.get_with_queries('/api/seance/', {'date': self.tomorrow,
+                                                                  'fields': 'time_starts,min_price'})
+        self.assertEqual(set(seances[0]), {'time_starts', 'min_price'})
+        self.assertFalse([query for query in queries if 'seance_price' in query or 'seance_film' in query])
+
+        seances, queries = self.get_with_queries('/api/seance/', {'date': self.tomorrow,
+                                                                  'fields': 'time_starts,seance_base.film.title'})
+        self.assertEqual(seances[0]['seance_base'], {'film': {'title': seances[0]['seance_base']['film']['title']}})
+        self.assertFalse([query for query in queries if 'seance_price' in query or 'seance_hall' in query])
+
+    def test_seance_expand(self):
+        """Tests that not expanded relations are returned as primary keys"""
+        full, _ = self.get_with_queries('/api/seance/', {'date': self.tomorrow})
+        seances, queries = self.get_with_queries('/api/seance/', {'date': self.tomorrow, 'expand': 'seance_base'})
+        self.assertEqual(seances[0]['seance_base']['film'], self.seance_base_bond.film_id)
+        self.assertNotIn('prices', seances[0])
+        self.assertEqual(seances[0]['seance_base']['date_starts'], full[0]['seance_base']['date_starts'])
+        self.assertFalse([query for query in queries if 'seance_price' in query or 'seance_film' in query])
+
+        seances, _ = self.get_with_queries('/api/seance/', {'date': self.tomorrow, 'expand': ''})
+        self.assertEqual(seances[0]['seance_base'], self.seance_base_bond.pk)
+
+    def test_admin_price_fields(self):
+        self.client.post('/accounts/login/', data={'username': self.admin.username, 'password': 'password1'})
+        prices, queries = self.get_with_queries('/api-admin/price/', {'fields': 'price,seance.time_starts'})
+        self.assertEqual(set(prices[0]), {'price', 'seance'})
+        self.assertEqual(set(prices[0]['seance']), {'time_starts'})
+        self.assertFalse([query for query in queries if 'seance_seatcategory' in query])
+
+
+class ValuesPathTestCase(TestCase, BaseInitial):
+
+    def setUp(self):
+        BaseInitial.__init__(self)
+        self.tomorrow = str(datetime.date.today() + datetime.timedelta(days=1))
+        self.request = Request(APIRequestFactory().get('/'))
+
+    def serialize(self, serializer_class, instance, many=True):
+        """Returns json of model serializer as it is sent to client"""
+        data = serializer_class(instance, many=many, context={'request': self.request}).data
+        return json.loads(json.dumps(data, cls=JSONEncoder))
+
+    def test_seance_list(self):
+        """Tests that values path returns the same data as SeanceModelSerializer"""
+        seances = self.client.get('/api/seance/', {'date': self.tomorrow, 'ordering': 'expensive'}).json()
+        expected = self.serialize(serializers.SeanceModelSerializer,
+                                  Seance.order_queryset('expensive', Seance.get_active_seances_for_day(self.tomorrow)))
+        self.assertEqual(seances, expected)
+
+    def test_seance_retrieve(self):
+        response = self.client.get(f'/api/seance/{self.seance_bond_night.pk}/', {'date': self.tomorrow}).json()
+        self.assertEqual(response['seance'],
+                         self.serialize(serializers.SeanceModelSerializer, self.seance_bond_night, many=False))
+        self.assertEqual(len(response['seats']), self.hall_yellow.quantity_seats)
+
+    def test_price_list(self):
+        prices = self.client.get('/api/price/').json()['results']
+        expected = self.serialize(serializers.PriceModelSerializer, Price.objects.order_by('-created_at', '-pk'))
+        self.assertEqual(prices, expected)
+
+
+class ScheduleTestCase(TestCase, BaseInitial):
+
+    def setUp(self):
+        BaseInitial.__init__(self)
+        self.today = datetime.date.today()
+
+    def test_schedule(self):
+        """Tests that schedule returns seances grouped by days with free seats and fixed number of queries"""
+        date_from = self.today + datetime.timedelta(days=1)
+        data = {'date_from': str(date_from), 'date_to': str(date_from + datetime.timedelta(days=6))}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/seance/schedule/', data)
+        self.assertEqual(response.status_code, 200)
+        days = response.json()['days']
+        self.assertEqual([day['date'] for day in days],
+                         [str(date_from + datetime.timedelta(days=day)) for day in range(7)])
+        self.assertEqual([len(day['seances']) for day in days], [6] * 7)
+
+        # tickets of BaseInitial are sold on bond night seance in 3 days
+        seats_free = {(day['date'], seance['pk']): seance['seats_free'] for day in days for seance in day['seances']}
+        self.assertEqual(seats_free[(str(self.ticket1.date_seance), self.seance_bond_night.pk)],
+                         self.hall_yellow.quantity_seats - 2)
+        self.assertEqual(seats_free[(str(date_from), self.seance_bond_night.pk)], self.hall_yellow.quantity_seats)
+        self.assertLessEqual(len(queries), 4)
+
+    def test_schedule_range(self):
+        self.assertEqual(self.client.get('/api/seance/schedule/').status_code, 200)
+        response = self.client.get('/api/seance/schedule/', {'date_from': str(self.today),
+                                                             'date_to': str(self.today + datetime.timedelta(days=60))})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/seance/schedule/', {'date_from': str(self.today + datetime.timedelta(days=2)),
+                                                             'date_to': str(self.today)})
+        self.assertEqual(response.status_code, 400)
+
+
+class ScheduleImportTestCase(TestCase, BaseInitial):
+
+    def setUp(self):
+        BaseInitial.__init__(self)
+        self.client.post('/accounts/login/', data={'username': self.admin.username, 'password': 'password1'})
+        self.url = f'/api-admin/seance_base/{self.seance_base_bond.pk}/schedule/'
+
+    def test_import_csv(self):
+        """Tests that seances from csv are created with one insert together with their occurrences"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'csv': 'time_starts,advertisements_duration\n08:00\n15:00,00:20'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        seances = Seance.objects.filter(pk__in=response.json()['created'])
+        self.assertEqual([(seance.time_starts, seance.time_hall_free) for seance in seances],
+                         [(datetime.time(8), datetime.time(10, 0)), (datetime.time(15), datetime.time(17, 10))])
+        days = (self.seance_base_bond.date_ends - self.seance_base_bond.date_starts).days + 1
+        self.assertEqual(seances[0].occurrences.count(), days)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT INTO "seance_seance"')]),
+                         1)
+
+    def test_import_conflicts(self):
+        """Tests that nothing is created, if rows intersect, and intersections are reported for every row"""
+        count = Seance.objects.count()
+        response = self.client.post(self.url, {'seances': [{'time_starts': '08:00'}, {'time_starts': '09:00'},
+                                                           {'time_starts': '13:00'}, {'time_starts': '16:00'}]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        rows = response.json()['rows']
+        self.assertEqual([row['rows'] for row in rows], [[1], [0], [], []])
+        self.assertEqual([[seance['pk'] for seance in row['seances']] for row in rows],
+                         [[], [], [self.seance_bond_12.pk], []])
+        self.assertEqual(Seance.objects.count(), count)
+
+    def test_import_invalid_csv(self):
+        """Tests that wrong values are reported for rows of csv"""
+        response = self.client.post(self.url, {'csv': '08:00\nnoon'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('time_starts', response.json()['csv'][1])
+
+    def test_import_form(self):
+        """Tests that myadmin form shows intersections and creates seances, if there are none"""
+        url = reverse_lazy('myadmin:seance_schedule_import')
+        response = self.client.post(url, {'seance_base': self.seance_base_bond.pk, 'schedule': '08:00\n13:00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['rows'][1]['seances'][0]['pk'], self.seance_bond_12.pk)
+
+        response = self.client.post(url, {'seance_base': self.seance_base_bond.pk, 'schedule': '08:00\n15:00'})
+        self.assertRedirects(response, reverse_lazy('myadmin:seance_list'))
+        self.assertTrue(Seance.objects.filter(seance_base=self.seance_base_bond, time_starts=datetime.time(15)))
+
+
+class ScheduleGenerateTestCase(TestCase, BaseInitial):
+
+    def setUp(self):
+        BaseInitial.__init__(self)
+        self.client.post('/accounts/login/', data={'username': self.admin.username, 'password': 'password1'})
+
+    def test_generate_preview(self):
+        """Tests that generated seances fill gaps between existing seances of the hall"""
+        response = self.client.post('/api-admin/seance/generate/', {'seance_bases': [self.seance_base_bond.pk]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        seances = response.json()['seance_bases'][0]['seances']
+        self.assertEqual([seance['time_starts'] for seance in seances],
+                         ['09:00:00', '14:10:00', '16:10:00', '21:10:00'])
+
+        # preview can be imported as it is
+        response = self.client.post(f'/api-admin/seance_base/{self.seance_base_bond.pk}/schedule/',
+                                    {'seances': seances}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_generate_command(self):
+        """Tests that command creates generated seances with --commit only"""
+        count = Seance.objects.count()
+        out = StringIO()
+        call_command('generate_schedule', self.seance_base_bond.pk, '--opens', '15:00', stdout=out)
+        self.assertIn('15:00 - 16:50', out.getvalue())
+        self.assertEqual(Seance.objects.count(), count)
+
+        call_command('generate_schedule', self.seance_base_bond.pk, '--opens', '15:00', '--commit',
+                     self.admin.username, stdout=out)
+        # 15:00, 17:00 and 21:10, the hall is busy from 19:00 till 21:10
+        self.assertEqual(Seance.objects.count(), count + 3)
+
+
+class TokenAuthenticationTestCase(TestCase, BaseInitial):
+
+    # session authentication goes first, so failed authentication gives 403, not 401
+
+    def setUp(self):
+        BaseInitial.__init__(self)
+        token_cache.clear()
+        self.token = Token.objects.create(user=self.user)
+
+    def test_token_is_cached(self):
+        """Tests that token is looked up in database once and stops working after logout"""
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        self.assertEqual(self.client.get('/api/purchase/', **auth).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/purchase/', **auth).status_code, 200)
+        self.assertFalse([query for query in queries if 'authtoken_token' in query['sql']])
+
+        # every request gets own copy of cached user
+        first, second = token_cache.get(self.token.key), token_cache.get(self.token.key)
+        self.assertIsNot(first.user, second.user)
+        first.user.wallet = 0
+        self.assertEqual(second.user.wallet, self.user.wallet)
+        self.assertIsNot(first.user._state, second.user._state)
+        self.assertIs(first._state.fields_cache['user'], first.user)
+
+        self.assertEqual(self.client.post('/api/rest-auth/logout/', **auth).status_code, 200)
+        self.assertEqual(self.client.get('/api/purchase/', **auth).status_code, 403)
+
+    def test_expired_tokens_are_pruned(self):
+        """Tests that entries of tokens, which aren't used any more, are dropped by later puts"""
+        cache = TokenCache(ttl=10)
+        with patch('seance.API.authentication.time.monotonic', return_value=cache.next_prune - 5):
+            cache.set('old', self.token)
+        with patch('seance.API.authentication.time.monotonic', return_value=cache.next_prune + 6):
+            self.assertIsNone(cache.get('old'))
+            cache.set('new', self.token)
+        self.assertEqual(list(cache.entries), ['new'])
+
+    def test_signed_token(self):
+        """Tests that signed token works for both apis and is revoked together with token"""
+        response = self.client.post('/api/rest-auth/signed-token/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        signed = response.json()['token']
+        self.assertEqual(self.client.get('/api/purchase/', HTTP_AUTHORIZATION=f'Signed {signed}').status_code, 200)
+        self.assertEqual(self.client.get('/api/purchase/', HTTP_AUTHORIZATION=f'Signed {signed}x').status_code, 403)
+
+        admin_token = Token.objects.create(user=self.admin)
+        admin_signed = make_signed_token(admin_token)
+        response = self.client.get('/api-admin/hall/', HTTP_AUTHORIZATION=f'Signed {admin_signed}')
+        self.assertEqual(response.status_code, 200)
+
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/purchase/', HTTP_AUTHORIZATION=f'Signed {signed}').status_code, 403)
@@ -1,12 +1,27 @@
 import datetime
+import shutil
+import tempfile
+import time
+from io import StringIO
 from time import sleep
+from unittest.mock import patch
 
-from django.test import TestCase
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import SystemCheckError
+from django.db import connection
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse_lazy
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 
 from cinema import settings
+from seance.activity import flush_activity, record_activity, GENERATION_KEY
+from seance.checks import check_last_activity_cache
+from seance.middlewares import seance_context_processor
 from seance.models import AdvUser
+from seance.sessions import get_basket_store, sign_value
 
 
 class CustomMiddlewareTestCase(TestCase):
@@ -45,7 +60,7 @@ class CustomMiddlewareTestCase(TestCase):
 
         # set user's last activity to -5 minutes
         session = self.client.session
-        session['last_activity'] = str(datetime.datetime.now() - datetime.timedelta(minutes=5))
+        session['last_activity'] = int(time.time()) - 5 * 60 - 1
         session.save()
 
         # user is authenticated with last activity more than 5 minutes age.
@@ -64,5 +79,82 @@ class CustomMiddlewareTestCase(TestCase):
         response = self.client.get(reverse_lazy('seance:index'))
         self.assertTrue(response.context.get('user').is_authenticated)
         session = self.client.session
-        last_activity = datetime.datetime.strptime(session['last_activity'], '%Y-%m-%d %H:%M:%S.%f')
-        self.assertTrue(last_activity > datetime.datetime.now() - datetime.timedelta(minutes=5))
+        self.assertTrue(session['last_activity'] > time.time() - 5 * 60)
+
+    def test_last_activity_write_coalescing(self):
+        """Tests that session isn't saved on every request and old string format of last activity is understood"""
+        self.client.post('/accounts/login/', data={'username': self.user.username, 'password': 'password1'})
+        session = self.client.session
+        session['last_activity'] = str(datetime.datetime.now() - datetime.timedelta(minutes=1))
+        session.save()
+        self.client.get(reverse_lazy('seance:contacts'))
+        last_activity = self.client.session['last_activity']
+        self.assertIsInstance(last_activity, int)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse_lazy('seance:contacts'))
+        self.assertTrue(response.context.get('user').is_authenticated)
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "django_session"')])
+        self.assertEqual(self.client.session['last_activity'], last_activity)
+
+    @patch('seance.middlewares.LAST_ACTIVITY_PERSIST', True)
+    @patch('seance.middlewares.LAST_ACTIVITY_REFRESH', 0)
+    @patch('seance.activity.LAST_ACTIVITY_CACHE', 'shared')
+    def test_last_activity_flush(self):
+        """Tests that last activities are saved to users by batches through shared cache"""
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        caches_settings = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                           'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                      'LOCATION': location}}
+        with override_settings(CACHES=caches_settings):
+            self.client.post('/accounts/login/', data={'username': self.user.username, 'password': 'password1'})
+            self.client.get(reverse_lazy('seance:contacts'))
+            self.assertEqual(flush_activity(), 1)
+            self.assertEqual(flush_activity(), 0)
+            last_activity = AdvUser.objects.get(pk=self.user.pk).last_activity
+            self.assertLess(timezone.now() - last_activity, datetime.timedelta(minutes=1))
+
+            # activity, recorded after generation was read by flush, is saved by the next one
+            record_activity(self.user_old.pk, 0)
+            record_activity(self.user.pk, 1)
+            record_activity(self.user.pk, 2)
+            cache = caches['shared']
+            cache.incr(GENERATION_KEY)
+            record_activity(self.user.pk, 3)
+            self.assertEqual(flush_activity(), 2)
+            self.assertEqual(AdvUser.objects.get(pk=self.user.pk).last_activity.timestamp(), 3)
+            self.assertEqual(AdvUser.objects.get(pk=self.user_old.pk).last_activity.timestamp(), 0)
+            self.assertEqual(flush_activity(), 0)
+
+    def test_last_activity_cache_check(self):
+        """Tests that local memory cache of last activities is reported once by system check, not by requests"""
+        with patch('seance.checks.LAST_ACTIVITY_PERSIST', True), patch('seance.checks.LAST_ACTIVITY_CACHE', 'default'):
+            self.assertEqual([error.id for error in check_last_activity_cache(None)], ['seance.E001'])
+            with self.assertRaises(SystemCheckError):
+                call_command('check')
+        self.assertEqual(check_last_activity_cache(None), [])
+
+    def test_seance_context_processor_is_lazy(self):
+        """Tests that context processor loads neither user, nor basket, till template uses its values"""
+        request = RequestFactory().get('/')
+        request.user = SimpleLazyObject(lambda: self.fail('user was loaded'))
+        context = seance_context_processor(request)
+        self.assertEqual(set(context), {'basket', 'total_price', 'last_seance', 'seance_date'})
+
+        request.user = self.user
+        request.COOKIES['seance_date'] = sign_value('seance_date', '2020-06-01')
+        get_basket_store().set(self.user.pk, {'1': {'seat_pk': '1', 'price': '120'}})
+        context = seance_context_processor(request)
+        self.assertEqual(context['seance_date'], '2020-06-01')
+        self.assertEqual(context['total_price'], 120)
+        self.assertFalse(context['last_seance'])
+
+    def test_benchmark_context_processor(self):
+        """Tests that benchmark renders myadmin pages with both processors"""
+        AdvUser.objects.create_superuser('admin', 'admin@somesite.com', 'password1')
+        out = StringIO()
+        call_command('benchmark_context_processor', 'main', 'film_list', '--repeat', '1', '--host', 'testserver',
+                     stdout=out)
+        self.assertEqual([line.split(':')[0] for line in out.getvalue().splitlines()],
+                         ['processor (lazy)', 'processor (eager)', 'main', 'film_list'])
@@ -1,14 +1,32 @@
 import datetime
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
 from django.db.models import ProtectedError
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
-from seance.models import Film, Hall, Seance, AdvUser, Purchase, Ticket, SeanceBase, SeatCategory, Seat, Price
+from seance.holds import DatabaseHoldBackend, CacheHoldBackend, get_hold_backend
+from seance.intervals import SeanceIntervals, pack_seances
+from seance.management.commands.explain_hot_queries import find_full_scans
+from seance.layout import hall_layout_key, get_layout_generation, invalidate_layouts
+from seance.models import Film, Hall, Seance, AdvUser, Purchase, Ticket, SeanceBase, SeatCategory, Seat, Price, \
+    SeatHold, SeanceOccurrence
+from seance import occupancy
+from seance.occupancy import SeatOccupancy
+from seance.purchases import create_purchase, return_purchase, PurchaseError, InsufficientFunds, TicketsAlreadySold, \
+    SeatsHeld
 
 
 class BaseInitial:
     def __init__(self):
+        # cached seat maps and boards must not outlive objects of previous test
+        for cache_backend in caches.all():
+            cache_backend.clear()
 
         self.film_bond = Film.objects.get(title='James Bond')
         self.film_365 = Film.objects.get(title='365 Days')
@@ -257,6 +275,80 @@ class GeneralModelsTestCase(TestCase, BaseInitial):
         self.assertEqual(intersects_night[0].time_starts, datetime.time(23, 50))
         self.assertEqual(intersects_night.count(), 1)
 
+    def test_validate_batch_intersect(self):
+        """Tests that batch of new seances is checked against seances of the hall and against each other"""
+        seances = [Seance(time_starts=datetime.time(hour), seance_base=self.seance_base_bond) for hour in (1, 2, 8)]
+        for seance in seances:
+            seance.save(commit=False)
+
+        conflicts = Seance.validate_batch_intersect(self.seance_base_bond.hall_id, seances)
+        self.assertEqual(conflicts[0], {'seances': {self.seance_bond_night.pk}, 'proposals': {1}})
+        self.assertEqual(conflicts[1], {'seances': set(), 'proposals': {0}})
+        self.assertEqual(conflicts[2], {'seances': set(), 'proposals': set()})
+
+    def test_intersect_with_next_base(self):
+        """Tests that seance of the last day of base, going through midnight, is checked against the next base"""
+        date = datetime.date.today() + datetime.timedelta(days=100)
+        base_last_day = SeanceBase.objects.create(film=self.film_bond, hall=self.hall_red, date_starts=date,
+                                                  date_ends=date)
+        base_next_day = SeanceBase.objects.create(film=self.film_terminator, hall=self.hall_red,
+                                                  date_starts=date + datetime.timedelta(days=1),
+                                                  date_ends=date + datetime.timedelta(days=3))
+        seance_after_midnight = Seance.objects.create(seance_base=base_next_day, time_starts=datetime.time(0, 30),
+                                                      description='some text', admin=self.admin2)
+
+        seance = Seance(time_starts=datetime.time(23, 30), seance_base=base_last_day)
+        seance.save(commit=False)
+        self.assertEqual(list(seance.validate_seances_intersect()), [seance_after_midnight])
+        self.assertEqual(Seance.validate_batch_intersect(self.hall_red.pk, [seance]),
+                         [{'seances': {seance_after_midnight.pk}, 'proposals': set()}])
+
+    def test_intervals_split_at_midnight(self):
+        """Tests that part of seance after midnight occupies hall on the next dates only"""
+        today = datetime.date.today()
+        intervals = SeanceIntervals([(1, datetime.time(23), datetime.time(1), today, today)])
+        self.assertEqual(intervals.conflicts(datetime.time(0, 30), datetime.time(2), today, today), set())
+        self.assertEqual(intervals.conflicts(datetime.time(0, 30), datetime.time(2),
+                                             today + datetime.timedelta(days=1), today + datetime.timedelta(days=1)),
+                         {1})
+        self.assertEqual(intervals.conflicts(datetime.time(22), datetime.time(23, 30), today, today), {1})
+
+    def test_seance_minutes(self):
+        """Tests that minutes of seances are counted from the start of the day, also through midnight"""
+        self.assertEqual(self.film_bond.duration_minutes, 100)
+        self.assertEqual((self.seance_bond_12.starts_minute, self.seance_bond_12.ends_minute,
+                          self.seance_bond_12.hall_free_minute), (720, 840, 850))
+        self.assertEqual((self.seance_bond_night.starts_minute, self.seance_bond_night.ends_minute,
+                          self.seance_bond_night.hall_free_minute), (1430, 1530, 1540))
+
+    def test_hot_queries_use_indexes(self):
+        """Tests that none of the hot queries scans full table"""
+        self.assertEqual(find_full_scans('2 0 0 SCAN TABLE seance_ticket', 'sqlite'), ['seance_ticket'])
+        self.assertEqual(find_full_scans('2 0 0 SCAN seance_ticket USING INDEX idx', 'sqlite'), ['seance_ticket'])
+        self.assertEqual(find_full_scans('2 0 0 SCAN seance_ticket USING COVERING INDEX idx', 'sqlite'),
+                         ['seance_ticket'])
+        self.assertEqual(find_full_scans('2 0 0 SEARCH seance_ticket USING COVERING INDEX idx (seance_id=?)',
+                                         'sqlite'), [])
+        self.assertEqual(find_full_scans('Seq Scan on seance_ticket  (cost=0.00..1.01 rows=1)', 'postgresql'),
+                         ['seance_ticket'])
+        out = StringIO()
+        call_command('explain_hot_queries', '--fail', stdout=out)
+        self.assertNotIn('full scan', out.getvalue())
+        # tickets of seance are found by index, which isn't limited to not returned tickets
+        if connection.vendor == 'sqlite':
+            plan = self.seance_bond_night.get_sold_but_not_used_tickets().explain()
+            self.assertIn('ticket_seance_date_idx', plan)
+
+    def test_pack_seances(self):
+        """Tests that films take turns in free time of the hall on their dates"""
+        today = datetime.date.today()
+        tomorrow = today + datetime.timedelta(days=1)
+        busy = [(600, 660, tomorrow, tomorrow), (780, 800, today, today)]
+        films = [('a', 60, today, today), ('b', 90, today, today)]
+        self.assertEqual(pack_seances(films, busy, 600, 900), [('a', 600), ('b', 660), ('a', 800)])
+        films = [('a', 70, today, today), ('b', 90, today, today)]
+        self.assertEqual(pack_seances(films, [], 600, 900, step=30), [('a', 600), ('b', 690), ('a', 780)])
+
     def test_seance_activation(self):
         """Tests that seance activation works correctly"""
         seance_test = Seance.objects.create(
@@ -278,6 +370,8 @@ class GeneralModelsTestCase(TestCase, BaseInitial):
         )
 
         self.assertIsNotNone(Price.objects.get(pk=price_test.pk))
+        # completeness of prices is checked by prices_count, which is maintained in database
+        seance_test.refresh_from_db()
         result = seance_test.activate()
         self.assertTrue(result['success'])
         self.assertEqual(len(result['errors_list']), 0)
@@ -373,6 +467,10 @@ class GeneralModelsTestCase(TestCase, BaseInitial):
         self.assertEqual(self.purchase.tickets.count(), 2)
         self.assertEqual(self.purchase.total_price, 240)
 
+        # tickets are joined only, when totals are asked for
+        self.assertNotIn('JOIN', str(Purchase.objects.filter(user=self.user).query))
+        self.assertEqual(Purchase.objects.with_totals().get(pk=self.purchase.pk).tickets_total, 240)
+
     def test_related_objects_deletion(self):
         """Tests that related objects can't be deleted"""
         with self.assertRaises(ProtectedError):
@@ -390,5 +488,299 @@ class GeneralModelsTestCase(TestCase, BaseInitial):
         with self.assertRaises(ProtectedError):
             self.seat_category_base.delete()
 
+    def test_seat_occupancy_bitset(self):
+        """Tests that SeatOccupancy works as bitset of seat ordinals"""
+        occupancy = SeatOccupancy.from_ordinals([0, 3, 399])
+        self.assertIn(3, occupancy)
+        self.assertNotIn(1, occupancy)
+        self.assertEqual(len(occupancy), 3)
+
+        occupancy.free(3)
+        occupancy.take(5)
+        restored = SeatOccupancy.from_bytes(occupancy.to_bytes())
+        self.assertEqual(list(restored.ordinals()), [0, 5, 399])
+        self.assertLessEqual(len(occupancy.to_bytes()), 50)
+
+    def test_seance_seats_taken(self):
+        """Tests that occupancy of seance is built with one query and is invalidated when tickets change"""
+        date_seance = datetime.date.today() + datetime.timedelta(days=3)
+        seats = self.hall_yellow.seats.all()
+
+        with self.assertNumQueries(3):
+            seats_taken = self.seance_bond_night.get_seats_taken(date_seance)
+        self.assertEqual(seats_taken, {self.ticket1.seat_id, self.ticket2.seat_id})
+
+        # occupancy is taken from cache
+        with self.assertNumQueries(0):
+            self.seance_bond_night.get_seats_taken(date_seance)
+
+        ticket3 = Ticket.objects.create(seance=self.seance_bond_night, date_seance=date_seance,
+                                        purchase=self.purchase, seat=seats[2], price=120)
+        self.ticket1.was_returned = True
+        self.ticket1.save()
+        # changes of tickets invalidate occupancy, it's rebuilt by the next read
+        with self.assertNumQueries(1):
+            seats_taken = self.seance_bond_night.get_seats_taken(date_seance)
+        self.assertEqual(seats_taken, {self.ticket2.seat_id, ticket3.seat_id})
+        with self.assertNumQueries(0):
+            self.seance_bond_night.get_seats_taken(date_seance)
+
+        # occupancy, built from tickets before their change, isn't read after it
+        generation = occupancy.get_occupancy_generation(self.seance_bond_night.pk, date_seance)
+        occupancy.invalidate_occupancy(self.seance_bond_night.pk, date_seance)
+        layout = Hall.get_layout(self.hall_yellow.pk)
+        occupancy.cache_occupancy(self.seance_bond_night.pk, date_seance, self.hall_yellow.pk, layout['version'],
+                                  occupancy.SeatOccupancy(), generation)
+        self.assertEqual(self.seance_bond_night.get_seats_taken(date_seance), seats_taken)
+
+        # other dates are not touched
+        self.assertFalse(self.seance_bond_night.get_seats_taken(date_seance + datetime.timedelta(days=1)))
+
+    def test_hall_layout(self):
+        """Tests that layout of hall is built with one query, cached and invalidated with seats changes"""
+        with self.assertNumQueries(1):
+            layout = Hall.get_layout(self.hall_yellow.pk)
+        self.assertEqual(len(layout['rows']), 10)
+        self.assertEqual([seat['number'] for seat in layout['rows'][0]['seats']], list(range(1, 11)))
+        self.assertEqual(layout['palette'], {self.seat_category_base.pk: {'name': 'base',
+                                                                           'color': self.seat_category_base.color}})
+        self.assertEqual(layout['index'][layout['seats'][15]], 15)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Hall.get_layout(self.hall_yellow.pk)['version'], layout['version'])
+
+        # editing of seat category changes palette
+        self.seat_category_base.color = '#000000'
+        self.seat_category_base.save()
+        new_layout = Hall.get_layout(self.hall_yellow.pk)
+        self.assertNotEqual(new_layout['version'], layout['version'])
+        self.assertEqual(new_layout['palette'][self.seat_category_base.pk]['color'], '#000000')
+
+        # creating of seats changes layout
+        self.hall_yellow.create_or_update_seats(seat_category=self.seat_category_base, row=1,
+                                                number_starts=11, number_ends=11)
+        new_layout = Hall.get_layout(self.hall_yellow.pk)
+        self.assertEqual(new_layout['rows'][0]['seats'][-1]['number'], 11)
+        self.assertEqual(len(new_layout['seats']), 101)
+
+        # layout, built from seats before their change, isn't read after it
+        generation = get_layout_generation(self.hall_yellow.pk)
+        invalidate_layouts([self.hall_yellow.pk])
+        cache.set(hall_layout_key(self.hall_yellow.pk, generation), layout)
+        self.assertEqual(len(Hall.get_layout(self.hall_yellow.pk)['seats']), 101)
+
+    def test_apply_seats_layout(self):
+        """Tests that spec of seats is applied as a diff with constant number of queries"""
+        hall_test = Hall.objects.create(
+            name='Multiplex',
+            quantity_seats=1200,
+            quantity_rows=30,
+            description='some text',
+            admin=self.admin2
+        )
+        seat_category_vip = SeatCategory.objects.create(name='vip', admin=self.admin2)
+        spec = [(row, 1, 40, self.seat_category_base.pk) for row in range(1, 31)]
+
+        # inserts are batched by database backend, but it's far from one query per seat
+        with CaptureQueriesContext(connection) as queries:
+            layout = hall_test.apply_seats_layout(spec)
+        self.assertLess(len(queries), 15)
+        self.assertEqual(len(layout['seats']), 1200)
+        self.assertTrue(hall_test.activate_hall()['success'])
+
+        # only the last row changes category, one seat is removed from spec
+        spec[-1] = (30, 1, 39, seat_category_vip.pk)
+        layout = hall_test.apply_seats_layout(spec, replace=True)
+        self.assertEqual(len(layout['seats']), 1199)
+        self.assertEqual({seat['category'] for seat in layout['rows'][-1]['seats']}, {seat_category_vip.pk})
+        self.assertEqual(Seat.objects.filter(hall=hall_test, seat_category=seat_category_vip).count(), 39)
+
+    def test_create_purchase(self):
+        """Tests that purchase is created with the same number of queries for any size of basket"""
+        date_seance = str(datetime.date.today() + datetime.timedelta(days=5))
+        seats = self.hall_yellow.seats.all()
+
+        def basket(seats_slice):
+            return [{'seat_pk': seat.pk, 'seance_pk': self.seance_bond_night.pk, 'seance_date': date_seance}
+                    for seat in seats_slice]
+
+        with CaptureQueriesContext(connection) as queries_small:
+            create_purchase(self.user.pk, basket(seats[0:2]))
+        with CaptureQueriesContext(connection) as queries_big:
+            purchase = create_purchase(self.user.pk, basket(seats[10:40]))
+        self.assertEqual(len(queries_small), len(queries_big))
+        self.assertEqual(purchase.total_price, 30 * 120)
+        self.assertEqual(AdvUser.objects.get(pk=self.user.pk).wallet, 10000 - 32 * 120)
+
+        with self.assertRaises(TicketsAlreadySold):
+            create_purchase(self.user.pk, basket(seats[39:41]))
+        with self.assertRaises(InsufficientFunds):
+            create_purchase(self.user.pk, basket(seats[41:100]) * 2)
+        # seat from other hall
+        with self.assertRaises(PurchaseError):
+            create_purchase(self.user.pk, basket(self.hall_red.seats.all()[0:1]))
+        self.assertEqual(AdvUser.objects.get(pk=self.user.pk).wallet, 10000 - 32 * 120)
+
+    def test_purchase_totals(self):
+        """Tests that total price of purchase and money spent by user are kept by purchase and return flows"""
+        date_seance = str(datetime.date.today() + datetime.timedelta(days=5))
+        seats = self.hall_yellow.seats.all()[10:13]
+        purchase = create_purchase(self.user.pk, [{'seat_pk': seat.pk, 'seance_pk': self.seance_bond_night.pk,
+                                                   'seance_date': date_seance} for seat in seats])
+        self.assertEqual(Purchase.objects.get(pk=purchase.pk).total_price, 3 * 120)
+        self.assertEqual(self.user.sum_money_spent, 240 + 3 * 120)
+
+        return_purchase(purchase.pk)
+        user = AdvUser.objects.get(pk=self.user.pk)
+        self.assertEqual((user.money_spent, user.wallet), (240, 10000))
+        self.assertFalse(Ticket.objects.filter(purchase=purchase, was_returned=False).exists())
+        with self.assertRaises(PurchaseError):
+            return_purchase(purchase.pk)
+
+        # seats of returned tickets are free and can be bought again
+        self.assertFalse(set(seat.pk for seat in seats) & self.seance_bond_night.get_seats_taken(date_seance))
+        purchase = create_purchase(self.user.pk, [{'seat_pk': seat.pk, 'seance_pk': self.seance_bond_night.pk,
+                                                   'seance_date': date_seance} for seat in seats])
+        self.assertEqual(Ticket.objects.filter(seat__in=seats, date_seance=date_seance).count(), 6)
+        return_purchase(purchase.pk)
+
+        # totals, spoiled by bulk updates, are recounted
+        Purchase.objects.update(total_price=0)
+        AdvUser.objects.update(money_spent=0)
+        call_command('reconcile_spending', stdout=StringIO())
+        self.assertEqual(Purchase.objects.get(pk=self.purchase.pk).total_price, 240)
+        self.assertEqual(Purchase.objects.get(pk=purchase.pk).total_price, 3 * 120)
+        self.assertEqual(self.user.sum_money_spent, 240)
 
-
+    def test_purchase_of_held_seat(self):
+        """Tests that seat, held by another user, can't be bought, and the holder can buy it"""
+        date_seance = datetime.date.today() + datetime.timedelta(days=5)
+        seats = self.hall_yellow.seats.all()[50:52]
+        items = [{'seat_pk': seat.pk, 'seance_pk': self.seance_bond_night.pk, 'seance_date': str(date_seance)}
+                 for seat in seats]
+        get_hold_backend().acquire(self.seance_bond_night.pk, date_seance, seats[1].pk, self.admin.pk)
+
+        with self.assertRaises(SeatsHeld):
+            create_purchase(self.user.pk, items)
+        self.assertEqual(AdvUser.objects.get(pk=self.user.pk).wallet, 10000)
+        self.assertFalse(Ticket.objects.filter(seat__in=seats, date_seance=date_seance).exists())
+
+        purchase = create_purchase(self.admin.pk, items)
+        self.assertEqual(purchase.tickets.count(), 2)
+        self.assertFalse(get_hold_backend().held_seats(self.seance_bond_night.pk, date_seance))
+
+    def check_hold_backend(self, backend):
+        date_seance = datetime.date.today() + datetime.timedelta(days=5)
+        seance_pk = self.seance_bond_night.pk
+        seat1, seat2 = [seat.pk for seat in self.hall_yellow.seats.all()[0:2]]
+
+        self.assertTrue(backend.acquire(seance_pk, date_seance, seat1, self.user.pk))
+        # user prolongs his own hold, but can't take seat, held by another user
+        self.assertTrue(backend.acquire(seance_pk, date_seance, seat1, self.user.pk))
+        self.assertFalse(backend.acquire(seance_pk, date_seance, seat1, self.admin.pk))
+        self.assertTrue(backend.acquire(seance_pk, str(date_seance), seat2, self.admin.pk))
+        self.assertEqual(backend.held_seats(seance_pk, date_seance), {seat1: self.user.pk, seat2: self.admin.pk})
+        self.assertEqual(backend.held_seats(seance_pk, date_seance + datetime.timedelta(days=1)), {})
+
+        # only holder releases the hold
+        backend.release(seance_pk, date_seance, [seat1], self.admin.pk)
+        self.assertFalse(backend.acquire(seance_pk, date_seance, seat1, self.admin.pk))
+        backend.release(seance_pk, date_seance, [seat1], self.user.pk)
+        self.assertTrue(backend.acquire(seance_pk, date_seance, seat1, self.admin.pk))
+        self.assertEqual(backend.held_seats(seance_pk, date_seance), {seat1: self.admin.pk, seat2: self.admin.pk})
+
+    def test_database_hold_backend(self):
+        self.check_hold_backend(DatabaseHoldBackend())
+
+        # expired hold is not shown, can be taken by another user and is removed by sweep
+        backend = DatabaseHoldBackend(timeout=datetime.timedelta(seconds=-1))
+        date_seance = datetime.date.today() + datetime.timedelta(days=6)
+        seat = self.hall_yellow.seats.all()[0].pk
+        self.assertTrue(backend.acquire(self.seance_bond_night.pk, date_seance, seat, self.user.pk))
+        self.assertEqual(backend.held_seats(self.seance_bond_night.pk, date_seance), {})
+        self.assertTrue(backend.acquire(self.seance_bond_night.pk, date_seance, seat, self.admin.pk))
+        self.assertEqual(backend.sweep(), 1)
+        self.assertEqual(SeatHold.objects.count(), 2)
+
+    def test_cache_hold_backend(self):
+        self.check_hold_backend(CacheHoldBackend())
+
+    def test_purchase_releases_holds(self):
+        backend = DatabaseHoldBackend()
+        date_seance = str(datetime.date.today() + datetime.timedelta(days=5))
+        seat = self.hall_yellow.seats.all()[5]
+        backend.acquire(self.seance_bond_night.pk, date_seance, seat.pk, self.user.pk)
+        create_purchase(self.user.pk, [{'seat_pk': seat.pk, 'seance_pk': self.seance_bond_night.pk,
+                                        'seance_date': date_seance}])
+        self.assertEqual(backend.held_seats(self.seance_bond_night.pk, date_seance), {})
+
+    def test_seance_occurrences(self):
+        """Tests that occurrences of seance follow dates of seance base, time and status of seance"""
+        seance_base = SeanceBase.objects.create(
+            film=self.film_terminator,
+            hall=self.hall_yellow,
+            date_starts=datetime.date.today() + datetime.timedelta(days=1),
+            date_ends=datetime.date.today() + datetime.timedelta(days=3)
+        )
+        seance_test = Seance.objects.create(
+            seance_base=seance_base,
+            time_starts=datetime.time(8),
+            description='some text',
+            admin=self.admin2
+        )
+        occurrences = SeanceOccurrence.objects.filter(seance=seance_test)
+        self.assertEqual(list(occurrences.values_list('date', flat=True)),
+                         [datetime.date.today() + datetime.timedelta(days=day) for day in range(1, 4)])
+        self.assertFalse(occurrences.filter(is_active=True).exists())
+
+        seance_test.is_active = True
+        seance_test.time_starts = datetime.time(9)
+        seance_test.save()
+        self.assertEqual(occurrences.filter(is_active=True, time_starts=datetime.time(9)).count(), 3)
+
+        seance_base.date_starts = datetime.date.today() + datetime.timedelta(days=2)
+        seance_base.date_ends = datetime.date.today() + datetime.timedelta(days=5)
+        seance_base.hall = self.hall_red
+        seance_base.save()
+        self.assertEqual(list(occurrences.values_list('date', flat=True)),
+                         [datetime.date.today() + datetime.timedelta(days=day) for day in range(2, 6)])
+        self.assertEqual(occurrences.filter(hall=self.hall_red).count(), 4)
+        self.assertIn(seance_test, Seance.get_active_seances_for_day(datetime.date.today() +
+                                                                     datetime.timedelta(days=5)))
+        self.assertNotIn(seance_test, Seance.get_active_seances_for_day(datetime.date.today() +
+                                                                        datetime.timedelta(days=1)))
+
+    def test_seance_price_stats(self):
+        """Tests that min, max price and quantity of prices of seance follow its prices"""
+        seance_test = Seance.objects.create(
+            time_starts=datetime.time(8),
+            description='some text',
+            seance_base=self.seance_base_bond,
+            admin=self.admin2
+        )
+        category_vip = SeatCategory.objects.create(name='vip', admin=self.admin)
+        price_base = Price.objects.create(seance=seance_test, seat_category=self.seat_category_base, price=100)
+        price_vip = Price.objects.create(seance=seance_test, seat_category=category_vip, price=300)
+        stats = Seance.objects.filter(pk=seance_test.pk).values_list(*Seance.PRICE_STATS_FIELDS).get()
+        self.assertEqual(stats, (100, 300, 2))
+
+        price_base.price = 150
+        price_base.save()
+        # saving of seance with stale stats doesn't overwrite them
+        seance_test.save()
+        price_vip.delete()
+        seance_test.refresh_from_db()
+        self.assertEqual((seance_test.min_price, seance_test.max_price, seance_test.prices_count), (150, 150, 1))
+
+        # seances with preset pk are inserted
+        seance_preset = Seance.objects.create(pk=999, seance_base=seance_test.seance_base,
+                                              time_starts=datetime.time(3), admin=self.admin2)
+        self.assertEqual(Seance.objects.get(pk=999).time_starts, datetime.time(3))
+        Seance(pk=1000, seance_base=seance_test.seance_base, time_starts=datetime.time(4), admin=self.admin2).save()
+        self.assertTrue(Seance.objects.filter(pk=1000).exists())
+        seance_preset.description = 'preset'
+        seance_preset.save()
+        self.assertEqual(Seance.objects.get(pk=999).description, 'preset')
+
+        cheap = list(Seance.order_queryset('cheap', Seance.objects.filter(prices_count__gt=0)))
+        self.assertEqual([seance.min_price for seance in cheap], sorted(seance.min_price for seance in cheap))
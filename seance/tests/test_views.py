@@ -1,11 +1,28 @@
 import datetime
-
+import shutil
+import tempfile
+from smtplib import SMTPRecipientsRefused
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.mail.backends import locmem
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
 from django.db.models import Q
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse_lazy
 from django.utils import timezone
 
-from seance.models import Seance, Hall, SeanceBase, AdvUser
+from cinema.settings import TICKET_EMAIL_CLAIM_TIMEOUT
+from seance.board import invalidate_board
+from seance.holds import get_hold_backend
+from seance.mailing import queue_ticket_emails, deliver_ticket_emails, claim_ticket_emails
+from seance.models import Seance, Hall, SeanceBase, AdvUser, Purchase, Ticket, Price, Basket
+from seance.sessions import get_basket_store, sign_value, CacheBasketStore
 from seance.tests.test_models import BaseInitial
 
 
@@ -45,6 +62,111 @@ class SeanceListViewTestCase(TestCase, BaseInitial):
 
         self.assertEqual(response.context['seance_list'][0].seance_base.film.title, 'James Bond')
 
+    def test_anonymous_browsing_without_session(self):
+        """Tests that browsing the board doesn't create session, date of the board is kept in signed cookie"""
+        response = self.client.get('/', data={'days': 1})
+        tomorrow = str(datetime.date.today() + datetime.timedelta(days=1))
+        self.assertTrue(response.cookies['seance_date'].value.startswith(f'{tomorrow}:'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse_lazy('seance:seance_detail', kwargs={'pk': self.seance_365_12.pk}))
+        self.assertEqual(response.context['seance_date'], tomorrow)
+        self.assertNotIn('seance_date', response.cookies)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse([query for query in queries if 'django_session' in query['sql']])
+        self.assertFalse(Session.objects.exists())
+
+        # forged cookie is ignored
+        self.client.cookies['seance_date'] = f'{tomorrow}:forged'
+        response = self.client.get(reverse_lazy('seance:seance_detail', kwargs={'pk': self.seance_365_12.pk}))
+        self.assertFalse(response.context.get('seance_date'))
+
+    def test_board_cache(self):
+        """Tests that board is rendered once and is rendered again after prices or films are changed"""
+        self.client.get('/', data={'days': 1, 'ordering': 'cheap'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/', data={'days': 1, 'ordering': 'cheap'})
+        self.assertFalse([query for query in queries if 'seance_seance' in query['sql']])
+        self.assertContains(response, 'Price from: 100')
+
+        Price.objects.filter(seance__seance_base=self.seance_base_bond).update(price=50)
+        Price.objects.filter(seance__seance_base=self.seance_base_bond).first().save()
+        response = self.client.get('/', data={'days': 1, 'ordering': 'cheap'})
+        self.assertContains(response, 'Price from: 50')
+
+        self.film_bond.title = 'No Time to Die'
+        self.film_bond.save()
+        response = self.client.get('/', data={'days': 1, 'ordering': 'cheap'})
+        self.assertContains(response, 'No Time to Die')
+
+    def test_api_board_cache(self):
+        """Tests that api board is cached by date and ordering and is invalidated by saving of seances"""
+        tomorrow = str(datetime.date.today() + datetime.timedelta(days=1))
+        response = self.client.get('/api/seance/', data={'date': tomorrow, 'ordering': 'latest'})
+        with CaptureQueriesContext(connection) as queries:
+            cached_response = self.client.get('/api/seance/', data={'date': tomorrow, 'ordering': 'latest'})
+        self.assertFalse([query for query in queries if 'seance_seance' in query['sql']])
+        self.assertEqual(cached_response.json(), response.json())
+        self.assertNotEqual(self.client.get('/api/seance/', data={'date': tomorrow}).json(), response.json())
+
+        self.seance_365_12.is_active = False
+        self.seance_365_12.save()
+        response = self.client.get('/api/seance/', data={'date': tomorrow, 'ordering': 'latest'})
+        self.assertEqual(len(response.json()), len(cached_response.json()) - 1)
+
+
+class BoardQueriesTestCase(TestCase, BaseInitial):
+
+    def setUp(self):
+        BaseInitial.__init__(self)
+        self.tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+
+    def add_seances(self, quantity):
+        """Adds active seances with prices for tomorrow"""
+        seance_base = SeanceBase.objects.create(film=self.film_terminator, hall=self.hall_red,
+                                                date_starts=self.tomorrow)
+        for number in range(quantity):
+            seance = Seance.objects.create(seance_base=seance_base, time_starts=datetime.time(number),
+                                           description='some text', admin=self.admin, is_active=True)
+            Price.objects.create(seance=seance, seat_category=self.seat_category_base, price=100 + number)
+
+    def count_queries(self, url, data=None):
+        # board is built from database, not taken from cache
+        invalidate_board()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data=data)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_queries_flat(self, url, data=None):
+        """Tests that number of queries of the page doesn't depend on number of seances on it"""
+        self.count_queries(url, data)
+        queries_before = self.count_queries(url, data)
+        self.add_seances(8)
+        self.assertEqual(self.count_queries(url, data), queries_before)
+
+    def test_board_queries(self):
+        self.assert_queries_flat('/', {'days': 1})
+        self.assert_queries_flat('/', {'days': 1, 'ordering': 'cheap'})
+
+    def test_api_board_queries(self):
+        self.assert_queries_flat('/api/seance/', {'date': str(self.tomorrow)})
+
+    def test_admin_seance_list_queries(self):
+        self.client.post('/accounts/login/', data={'username': self.admin.username, 'password': 'password1'})
+        self.assert_queries_flat(reverse_lazy('myadmin:seance_list'))
+
+    def test_purchase_list_queries(self):
+        """Tests that number of queries of user's tickets page doesn't depend on number of purchases"""
+        self.client.post('/accounts/login/', data={'username': self.user.username, 'password': 'password1234'})
+        self.count_queries(reverse_lazy('seance:my_tickets'))
+        queries_before = self.count_queries(reverse_lazy('seance:my_tickets'))
+        seats = self.hall_yellow.seats.all()
+        for number in range(3, 8):
+            purchase = Purchase.objects.create(user=self.user)
+            Ticket.objects.create(seance=self.seance_bond_12, purchase=purchase, seat=seats[number], price=100,
+                                  date_seance=self.tomorrow)
+        self.assertEqual(self.count_queries(reverse_lazy('seance:my_tickets')), queries_before)
+
 
 class AuthenticationTestCase(TestCase, BaseInitial):
 
@@ -222,7 +344,37 @@ class BasketViewTestCase(TestCase, BaseInitial):
 
         self.assertEqual(response.status_code, 200)
 
-        self.assertIsNotNone(response.context.get('basket'))
+        self.assertTrue(response.context.get('basket'))
+        self.assertEqual(response.context.get('last_seance'), str(self.seance_bond_night.pk))
+
+    def test_basket_store(self):
+        """Test that basket is read from shared cache and from table, when cache lost it"""
+        basket = {'1': {'seat_pk': '1', 'price': '120'}, '2': {'seat_pk': '2', 'price': '80.5'}}
+        with self.assertRaises(ImproperlyConfigured):
+            CacheBasketStore(cache_alias='default')
+
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        caches_settings = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                           'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                      'LOCATION': location}}
+        with override_settings(CACHES=caches_settings):
+            store = CacheBasketStore(cache_alias='shared')
+            store.set(self.user.pk, basket)
+            with self.assertNumQueries(0):
+                self.assertEqual(store.get(self.user.pk), basket)
+            self.assertEqual(Basket.objects.count(), 1)
+
+            store.cache.clear()
+            with self.assertNumQueries(1):
+                self.assertEqual(store.get(self.user.pk), basket)
+            with self.assertNumQueries(0):
+                self.assertEqual(store.get(self.user.pk), basket)
+
+            store.delete(self.user.pk)
+            with self.assertNumQueries(0):
+                self.assertIsNone(store.get(self.user.pk))
+            self.assertFalse(Basket.objects.exists())
 
 
 class SeanceDetailViewTestCase(TestCase, BaseInitial):
@@ -238,3 +390,140 @@ class SeanceDetailViewTestCase(TestCase, BaseInitial):
             response = self.client.get(reverse_lazy('seance:seance_detail', kwargs={'pk': self.seance_bond_12.pk}))
         self.assertEqual(response.status_code, 200)
 
+
+    def test_seats_taken(self):
+        """Test that seats map shows taken seats from layout and occupancy of the seance"""
+        self.client.cookies['seance_date'] = sign_value('seance_date', self.ticket1.date_seance)
+        response = self.client.get(reverse_lazy('seance:seance_detail', kwargs={'pk': self.seance_bond_night.pk}))
+        self.assertEqual(response.context['seats_taken'], {self.ticket1.seat_id, self.ticket2.seat_id})
+        self.assertEqual(response.context['hall_layout'], Hall.get_layout(self.hall_yellow.pk))
+        self.assertContains(response, 'background-color: red', count=2)
+
+
+class PurchaseCreateViewTestCase(TestCase, BaseInitial):
+
+    def setUp(self):
+        BaseInitial.__init__(self)
+        auth_data = {'username': self.user.username, 'password': 'password1234'}
+        self.client.post('/accounts/login/', data=auth_data)
+        self.seance_date = str(datetime.date.today() + datetime.timedelta(days=3))
+        self.seats = self.hall_yellow.seats.all()
+
+    def put_to_basket(self, seats):
+        get_basket_store().set(self.user.pk, {
+            str(seat.pk): {'seat_pk': str(seat.pk), 'seance_pk': str(self.seance_bond_night.pk),
+                           'seance_date': self.seance_date, 'price': '120'} for seat in seats})
+
+    def test_purchase(self):
+        """Test that tickets from basket are bought, money is debited from wallet and letter is queued"""
+        self.put_to_basket(self.seats[10:13])
+        response = self.client.post(reverse_lazy('seance:buy'))
+        self.assertRedirects(response, reverse_lazy('seance:my_tickets'), fetch_redirect_response=False)
+
+        purchase = Purchase.objects.filter(user=self.user).latest('created_at')
+        self.assertEqual(purchase.tickets.count(), 3)
+        self.assertEqual(AdvUser.objects.get(pk=self.user.pk).wallet, 10000 - 360)
+        self.assertEqual(purchase.email_status, Purchase.EMAIL_PENDING)
+        self.assertIsNone(get_basket_store().get(self.user.pk))
+
+    def test_purchase_of_sold_seat(self):
+        """Test that nothing is bought and wallet is untouched if one of the seats was already sold"""
+        self.put_to_basket([self.seats[10], self.ticket1.seat])
+        response = self.client.post(reverse_lazy('seance:buy'))
+        self.assertRedirects(response, reverse_lazy('seance:index'), fetch_redirect_response=False)
+
+        self.assertEqual(Purchase.objects.filter(user=self.user).count(), 1)
+        self.assertFalse(Ticket.objects.filter(seat=self.seats[10]).exists())
+        self.assertEqual(AdvUser.objects.get(pk=self.user.pk).wallet, 10000)
+        self.assertFalse(Purchase.objects.filter(email_status=Purchase.EMAIL_PENDING).exists())
+
+    def test_held_seat_is_not_put_to_basket(self):
+        """Test that seat, held by another user, can't be put to basket"""
+        seat = self.seats[10]
+        get_hold_backend().acquire(self.seance_bond_night.pk, self.seance_date, seat.pk, self.admin.pk)
+        data = {'seat_pk': seat.pk, 'row': seat.row, 'number': seat.number, 'seance': self.seance_bond_night.pk,
+                'seance_date': self.seance_date}
+        response = self.client.get(reverse_lazy('seance:basket-redirect'), data=data)
+        self.assertRedirects(response, reverse_lazy('seance:seance_detail', kwargs={'pk': self.seance_bond_night.pk}),
+                             fetch_redirect_response=False)
+        self.assertFalse(get_basket_store().get(self.user.pk))
+
+        self.client.cookies['seance_date'] = sign_value('seance_date', self.seance_date)
+        response = self.client.get(reverse_lazy('seance:seance_detail', kwargs={'pk': self.seance_bond_night.pk}))
+        self.assertEqual(response.context['seats_held'], {seat.pk})
+        self.assertContains(response, 'temporarily taken', count=1)
+
+
+class FailingEmailBackend(locmem.EmailBackend):
+    """Local memory backend, which fails to send letters to some addresses"""
+    failing = ('fail@somesite.com', )
+
+    def send_messages(self, messages):
+        if any(address in self.failing for message in messages for address in message.to):
+            raise SMTPRecipientsRefused({})
+        return super().send_messages(messages)
+
+
+class TicketEmailTestCase(TestCase, BaseInitial):
+
+    def setUp(self):
+        BaseInitial.__init__(self)
+        self.user.email = 'user@somesite.com'
+        self.user.save()
+        seats = self.hall_yellow.seats.all()
+        self.purchases = [self.purchase]
+        for number in range(3, 7):
+            purchase = Purchase.objects.create(user=self.user)
+            Ticket.objects.create(seance=self.seance_bond_12, purchase=purchase, seat=seats[number], price=100,
+                                  date_seance=datetime.date.today() + datetime.timedelta(days=1))
+            self.purchases.append(purchase)
+        queue_ticket_emails([purchase.pk for purchase in self.purchases])
+
+    def test_batches_over_one_connection(self):
+        """Test that pending letters are sent by batches over one connection and delivery state is saved"""
+        with patch('seance.mailing.get_connection', wraps=get_connection) as connections:
+            self.assertEqual(deliver_ticket_emails(batch_size=2), 5)
+        self.assertEqual(connections.call_count, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].to, ['user@somesite.com'])
+        self.assertIn(str(self.purchase.tickets.first().seat), mail.outbox[0].body)
+        self.assertFalse(Purchase.objects.exclude(email_status=Purchase.EMAIL_SENT).exists())
+        self.assertFalse(Purchase.objects.filter(emailed_at__isnull=True).exists())
+
+        # sent letters aren't sent again
+        self.assertEqual(deliver_ticket_emails(), 0)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_failed_letters_are_retried(self):
+        """Test that failed letter doesn't stop others and is retried by the next runs, till attempts are over"""
+        user = AdvUser.objects.create(username='failing_user', email='fail@somesite.com')
+        failing = Purchase.objects.create(user=user)
+        no_email = Purchase.objects.create(user=AdvUser.objects.create(username='user_without_email'))
+        queue_ticket_emails([failing.pk, no_email.pk])
+        connection = FailingEmailBackend()
+
+        self.assertEqual(deliver_ticket_emails(max_attempts=2, connection=connection), 5)
+        failing.refresh_from_db()
+        self.assertEqual((failing.email_status, failing.email_attempts), (Purchase.EMAIL_PENDING, 1))
+        self.assertEqual(Purchase.objects.get(pk=no_email.pk).email_status, Purchase.EMAIL_FAILED)
+
+        self.assertEqual(deliver_ticket_emails(max_attempts=2, connection=connection), 0)
+        failing.refresh_from_db()
+        self.assertEqual((failing.email_status, failing.email_attempts), (Purchase.EMAIL_FAILED, 2))
+        self.assertEqual(deliver_ticket_emails(max_attempts=2, connection=connection), 0)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_letters_of_crashed_worker_are_sent(self):
+        """Test that letters, left sending by crashed worker, are taken again after timeout, till attempts are over"""
+        self.assertEqual(claim_ticket_emails(batch_size=2), [purchase.pk for purchase in self.purchases[:2]])
+        # worker crashed, its letters aren't taken, while they may be still sending
+        self.assertEqual(deliver_ticket_emails(), 3)
+        self.assertEqual(Purchase.objects.filter(email_status=Purchase.EMAIL_SENDING).count(), 2)
+
+        Purchase.objects.filter(email_status=Purchase.EMAIL_SENDING).update(
+            email_claimed_at=timezone.now() - timezone.timedelta(seconds=TICKET_EMAIL_CLAIM_TIMEOUT + 1))
+        Purchase.objects.filter(pk=self.purchase.pk).update(email_attempts=3)
+        self.assertEqual(deliver_ticket_emails(max_attempts=3), 1)
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(Purchase.objects.get(pk=self.purchase.pk).email_status, Purchase.EMAIL_FAILED)
+        self.assertEqual(Purchase.objects.get(pk=self.purchases[1].pk).email_status, Purchase.EMAIL_SENT)
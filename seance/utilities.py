@@ -1,11 +1,15 @@
 import datetime
+import functools
 from os.path import splitext
 import re
 
 
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
 from django.forms import fields
 from django.forms import ValidationError
-from django.template.loader import render_to_string
+from django.template.loader import get_template
 from django.utils.encoding import smart_text
 
 from cinema.settings import ALLOWED_HOSTS
@@ -40,12 +44,30 @@ class HexColorField(fields.Field):
             return {'maxlength': str(7)}
 
 
-def send_tickets(user, purchase):
+def check_shared_cache(alias, setting):
+    """
+    Raises ImproperlyConfigured, if cache keeps values in memory of one process: other web processes and celery
+    workers wouldn't see its changes
+    """
+    if isinstance(caches[alias], LocMemCache):
+        raise ImproperlyConfigured(f'{setting} has to be a cache, shared by processes (e.g. redis or memcached), '
+                                   f'but \'{alias}\' is local memory cache')
+
+
+def get_site_host():
     if ALLOWED_HOSTS:
-        host = f'http://{ALLOWED_HOSTS[0]}'
-    else:
-        host = f'http://localhost:8000'
-    context = {'user': user, 'host': host, 'purchase': purchase}
-    subject = render_to_string('email/purchase_letter_subject.txt', context)
-    body_text = render_to_string('email/purchase_letter_body.txt', context)
-    user.email_user(subject, body_text)
+        return f'http://{ALLOWED_HOSTS[0]}'
+    return f'http://localhost:8000'
+
+
+@functools.lru_cache(maxsize=None)
+def get_tickets_letter_templates():
+    """Templates of letter with tickets, they are compiled once for the process"""
+    return get_template('email/purchase_letter_subject.txt'), get_template('email/purchase_letter_body.txt')
+
+
+def render_tickets_letter(user, purchase):
+    """Returns subject and text of letter with tickets of the purchase"""
+    subject_template, body_template = get_tickets_letter_templates()
+    context = {'user': user, 'host': get_site_host(), 'purchase': purchase}
+    return subject_template.render(context).strip(), body_template.render(context)
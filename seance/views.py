@@ -1,4 +1,5 @@
 import datetime
+import time
 
 from django.contrib import messages
 from django.contrib.auth import login
@@ -7,13 +8,19 @@ from django.contrib.auth.views import LoginView, LogoutView
 from django.db.models import Q
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.urls import reverse_lazy
 from django.utils import timezone, dateformat
+from django.utils.safestring import mark_safe
 from django.views.generic import ListView, CreateView, TemplateView, FormView, DetailView, RedirectView, View
 
-from seance.forms import RegistrationForm, OrderingForm, UserAuthenticationForm
-from seance.models import Seance, AdvUser, Hall, Seat, Purchase, Ticket, purchase_created
-from seance.task import send_tickets_with_celery
+from seance.board import get_cached_board, cache_board
+from seance.forms import RegistrationForm, OrderingForm, UserAuthenticationForm, ORDERING_CHOICES
+from seance.holds import get_hold_backend
+from seance.mailing import queue_ticket_emails
+from seance.models import Seance, AdvUser, Hall, Seat, Purchase
+from seance.purchases import create_purchase, PurchaseError, InsufficientFunds
+from seance.sessions import get_basket_store, get_signed_value, set_signed_value, basket_total
 
 
 class SeanceListView(ListView):
@@ -21,17 +28,22 @@ class SeanceListView(ListView):
     template_name = 'seance/index.html'
     context_object_name = 'seance_list'
 
+    def get(self, request, *args, **kwargs):
+        """Date of the board is remembered in signed cookie, so browsing the board doesn't create session"""
+        response = super().get(request, *args, **kwargs)
+        set_signed_value(request, response, 'seance_date', self.seance_date)
+        return response
+
     def get_queryset(self):
         # if user wants to watch seances for tomorrow 'days' will be in GET
 
         if self.request.GET.get('days', None):
             date = datetime.date.today() + datetime.timedelta(days=1)
-            self.request.session['seance_date'] = str(datetime.date.today() + datetime.timedelta(days=1))
         else:
             date = None
-            self.request.session['seance_date'] = str(datetime.date.today())
+        self.seance_date = str(date or datetime.date.today())
 
-        seances = Seance.get_active_seances_for_day(date)
+        seances = Seance.select_board_relations(Seance.get_active_seances_for_day(date))
 
         # if user selected type of ordering
         ordering_param = self.request.GET.get('ordering', None)
@@ -52,6 +64,16 @@ class SeanceListView(ListView):
         ordering_form = OrderingForm(initial={'ordering': ordering, 'days': days})
 
         context['ordering_form'] = ordering_form
+
+        # board is the same for all users, so it is rendered once for date, ordering and language
+        if ordering in dict(ORDERING_CHOICES):
+            board = get_cached_board('html', self.seance_date, ordering)
+            if board is None:
+                board = render_to_string('layout/base_seance_list.html', {'seance_list': context['seance_list']})
+                cache_board(board, 'html', self.seance_date, ordering)
+        else:
+            board = render_to_string('layout/base_seance_list.html', {'seance_list': context['seance_list']})
+        context['board'] = mark_safe(board)
         return context
 
 
@@ -61,11 +83,12 @@ class SeanceDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        seance_date = self.request.session.get('seance_date', None)
-        tickets = context.get('seance').tickets.filter(date_seance=seance_date)
-
-        seats_taken = [ticket.seat for ticket in tickets]
+        seance_date = get_signed_value(self.request, 'seance_date')
+        seats_taken = context.get('seance').get_seats_taken(seance_date) if seance_date else frozenset()
         context['seats_taken'] = seats_taken
+        context['seats_held'] = (set(get_hold_backend().held_seats(context.get('seance').pk, seance_date))
+                                 if seance_date else set())
+        context['hall_layout'] = Hall.get_layout(context.get('seance').seance_base.hall_id)
 
         return context
 
@@ -87,7 +110,7 @@ class UserLoginView(LoginView):
         Updates last_activity field in sessions
         """
         if not self.request.user.is_superuser:
-            self.request.session['last_activity'] = str(datetime.datetime.now())
+            self.request.session['last_activity'] = int(time.time())
         return super().form_valid(form)
 
 
@@ -107,10 +130,13 @@ class BasketRedirectView(LoginRequiredMixin, RedirectView):
     url = reverse_lazy('seance:basket')
 
     def dispatch(self, request, *args, **kwargs):
-        self.add_to_session(request)
-        return super(BasketRedirectView, self).dispatch(request, *args, **kwargs)
+        seance_pk = self.add_to_basket(request)
+        response = super(BasketRedirectView, self).dispatch(request, *args, **kwargs)
+        if seance_pk:
+            set_signed_value(request, response, 'last_seance', seance_pk)
+        return response
 
-    def inspect_double_chosen(self, request):
+    def inspect_double_chosen(self, request, basket):
         """
         Looks through the basket, and if dict with the same row, seat and seance is in it, messages user
         he can't book the same seat twice
@@ -120,7 +146,6 @@ class BasketRedirectView(LoginRequiredMixin, RedirectView):
         number = request.GET.get('number', None)
         seance_pk = request.GET.get('seance', None)
         seance_date = request.GET.get('seance_date', None)
-        basket = request.session.get('basket')
         if basket and seat_pk and seance_pk and seance_date and row and number:
             for key in basket:
                 if (basket[key]['seat_pk'] == seat_pk and
@@ -131,20 +156,28 @@ class BasketRedirectView(LoginRequiredMixin, RedirectView):
                     return None, None, None, None, None
         return seat_pk, seance_pk, seance_date, row, number
 
-    def add_to_session(self, request):
-        """Adds info about the ticket in the basket into sessions"""
-        seat_pk, seance_pk, seance_date, row, number = self.inspect_double_chosen(request)
+    def add_to_basket(self, request):
+        """Adds info about the ticket to the basket of the user, returns pk of seance, if ticket was added"""
+        if not request.user.is_authenticated:
+            return None
+        basket = get_basket_store().get(request.user.pk) or {}
+        seat_pk, seance_pk, seance_date, row, number = self.inspect_double_chosen(request, basket)
         if seat_pk and seance_pk and seance_date:
-            if not request.session.get('basket', None):
-                request.session['basket'] = {}
             seance = get_object_or_404(Seance, pk=seance_pk)
             seat = get_object_or_404(Seat, pk=seat_pk)
+
+            # seat is held for the user while it's in his basket
+            if not get_hold_backend().acquire(seance.pk, seance_date, seat.pk, request.user.pk):
+                messages.add_message(request, messages.INFO, 'This seat is temporarily held by another user')
+                self.url = reverse_lazy('seance:seance_detail', kwargs={'pk': seance_pk})
+                return None
+
             price = 0
             if seat and seance:
                 price = seance.prices.get(seat_category=seat.seat_category).price
 
             key = str(datetime.datetime.now().timestamp()).replace('.', '')
-            request.session['basket'][f'{key}'] = {
+            basket[f'{key}'] = {
                 'seat_pk': seat_pk,
                 'row': row,
                 'number': number,
@@ -155,17 +188,9 @@ class BasketRedirectView(LoginRequiredMixin, RedirectView):
                 'price': str(price),
                 'created': dateformat.format(timezone.now(), 'Y-m-d H:i:s')
             }
-            request.session['last_seance'] = seance_pk
-            request.session['total_price'] = self.get_total_price(request.session.get('basket'))
-            request.session.modified = True
-
-    @staticmethod
-    def get_total_price(basket):
-        """count total price of tickets in the basket"""
-        total_price = 0
-        for key in basket:
-            total_price += float(basket[key]['price'])
-        return total_price
+            get_basket_store().set(request.user.pk, basket)
+            return seance_pk
+        return None
 
 
 class BasketCancelView(LoginRequiredMixin, RedirectView):
@@ -173,10 +198,12 @@ class BasketCancelView(LoginRequiredMixin, RedirectView):
 
     def dispatch(self, request, *args, **kwargs):
         key = request.GET.get('seance_cancel', None)
-        pop_element = request.session.get('basket').pop(key, None)
-        total_price = float(request.session.get('total_price')) - float(pop_element.get('price'))
-        request.session['total_price'] = total_price
-        request.session.modified = True
+        basket = get_basket_store().get(request.user.pk) or {}
+        pop_element = basket.pop(key, None)
+        if pop_element:
+            get_hold_backend().release(pop_element.get('seance_pk'), pop_element.get('seance_date'),
+                                       [pop_element.get('seat_pk')], request.user.pk)
+            get_basket_store().set(request.user.pk, basket)
         return super(BasketCancelView, self).dispatch(request, *args, **kwargs)
 
 
@@ -184,53 +211,35 @@ class PurchaseCreateView(LoginRequiredMixin, RedirectView):
     url = reverse_lazy('seance:my_tickets')
 
     def post(self, request, *args, **kwargs):
+        basket = get_basket_store().get(request.user.pk)
         # if there are problems - don't create purchase
-        if not self.check_basket_and_total_price(request):
+        if not self.check_basket_and_total_price(request, basket):
             self.session_clean_and_redirect(request)
             return super().post(request, *args, **kwargs)
 
-        # get user object
-        user = get_object_or_404(AdvUser, pk=request.user.pk)
-        tickets = []
-        self.create_tickets_datalist(request, tickets, *args, **kwargs)
-        if tickets:
-            # last element is total_price
-            total_price = tickets.pop(len(tickets) - 1)
-            if user.wallet - total_price >= 0:
-                user.wallet -= total_price
-                user.save()
-                purchase = Purchase.objects.create(user=user)
-                for ticket in tickets:
-                    Ticket.objects.create(seance=ticket.get('seance'),
-                                          date_seance=ticket.get('date_seance'),
-                                          seat=ticket.get('seat'),
-                                          purchase=purchase,
-                                          price=ticket.get('price')
-                                          )
-                send_tickets_with_celery.delay(user.pk, purchase.pk)
-                self.session_clean_and_redirect(request, change_url=False)
-                return super().post(request, *args, **kwargs)
+        try:
+            purchase = create_purchase(request.user.pk, [basket[key] for key in basket if key != 'added'])
+        except InsufficientFunds:
             messages.add_message(request, messages.INFO, 'Insufficient funds')
+        except PurchaseError as error:
+            messages.add_message(request, messages.ERROR, error.detail)
+        else:
+            queue_ticket_emails([purchase.pk])
+            self.session_clean_and_redirect(request, change_url=False)
+            return super().post(request, *args, **kwargs)
         self.session_clean_and_redirect(request)
         return super().post(request, *args, **kwargs)
 
-    def create_purchase_and_tickets(self):
-        """Creates purchase and tickets in it"""
-        pass
-
     def session_clean_and_redirect(self, request, change_url=True):
-        """Removes all custom data from session"""
+        """Empties basket of the user"""
         if change_url:
             self.url = reverse_lazy('seance:index')
-        request.session.pop('basket', None)
-        request.session.pop('last_seance', None)
-        request.session.pop('total_price', None)
+        get_basket_store().delete(request.user.pk)
 
     @staticmethod
-    def check_basket_and_total_price(request):
+    def check_basket_and_total_price(request, basket):
         """Checks if user has tickets in basket and enough money for them"""
-        basket = request.session.get('basket', None)
-        total_price = request.session.get('total_price', None)
+        total_price = basket_total(basket)
         if not basket:
             return False
         if total_price:
@@ -239,54 +248,16 @@ class PurchaseCreateView(LoginRequiredMixin, RedirectView):
                 return False
         return True
 
-    @staticmethod
-    def create_tickets_datalist(request, tickets, *args, **kwargs):
-        """
-        Creates list with data for creating tickets.
-        We will create tickets only if initial data for all of them is OK
-        If not - clean basket and ask user to full it once again
-        List of initial data for tickets is saved in argument tickets, which is the same list() -
-        tickets in main post()
-
-        Also check that tickets with the same data don't exist
-        Last element in tickets[], if its not empty, we push total_price
-        """
-        basket = request.session.get('basket', None)
-        total_price = 0
-        for key in basket:
-            seat = get_object_or_404(Seat, pk=basket[key].get('seat_pk'))
-            seance = get_object_or_404(Seance, pk=basket[key].get('seance_pk'))
-            seance_date = basket[key].get('seance_date', None)
-
-            price = seance.prices.get(seat_category=seat.seat_category).price
-            total_price += price
-
-            # if ticket already exists or there problems with init. data - don't create purchase
-            if (not seat or not seance or not seance_date or
-                    Ticket.objects.filter(seance=seance, seat=seat, date_seance=seance_date)):
-                messages.add_message(request, messages.ERROR, 'Error occurred, please try once again')
-                tickets = []
-                break
-            else:
-                tickets.append({
-                    'seance': seance,
-                    'date_seance': seance_date,
-                    'seat': seat,
-                    'price': price
-                })
-        if tickets:
-            tickets.append(total_price)
-
 
 class PurchaseListView(LoginRequiredMixin, ListView):
     model = Purchase
 
     def get_queryset(self):
-        return Purchase.objects.filter(user_id=self.request.user.pk)
+        return Purchase.objects.filter(user_id=self.request.user.pk).with_tickets()
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
-        context['money_spent'] = self.request.user.sum_money_spent
+        context['money_spent'] = self.request.user.money_spent
         return context
 
 